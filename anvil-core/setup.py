@@ -14,7 +14,8 @@ setup(
     long_description=long_description,
     long_description_content_type="text/markdown",
     url="https://github.com/yourusername/code-periodic-table",
-    packages=find_packages(where="src"),
+    # Benchmarks are development tools, run from a checkout; they are not installed
+    packages=find_packages(where="src", exclude=["benchmarks", "benchmarks.*"]),
     package_dir={"": "src"},
     classifiers=[
         "Development Status :: 3 - Alpha",
@@ -36,6 +37,9 @@ setup(
         # - click: When we build the CLI interface
     ],
     extras_require={
+        "numpy": [
+            "numpy>=1.20.0",  # Vectorized fingerprint similarity
+        ],
         "dev": [
             "pytest>=7.0.0",
             "pytest-cov>=3.0.0",
@@ -9,9 +9,27 @@ See PROJECT_STATUS.md for the actual state of the project.
 __version__ = "0.1.0"
 
 # Make key components easily importable
-from .fingerprinting import CodeFingerprint
+from .fingerprinting import (
+    CodeFingerprint,
+    DefinitionFingerprint,
+    FingerprintResult,
+    IncrementalState,
+    TextEdit
+)
+from .index import FingerprintIndex
+from .cache import FingerprintCache
+from .ast_cache import ASTCache
+from .storage import FingerprintArray
+from .winnowing import WinnowIndex
+from .clustering import CloneClusterer
 from .parsers import get_parser
-from .git import GitAnalyzer
+from .patterns import PatternSet, PatternSpec
+from .repository import parse_repository
+from .scanner import ScanStats, scan_files
+from .symbols import SymbolIndex
+from .git import GitAnalyzer, GitError, GitTimeoutError
+from .git_async import AsyncGitAnalyzer
+from .git_index import CommitIndex
 from .models import (
     CodeBlock,
     Documentation,
@@ -23,8 +41,28 @@ from .models import (
 
 __all__ = [
     'CodeFingerprint',
+    'FingerprintResult',
+    'DefinitionFingerprint',
+    'IncrementalState',
+    'TextEdit',
+    'FingerprintIndex',
+    'FingerprintCache',
+    'ASTCache',
+    'FingerprintArray',
+    'WinnowIndex',
+    'CloneClusterer',
     'get_parser',
+    'PatternSet',
+    'PatternSpec',
+    'parse_repository',
+    'scan_files',
+    'ScanStats',
+    'SymbolIndex',
     'GitAnalyzer',
+    'AsyncGitAnalyzer',
+    'GitError',
+    'GitTimeoutError',
+    'CommitIndex',
     'CodeBlock',
     'Documentation',
     'GitCommit',
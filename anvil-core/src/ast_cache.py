@@ -0,0 +1,138 @@
+"""
+Process-wide cache of parsed Python ASTs keyed by content hash
+"""
+
+import ast
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple, Union
+
+
+class ASTCache:
+    """
+    Size-bounded LRU cache of ``ast.parse`` results
+
+    PythonParser, CodeFingerprint and CrossLanguageFingerprint all parse the
+    same sources; sharing one cache means a file is parsed once per process
+    however many of them look at it. Entries are keyed by a hash of the
+    source text, so the same content under different names is shared too.
+    Syntax errors are cached as well and raised again on every lookup.
+
+    Trees handed out by get() are shared and must be treated as read-only.
+    Callers that need to modify a tree pass ``copy=True`` and get a private
+    one: the source is parsed once (faster than ``copy.deepcopy`` on a
+    cached tree) and the result is not stored, so such calls count as
+    neither hits nor misses.
+
+    The bound is on the total size of the cached sources, a proxy for tree
+    size (a tree takes roughly 10-20 times the memory of its source), and
+    on the number of entries. All methods are thread-safe.
+    """
+
+    def __init__(self, max_entries: int = 256, max_source_bytes: int = 8_000_000):
+        self.max_entries = max_entries
+        self.max_source_bytes = max_source_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: 'OrderedDict[bytes, Tuple[Union[ast.AST, SyntaxError], int]]' = OrderedDict()
+        self._source_bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def source_bytes(self) -> int:
+        """Total size of the sources whose trees are cached"""
+        return self._source_bytes
+
+    def get(self, code: str, copy: bool = False) -> ast.Module:
+        """
+        Parse code, reusing the tree from an earlier call with the same source
+
+        Args:
+            code: Python source
+            copy: Return a private tree the caller may modify, parsed
+                without consulting or filling the cache
+
+        Returns:
+            Module node
+
+        Raises:
+            SyntaxError: If the code cannot be parsed
+        """
+        if copy:
+            return ast.parse(code)
+
+        key = self._key(code)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if entry is None:
+            entry = self._parse(code)
+            self._store(key, entry)
+
+        tree = entry[0]
+        if isinstance(tree, SyntaxError):
+            raise _copy_error(tree)
+        return tree
+
+    def clear(self):
+        """Drop every cached tree (statistics are kept)"""
+        with self._lock:
+            self._entries.clear()
+            self._source_bytes = 0
+
+    def _key(self, code: str) -> bytes:
+        return hashlib.blake2b(code.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+    def _parse(self, code: str) -> Tuple[Union[ast.AST, SyntaxError], int]:
+        try:
+            tree = ast.parse(code)
+        except SyntaxError as e:
+            tree = _copy_error(e)
+        return tree, len(code)
+
+    def _store(self, key: bytes, entry: Tuple[Union[ast.AST, SyntaxError], int]):
+        size = entry[1]
+        if size > self.max_source_bytes:
+            return  # Would evict everything else for one file
+
+        with self._lock:
+            if key in self._entries:
+                # Another thread parsed the same source meanwhile
+                return
+            self._entries[key] = entry
+            self._source_bytes += size
+            while (len(self._entries) > self.max_entries
+                   or self._source_bytes > self.max_source_bytes):
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._source_bytes -= evicted
+                self.evictions += 1
+
+
+def _copy_error(error: SyntaxError) -> SyntaxError:
+    """A fresh exception, so cached errors do not accumulate tracebacks"""
+    copied = type(error)(*error.args)
+    return copied
+
+
+_shared_cache: Optional[ASTCache] = None
+_shared_lock = threading.Lock()
+
+
+def shared_ast_cache() -> ASTCache:
+    """The process-wide cache used when no other is configured"""
+    global _shared_cache
+    if _shared_cache is None:
+        with _shared_lock:
+            if _shared_cache is None:
+                _shared_cache = ASTCache()
+    return _shared_cache
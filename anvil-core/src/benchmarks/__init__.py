@@ -0,0 +1,7 @@
+"""
+Benchmarks for anvil-core (see PERFORMANCE_BENCHMARKS.md)
+
+Run a module from the anvil-core directory of a checkout, e.g.
+``python -m src.benchmarks.pattern_matching``. The benchmarks are not
+installed with the package.
+"""
@@ -0,0 +1,97 @@
+"""
+AnalysisDaemon: request latency against a warm daemon vs a cold process
+
+Usage:
+    python -m src.benchmarks.daemon --requests 2000
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from ..daemon import AnalysisDaemon, DaemonClient
+from ..fingerprinting import FingerprintOptions
+from .parsing import flat_module
+
+
+def _start(daemon: AnalysisDaemon) -> threading.Thread:
+    thread = threading.Thread(target=asyncio.run, args=(daemon.serve(),), daemon=True)
+    thread.start()
+    for _ in range(500):
+        if os.path.exists(daemon.socket_path):
+            return thread
+        time.sleep(0.01)
+    raise RuntimeError("Daemon did not start")
+
+
+def _report(name: str, timings):
+    timings = sorted(timings)
+    p50 = timings[len(timings) // 2] * 1000
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000
+    print(f"{name:<16} p50 {p50:7.3f} ms   p99 {p99:7.3f} ms   "
+          f"mean {statistics.mean(timings) * 1000:7.3f} ms")
+
+
+def cold_call(code_path: str) -> float:
+    """Seconds for a fresh interpreter to import the package and fingerprint one file"""
+    package = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    script = (f"import sys; sys.path.insert(0, {os.path.dirname(package)!r}); "
+              f"from {os.path.basename(package)}.fingerprinting import CodeFingerprint; "
+              f"CodeFingerprint().generate_file({code_path!r})")
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', script], check=True)
+    return time.perf_counter() - start
+
+
+def run(requests: int, lines: int):
+    code = flat_module(lines)
+    variants = [code.replace('Service', f'Service{i}_') for i in range(50)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        daemon = AnalysisDaemon(os.path.join(tmp, 'anvil.sock'),
+                                FingerprintOptions(mode='simhash'))
+        daemon.warm_up()
+        _start(daemon)
+
+        with DaemonClient(daemon.socket_path) as client:
+            for i, variant in enumerate(variants):
+                client.add(f"variant{i}", variant)
+
+            for name, call in [
+                ('ping', lambda i: client.ping()),
+                ('fingerprint', lambda i: client.fingerprint(variants[i % len(variants)])),
+                ('summarize', lambda i: client.summarize(variants[i % len(variants)])),
+                ('find_similar', lambda i: client.find_similar(variants[i % len(variants)],
+                                                               threshold=0.9)),
+            ]:
+                timings = []
+                for i in range(requests):
+                    start = time.perf_counter()
+                    call(i)
+                    timings.append(time.perf_counter() - start)
+                _report(name, timings)
+
+        path = os.path.join(tmp, 'sample.py')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(code)
+        cold = [cold_call(path) for _ in range(3)]
+        print(f"{'cold process':<16} {min(cold) * 1000:.1f} ms "
+              f"({code.count(chr(10))}-line file)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--lines', type=int, default=60)
+    args = parser.parse_args()
+    run(args.requests, args.lines)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+"""
+Python fingerprinting: ast.dump + NodeTransformer vs the streaming hasher,
+and per-definition fingerprints by hash version
+
+Every run checks that fingerprint_definitions() agrees with generate() on
+each definition's dedented source; --check does the same for every Python
+file under a directory (the standard library, say).
+
+Usage:
+    python -m src.benchmarks.fingerprinting --lines 5000
+    python -m src.benchmarks.fingerprinting --check /usr/lib/python3.11
+"""
+
+import argparse
+import ast
+import hashlib
+import statistics
+import textwrap
+import time
+import tracemalloc
+from dataclasses import replace
+from typing import Callable, Tuple
+
+from ..fingerprinting import CodeFingerprint, FingerprintOptions, _AstHasher
+from ..scanner import read_source, scan_files
+
+
+def _legacy_hash(tree: ast.AST, options: FingerprintOptions) -> str:
+    """The original implementation: mutate the tree, dump it, hash the dump"""
+
+    class Normalizer(ast.NodeTransformer):
+        def __init__(self):
+            self.var_mapping = {}
+
+        def visit_Name(self, node):
+            if options.ignore_variable_names:
+                if node.id not in self.var_mapping:
+                    self.var_mapping[node.id] = f"var_{len(self.var_mapping)}"
+                node.id = self.var_mapping[node.id]
+            return node
+
+        def visit_Constant(self, node):
+            if options.ignore_string_literals and isinstance(node.value, str):
+                node.value = "STRING"
+            return node
+
+    if options.normalize_syntax:
+        tree = Normalizer().visit(tree)
+    return hashlib.sha256(ast.dump(tree).encode('utf-8')).hexdigest()[:16]
+
+
+def generated_module(lines: int) -> str:
+    """Synthetic module resembling generated code, about `lines` lines long"""
+    parts = []
+    i = 0
+    while sum(part.count('\n') for part in parts) < lines:
+        parts.append(
+            f"def handler_{i}(request, context=None):\n"
+            f"    \"\"\"Generated handler {i}\"\"\"\n"
+            f"    payload = request.get('field_{i}', {{}})\n"
+            f"    if payload and context is not None:\n"
+            f"        for key, value in payload.items():\n"
+            f"            context[key] = value * {i} + len(str(key))\n"
+            f"    return {{'status': 'ok', 'id': {i}, 'size': len(payload)}}\n\n"
+        )
+        i += 1
+    return ''.join(parts)
+
+
+def nested_module(depth: int, copies: int = 4) -> str:
+    """Classes nested `depth` deep, each with a multi-line docstring and a method"""
+    parts = []
+    for copy in range(copies):
+        indent = ''
+        for level in range(depth):
+            parts.append(
+                f"{indent}class Level{copy}_{level}:\n"
+                f"{indent}    \"\"\"Level {level}\n\n"
+                f"{indent}    Spans lines, so dedenting changes it.\n"
+                f"{indent}    \"\"\"\n"
+                f"{indent}    def method(self, items):\n"
+                f"{indent}        return [item * {level} for item in items]\n"
+            )
+            indent += '    '
+    return ''.join(parts)
+
+
+def check_definitions(code: str, options: FingerprintOptions) -> Tuple[int, int]:
+    """
+    Compare fingerprint_definitions() with generate() on each definition's
+    lines, decorators included, dedented by textwrap.dedent()
+
+    Returns:
+        Definitions compared, and those skipped because their dedented
+        source does not parse (a string line less indented than the
+        definition keeps dedent from removing its indentation)
+    """
+    fingerprinter = CodeFingerprint(options)
+    lines = code.splitlines(keepends=True)
+    compared = skipped = 0
+    for definition in fingerprinter.fingerprint_definitions(code):
+        location = definition.location
+        source = textwrap.dedent(''.join(lines[location.start_line - 1:location.end_line]))
+        try:
+            ast.parse(source)
+        except SyntaxError:
+            skipped += 1
+            continue
+        assert fingerprinter.generate(source) == definition.fingerprint, \
+            f"{definition.qualified_name} (line {location.start_line})"
+        compared += 1
+    return compared, skipped
+
+
+_CHECKED_OPTIONS = [FingerprintOptions(ast_hash_version=version) for version in (1, 2, 3)] + [
+    FingerprintOptions(ignore_variable_names=True),
+    FingerprintOptions(mode='simhash'),
+]
+
+
+def check_tree(root: str):
+    """Run check_definitions() on every Python file under root"""
+    for options in _CHECKED_OPTIONS:
+        compared = skipped = 0
+        for source in scan_files(root, ['python']):
+            try:
+                code = read_source(source.path)
+                ast.parse(code)
+            except (OSError, SyntaxError, UnicodeDecodeError, ValueError):
+                continue
+            checked = check_definitions(code, options)
+            compared += checked[0]
+            skipped += checked[1]
+        label = f"version {options.ast_hash_version} {options.mode}" + \
+            (", names ignored" if options.ignore_variable_names else "")
+        print(f"{label:<32} {compared} definitions match generate() "
+              f"({skipped} not dedentable)")
+
+
+def _measure(label: str, code: str, func: Callable[[ast.AST], str], repeat: int):
+    """Time and trace func on a fresh tree (parsing is not measured)"""
+    timings = []
+    for _ in range(repeat):
+        tree = ast.parse(code)
+        start = time.perf_counter()
+        func(tree)
+        timings.append(time.perf_counter() - start)
+
+    tree = ast.parse(code)
+    tracemalloc.start()
+    func(tree)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{label:<28} best {min(timings) * 1000:8.2f}ms "
+          f"median {statistics.median(timings) * 1000:8.2f}ms | "
+          f"peak allocation {peak / 1024 / 1024:7.2f}MB")
+
+
+def run(lines: int, repeat: int = 5, ignore_variable_names: bool = True):
+    """Benchmark one module size and print timings"""
+    code = generated_module(lines)
+    options = FingerprintOptions(ignore_variable_names=ignore_variable_names,
+                                 ast_hash_version=1)
+    compact = replace(options, ast_hash_version=2)
+    merkle = replace(options, ast_hash_version=3)
+
+    legacy = _legacy_hash(ast.parse(code), options)
+    assert _AstHasher(options).hash_tree(ast.parse(code)) == legacy
+
+    start = time.perf_counter()
+    ast.parse(code)
+    parse = time.perf_counter() - start
+
+    print(f"{len(code.splitlines())} lines, {len(code) / 1024:.0f}KB, "
+          f"ast.parse {parse * 1000:.2f}ms (excluded below)")
+    _measure('legacy dump + transformer', code, lambda t: _legacy_hash(t, options), repeat)
+    _measure('streaming (version 1)', code, lambda t: _AstHasher(options).hash_tree(t), repeat)
+    _measure('streaming (version 2)', code, lambda t: _AstHasher(compact).hash_tree(t), repeat)
+    _measure('bottom-up (version 3)', code,
+             lambda t: _AstHasher(merkle, source=code).hash_tree(t), repeat)
+
+    nested = nested_module(depth=40)
+    for checked in _CHECKED_OPTIONS:
+        check_definitions(nested, checked)
+    print(f"\nfingerprint_definitions(), {nested.count('class ')} classes nested 40 deep "
+          f"(checked against generate())")
+    for version in (1, 2, 3):
+        versioned = replace(options, ast_hash_version=version)
+        _measure(f'definitions (version {version})', nested,
+                 lambda t: _AstHasher(versioned, source=nested).collect_definitions(t), repeat)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--lines', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--check', metavar='DIR',
+                        help="Only check definitions against generate() under DIR")
+    args = parser.parse_args()
+
+    if args.check:
+        check_tree(args.check)
+    else:
+        run(args.lines, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""
+GitAnalyzer: git processes spawned and wall time for diffs of large commits
+
+Compares the old per-file ``git show`` calls with get_diff()/get_diffs(),
+which read everything from one streamed ``git log -p --numstat``, times
+history queries with and without a CommitIndex, and runs per-commit diffs
+concurrently through AsyncGitAnalyzer.
+
+Usage:
+    python -m src.benchmarks.git_ops --files 300 --commits 20
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import tempfile
+import time
+from typing import List
+
+from ..git import GitAnalyzer, GitDiff
+from ..git_async import AsyncGitAnalyzer
+from ..git_index import CommitIndex
+
+
+class CountingAnalyzer(GitAnalyzer):
+    """GitAnalyzer that counts the git processes it starts"""
+
+    def __init__(self, repo_path: str):
+        super().__init__(repo_path)
+        self.processes = 0
+
+    def _run_git_command(self, args):
+        self.processes += 1
+        return super()._run_git_command(args)
+
+    def _stream_git_command(self, args, input=None, separator='\n'):
+        self.processes += 1
+        return super()._stream_git_command(args, input, separator)
+
+
+def per_file_diff(analyzer: GitAnalyzer, commit_hash: str) -> List[GitDiff]:
+    """The previous get_diff(): --numstat, then one git show per file for its hunks"""
+    diffs = []
+    output = analyzer._run_git_command(['show', '--format=', '--numstat', commit_hash])
+    for line in output.strip().split('\n'):
+        parts = line.split('\t')
+        if len(parts) < 3:
+            continue
+        patch = analyzer._run_git_command(['show', commit_hash, '--', parts[2]])
+        hunks = []
+        for hunk_line in patch.split('\n'):
+            if hunk_line.startswith('@@'):
+                hunks.append([hunk_line])
+            elif hunks:
+                hunks[-1].append(hunk_line)
+        diffs.append(GitDiff(parts[2], int(parts[0]) if parts[0] != '-' else 0,
+                             int(parts[1]) if parts[1] != '-' else 0,
+                             ['\n'.join(h).rstrip('\n') for h in hunks]))
+    return diffs
+
+
+def make_repository(root: str, files: int, commits: int):
+    """A repository whose every commit edits all of `files` files in two places"""
+    def git(*args):
+        subprocess.run(['git', '-C', root] + list(args), check=True, capture_output=True)
+
+    git('init', '-q')
+    git('config', 'user.email', 'bench@example.com')
+    git('config', 'user.name', 'bench')
+    for c in range(commits + 1):
+        for i in range(files):
+            lines = [f"line {n}" for n in range(200)]
+            lines[10] = f"edit {c} top"
+            lines[150] = f"edit {c} bottom"
+            with open(os.path.join(root, f"module_{i:04d}.py"), 'w') as f:
+                f.write('\n'.join(lines) + '\n')
+        git('add', '-A')
+        git('commit', '-q', '-m', f"commit {c}")
+
+
+def _measure(name: str, analyzer: CountingAnalyzer, func):
+    analyzer.processes = 0
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<28} {analyzer.processes:6d} processes {elapsed * 1000:10.1f} ms")
+    return result
+
+
+def run(files: int, commits: int, concurrency: int):
+    with tempfile.TemporaryDirectory() as root:
+        make_repository(root, files, commits)
+        analyzer = CountingAnalyzer(root)
+        hashes = [c['hash'] for c in analyzer.get_commits(max_count=commits)]
+
+        print(f"One commit touching {files} files:")
+        old = _measure('  per-file git show', analyzer, lambda: per_file_diff(analyzer, hashes[0]))
+        new = _measure('  get_diff', analyzer, lambda: analyzer.get_diff(hashes[0]))
+        assert [(d.file, d.additions, d.deletions, d.hunks) for d in old] == \
+            [(d.file, d.additions, d.deletions, d.hunks) for d in new]
+
+        print(f"{commits} such commits:")
+        _measure('  per-file git show', analyzer,
+                 lambda: [per_file_diff(analyzer, h) for h in hashes])
+        _measure('  get_diff per commit', analyzer,
+                 lambda: [analyzer.get_diff(h) for h in hashes])
+        _measure('  get_diffs', analyzer, lambda: analyzer.get_diffs(hashes))
+
+        print("Repeated changes over the history:")
+        _measure('  find_repeated_changes', analyzer,
+                 lambda: analyzer.find_repeated_changes(max_count=commits))
+
+        print("With a CommitIndex:")
+        index = CommitIndex(root, os.path.join(root, 'index.sqlite'))
+        start = time.perf_counter()
+        index.update()
+        print(f"{'  initial update':<28} {(time.perf_counter() - start) * 1000:27.1f} ms")
+        indexed = CountingAnalyzer(root)
+        indexed.commit_index = index
+        index._git = indexed  # Count the head check too
+        _measure('  get_commits', indexed, indexed.get_commits)
+        _measure('  find_repeated_changes', indexed, indexed.find_repeated_changes)
+
+        print(f"get_diff per commit, concurrently (max_concurrency={concurrency}):")
+        async_analyzer = AsyncGitAnalyzer(root, max_concurrency=concurrency)
+
+        async def concurrent_diffs():
+            return await asyncio.gather(*[async_analyzer.get_diff(h) for h in hashes])
+
+        start = time.perf_counter()
+        diffs = asyncio.run(concurrent_diffs())
+        print(f"{'  AsyncGitAnalyzer':<28} {len(hashes):6d} processes "
+              f"{(time.perf_counter() - start) * 1000:10.1f} ms")
+        assert diffs == [analyzer.get_diff(h) for h in hashes]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--files', type=int, default=300)
+    parser.add_argument('--commits', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=4)
+    args = parser.parse_args()
+    run(args.files, args.commits, args.concurrency)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""
+PythonParser: one walk per question vs the single-pass summarize()
+
+Also times PatternSet.find() as the number of patterns grows.
+
+Usage:
+    python -m src.benchmarks.parsing --lines 20000 --depth 40
+"""
+
+import argparse
+import ast
+import statistics
+import time
+from typing import Callable
+
+from ..parsers import PythonParser, SUMMARY_PATTERNS
+from ..patterns import Node, PatternSet, PatternSpec
+
+
+def flat_module(lines: int) -> str:
+    """Many small classes and functions, about `lines` lines long"""
+    parts = []
+    i = 0
+    while sum(part.count('\n') for part in parts) < lines:
+        parts.append(
+            f"class Service{i}(Base, mixins.Logged):\n"
+            f"    \"\"\"Generated service {i}\"\"\"\n"
+            f"    def handle(self, request, context=None):\n"
+            f"        if request is None or context is None:\n"
+            f"            return None\n"
+            f"        try:\n"
+            f"            for key in request:\n"
+            f"                if key and key.startswith('x_{i}'):\n"
+            f"                    context[key] = request[key]\n"
+            f"        except KeyError:\n"
+            f"            pass\n"
+            f"        return context\n\n"
+            f"def helper_{i}(value):\n"
+            f"    while value is not None and value > {i}:\n"
+            f"        value = value // 2\n"
+            f"    return value\n\n"
+        )
+        i += 1
+    return ''.join(parts)
+
+
+def nested_module(depth: int, repeat: int = 20) -> str:
+    """Functions nested `depth` deep, each with its own branches"""
+    parts = []
+    for n in range(repeat):
+        lines = []
+        for level in range(depth):
+            pad = '    ' * level
+            lines.append(f"{pad}def level_{n}_{level}(a, b):")
+            lines.append(f"{pad}    if a and b or a is None:")
+            lines.append(f"{pad}        a = b")
+        lines.append('    ' * depth + 'return a')
+        parts.append('\n'.join(lines) + '\n\n')
+    return ''.join(parts)
+
+
+def _separate(parser: PythonParser, tree: ast.AST):
+    """The method-by-method path"""
+    return (parser.extract_functions(tree), parser.extract_classes(tree),
+            parser.get_complexity(tree),
+            {name: parser.find_patterns(tree, name) for name in SUMMARY_PATTERNS})
+
+
+def _check(parser: PythonParser, tree: ast.AST):
+    """The summary must agree with the separate methods"""
+    functions, classes, complexity, patterns = _separate(parser, tree)
+    summary = parser.summarize(tree)
+
+    assert summary.complexity == complexity
+    by_node = {(f.start_line, f.name): f.complexity for f in functions}
+    synchronous = [f for f in summary.functions if not f.is_async]
+    assert {(f.start_line, f.name): f.complexity for f in synchronous} == by_node
+    assert [(c.name, c.start_line, c.base_classes) for c in summary.classes] == \
+        sorted([(c.name, c.start_line, c.base_classes) for c in classes], key=lambda c: c[1])
+    for name in SUMMARY_PATTERNS:
+        assert sorted(map(id, summary.patterns[name])) == sorted(map(id, patterns[name]))
+
+
+def _measure(label: str, func: Callable[[], object], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    print(f"  {label:<22} best {min(timings) * 1000:9.2f}ms "
+          f"median {statistics.median(timings) * 1000:9.2f}ms")
+    return min(timings)
+
+
+def run_case(name: str, code: str, repeat: int = 5):
+    """Benchmark one source and print timings (parsing is not measured)"""
+    parser = PythonParser()
+    tree = ast.parse(code)
+    _check(parser, tree)
+
+    print(f"{name}: {len(code.splitlines())} lines, {len(code) / 1024:.0f}KB")
+    separate = _measure('separate methods', lambda: _separate(parser, tree), repeat)
+    single = _measure('summarize()', lambda: parser.summarize(tree), repeat)
+    print(f"  speedup {separate / single:.1f}x")
+
+
+def synthetic_patterns(count: int):
+    """`count` distinct call and attribute patterns, like a team rule set"""
+    specs = []
+    for i in range(count):
+        if i % 2:
+            specs.append(PatternSpec(f'call_{i}', ast.Call,
+                                     {'func': Node(ast.Name, id=f'helper_{i}')}))
+        else:
+            specs.append(PatternSpec(f'attribute_{i}', ast.Attribute,
+                                     {'attr': f'method_{i}', 'value': Node(ast.Name)}))
+    return specs
+
+
+def run_patterns(code: str, counts=(1, 10, 50), repeat: int = 5):
+    """Time one PatternSet traversal against one walk per pattern"""
+    tree = ast.parse(code)
+    print(f"patterns: {len(code.splitlines())} lines")
+    for count in counts:
+        specs = synthetic_patterns(count)
+        compiled = PatternSet(specs)
+        separate = [PatternSet([spec]) for spec in specs]
+        one_pass = _measure(f'{count} patterns, 1 pass', lambda: compiled.find(tree), repeat)
+        per_pattern = _measure(f'{count} patterns, {count} passes',
+                               lambda: [p.find(tree) for p in separate], repeat)
+        print(f"  speedup {per_pattern / one_pass:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--lines', type=int, default=20000)
+    parser.add_argument('--depth', type=int, default=40)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    run_case('flat', flat_module(args.lines), args.repeat)
+    run_case(f'nested (depth {args.depth})', nested_module(args.depth), args.repeat)
+    run_patterns(flat_module(args.lines // 4), repeat=args.repeat)
+
+
+if __name__ == '__main__':
+    main()
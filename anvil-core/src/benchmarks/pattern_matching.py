@@ -0,0 +1,75 @@
+"""
+Fuzzy fingerprint matching: linear find_similar vs FingerprintIndex
+
+Usage:
+    python -m src.benchmarks.pattern_matching --sizes 10000,1000000,10000000
+"""
+
+import argparse
+import random
+import time
+from typing import List
+
+from ..fingerprinting import CodeFingerprint
+from ..index import FingerprintIndex, HEX_ALPHABET
+
+
+def _random_fingerprints(count: int, rng: random.Random) -> List[str]:
+    return ['%016x' % rng.getrandbits(64) for _ in range(count)]
+
+
+def _mutate(fp: str, positions: int, rng: random.Random) -> str:
+    chars = list(fp)
+    for p in rng.sample(range(len(chars)), positions):
+        chars[p] = rng.choice([c for c in HEX_ALPHABET if c != chars[p]])
+    return ''.join(chars)
+
+
+def run(size: int, queries: int = 20, threshold: float = 0.8, seed: int = 0):
+    """Benchmark one corpus size and print timings"""
+    rng = random.Random(seed)
+    fingerprints = _random_fingerprints(size, rng)
+
+    # Plant a few near-duplicates of every query so there is something to find
+    targets = rng.sample(fingerprints, min(queries, size))
+    for target in targets:
+        fingerprints.extend(_mutate(target, rng.randint(1, 3), rng) for _ in range(3))
+
+    fingerprinter = CodeFingerprint()
+
+    start = time.perf_counter()
+    index = FingerprintIndex()
+    index.add_many(fingerprints)
+    build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    linear_results = [fingerprinter.find_similar(t, fingerprints, threshold) for t in targets]
+    linear = (time.perf_counter() - start) / len(targets)
+
+    start = time.perf_counter()
+    index_results = [index.query(t, threshold) for t in targets]
+    indexed = (time.perf_counter() - start) / len(targets)
+
+    for expected, actual in zip(linear_results, index_results):
+        assert {fp for fp, _ in expected} == {fp for fp, _ in actual}
+
+    print(f"{len(fingerprints):>10,} fingerprints | "
+          f"find_similar {linear * 1000:10.2f}ms/query | "
+          f"index {indexed * 1000:8.3f}ms/query | "
+          f"build {build:6.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='10000,1000000,10000000',
+                        help='Comma-separated corpus sizes')
+    parser.add_argument('--queries', type=int, default=20)
+    parser.add_argument('--threshold', type=float, default=0.8)
+    args = parser.parse_args()
+
+    for size in args.sizes.split(','):
+        run(int(size), args.queries, args.threshold)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+"""
+Persistent content-addressed fingerprint cache
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import asdict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+
+# (content key, language, options key, algorithm version)
+CacheKey = Tuple[str, str, str, int]
+
+
+def blob_sha(data: bytes) -> str:
+    """Content hash computed the same way git names blobs"""
+    header = b'blob %d\0' % len(data)
+    return hashlib.sha1(header + data).hexdigest()
+
+
+def options_key(options: Any) -> str:
+    """Stable hash of a FingerprintOptions dataclass"""
+    encoded = json.dumps(asdict(options), sort_keys=True).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+class FingerprintCache:
+    """
+    SQLite-backed fingerprint cache with size-bounded LRU eviction
+
+    The database runs in WAL mode, so any number of processes can read it
+    while one writes; every process opens its own connection lazily, and a
+    pool worker reuses one unpickled copy per database for all its tasks.
+    Batch runs send worker hits and new entries back to the parent
+    (record()), so one process keeps recency, counters and eviction.
+
+    Recency updates for cache hits are buffered and written in batches, so
+    eviction order is an approximate LRU. Eviction runs every EVICT_EVERY
+    stores, at the end of every batch and on close(), so in between the
+    table can hold up to EVICT_EVERY - 1 entries more than max_entries.
+    """
+
+    TOUCH_BATCH = 256
+    EVICT_EVERY = 1024
+
+    def __init__(self, path: str, max_entries: int = 1_000_000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._touched: Dict[CacheKey, float] = {}
+        self._unevicted = 0  # Stores since the last eviction
+
+    def __reduce__(self):
+        # Unpickled once per process and database, not once per task
+        return _process_cache, (self.path, self.max_entries)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection().execute(
+                'SELECT COUNT(*) FROM fingerprints').fetchone()[0]
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS fingerprints (
+                    content_key TEXT NOT NULL,
+                    language TEXT NOT NULL,
+                    options_key TEXT NOT NULL,
+                    version INTEGER NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (content_key, language, options_key, version)
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS fingerprints_last_used '
+                         'ON fingerprints (last_used)')
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: CacheKey) -> Optional[str]:
+        """Look up a fingerprint, returning None on a miss"""
+        with self._lock:
+            fingerprint = self._select(key)
+            if fingerprint is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._touch(key)
+            return fingerprint
+
+    def lookup(self, key: CacheKey) -> Optional[str]:
+        """Look up a fingerprint without counting or recording the use"""
+        with self._lock:
+            return self._select(key)
+
+    def put(self, key: CacheKey, fingerprint: str):
+        """Store a fingerprint"""
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute('INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?, ?, ?)',
+                             key + (fingerprint, time.time()))
+            self._stored(1)
+
+    def record(self, used: Iterable[CacheKey], added: Iterable[Tuple[CacheKey, str]]):
+        """
+        Apply hits and new entries from lookups made elsewhere
+
+        Pool workers only read the database (lookup()); the batch APIs pass
+        what they found and computed to this method in the parent.
+
+        Args:
+            used: Keys of entries that were hits
+            added: (key, fingerprint) of entries that were misses
+        """
+        with self._lock:
+            now = time.time()
+            for key in used:
+                self.hits += 1
+                self._touch(key, now)
+            rows = [key + (fingerprint, now) for key, fingerprint in added]
+            if rows:
+                self.misses += len(rows)
+                conn = self._connection()
+                with conn:
+                    conn.executemany(
+                        'INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?, ?, ?)', rows)
+                self._stored(len(rows))
+
+    def evict(self) -> int:
+        """
+        Drop least recently used entries beyond max_entries
+
+        Returns:
+            Number of entries removed
+        """
+        with self._lock:
+            return self._evict()
+
+    def flush(self):
+        """Write buffered recency updates"""
+        with self._lock:
+            self._flush_touched()
+
+    def close(self):
+        """Flush pending updates, evict down to max_entries and close the connection"""
+        with self._lock:
+            if self._conn is not None:
+                if self._unevicted:
+                    self._evict()
+                else:
+                    self._flush_touched()
+                self._conn.close()
+                self._conn = None
+
+    def _select(self, key: CacheKey) -> Optional[str]:
+        row = self._connection().execute(
+            'SELECT fingerprint FROM fingerprints WHERE content_key = ? '
+            'AND language = ? AND options_key = ? AND version = ?', key).fetchone()
+        return row[0] if row is not None else None
+
+    def _touch(self, key: CacheKey, used: Optional[float] = None):
+        self._touched[key] = used if used is not None else time.time()
+        if len(self._touched) >= self.TOUCH_BATCH:
+            self._flush_touched()
+
+    def _stored(self, count: int):
+        self._unevicted += count
+        if self._unevicted >= self.EVICT_EVERY:
+            self._evict()
+
+    def _flush_touched(self):
+        if not self._touched:
+            return
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                'UPDATE fingerprints SET last_used = ? WHERE content_key = ? '
+                'AND language = ? AND options_key = ? AND version = ?',
+                [(used,) + key for key, used in self._touched.items()])
+        self._touched.clear()
+
+    def _evict(self) -> int:
+        self._flush_touched()
+        self._unevicted = 0
+        conn = self._connection()
+        with conn:
+            cursor = conn.execute(
+                'DELETE FROM fingerprints WHERE rowid IN ('
+                'SELECT rowid FROM fingerprints ORDER BY last_used DESC '
+                'LIMIT -1 OFFSET ?)', (self.max_entries,))
+        return cursor.rowcount
+
+
+# (pid, path, max_entries) -> cache unpickled in that process
+_process_caches: Dict[Tuple[int, str, int], FingerprintCache] = {}
+
+
+def _process_cache(path: str, max_entries: int) -> FingerprintCache:
+    # Keyed by pid too: a forked worker must not reuse its parent's connection
+    key = (os.getpid(), path, max_entries)
+    cache = _process_caches.get(key)
+    if cache is None:
+        cache = _process_caches[key] = FingerprintCache(path, max_entries)
+    return cache
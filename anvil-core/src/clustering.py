@@ -0,0 +1,642 @@
+"""
+Repository-wide near-duplicate clustering
+
+Every Python function and class under a directory gets a SimHash (see
+CodeFingerprint.fingerprint_definitions in simhash mode). Identical
+fingerprints are grouped first; the distinct ones are then blocked with a
+multi-index over fingerprint segments, so only pairs that can be within the
+similarity threshold are compared. Candidate pairs are verified in a process
+pool and merged with union-find, and clusters are written as JSON lines.
+
+Memory is bounded by arrays, not Python objects: fingerprints, spool
+offsets, union-find parents and every sort order are kept in arrays of
+8-byte words, paths are streamed from the scanner, and definition records
+are spooled to a temporary file until the clusters are written. Sorting
+uses a NumPy argsort when NumPy is installed and otherwise an external
+merge sort whose runs are spilled to temporary files, and segment tables
+are counting-sorted into arrays, one at a time. What stays in memory is a
+few dozen bytes per definition.
+
+Usage:
+    python -m anvil_core.clustering path/to/repo --threshold 0.9 -o clones.jsonl
+"""
+
+import argparse
+import heapq
+import json
+import math
+import sys
+import tempfile
+from array import array
+from dataclasses import asdict, dataclass, field, replace
+from functools import partial
+from itertools import combinations
+from typing import IO, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from .fingerprinting import CodeFingerprint, FingerprintOptions, _popcount
+from .models import FileLocation
+from .parallel import ordered_map
+from .scanner import read_source, scan_files
+from . import similarity
+from .storage import FingerprintArray
+
+
+@dataclass
+class ClusterMember:
+    """One definition in a clone cluster"""
+    qualified_name: str
+    kind: str
+    fingerprint: str
+    location: FileLocation
+
+
+@dataclass
+class CloneCluster:
+    """Definitions whose fingerprints are transitively within the threshold"""
+    id: int
+    members: List[ClusterMember] = field(default_factory=list)
+
+
+@dataclass
+class ClusteringStats:
+    """Counters from one clustering run"""
+    files: int = 0
+    failed_files: int = 0
+    definitions: int = 0
+    distinct: int = 0
+    compared_pairs: int = 0
+    merged_pairs: int = 0
+    skipped_buckets: int = 0
+    clusters: int = 0
+
+
+def _file_definitions(options: FingerprintOptions, min_lines: int, path: str
+                      ) -> Tuple[str, Optional[List[Tuple[str, str, str, int, int]]]]:
+    """
+    Worker: the path, with (name, kind, fingerprint, start, end) of every
+    definition, or None
+    """
+    try:
+        code = read_source(path)
+        definitions = CodeFingerprint(options).fingerprint_definitions(code, path)
+    except (OSError, UnicodeDecodeError, SyntaxError, ValueError, RecursionError):
+        # Unreadable or unparsable files are counted, not fatal
+        return path, None
+
+    return path, [(d.qualified_name, d.kind, d.fingerprint,
+                   d.location.start_line, d.location.end_line)
+                  for d in definitions
+                  if d.location.end_line - d.location.start_line + 1 >= min_lines]
+
+
+# A verification entry: (row ids, row fingerprints, column ids, column
+# fingerprints). The first len(rows) columns are the rows themselves, so
+# among those only columns after the row are compared (each pair once);
+# every later column is compared with every row.
+_Entry = Tuple[List[int], List[int], List[int], List[int]]
+
+
+def _verify(max_distance: int, bits: int,
+            unit: List[_Entry]) -> Tuple[int, List[Tuple[int, int]]]:
+    """Worker: verify a batch of candidate entries"""
+    if similarity.np is not None:
+        return _verify_vectorized(max_distance, bits, unit)
+
+    compared = 0
+    matches = []
+    for row_ids, row_fps, col_ids, col_fps in unit:
+        for x, (i, a) in enumerate(zip(row_ids, row_fps)):
+            compared += len(col_ids) - x - 1
+            for j, b in zip(col_ids[x + 1:], col_fps[x + 1:]):
+                if _popcount(a ^ b) <= max_distance:
+                    matches.append((i, j))
+    return compared, matches
+
+
+def _verify_vectorized(max_distance: int, bits: int,
+                       unit: List[_Entry]) -> Tuple[int, List[Tuple[int, int]]]:
+    """_verify with NumPy: every pair of the batch in one vectorized pass"""
+    np = similarity.np
+    row_ids, row_fps, col_ids, col_fps = [], [], [], []
+    row_counts, col_counts = [], []
+    for entry_row_ids, entry_row_fps, entry_col_ids, entry_col_fps in unit:
+        row_ids += entry_row_ids
+        row_fps += entry_row_fps
+        col_ids += entry_col_ids
+        col_fps += entry_col_fps
+        row_counts.append(len(entry_row_ids))
+        col_counts.append(len(entry_col_ids))
+
+    row_counts = np.array(row_counts, dtype=np.int64)
+    col_counts = np.array(col_counts, dtype=np.int64)
+    row_starts = np.cumsum(row_counts) - row_counts
+    col_starts = np.cumsum(col_counts) - col_counts
+
+    # Enumerate the rows x columns grid of every entry, then keep y > x
+    sizes = row_counts * col_counts
+    entry = np.repeat(np.arange(len(unit)), sizes)
+    local = np.arange(int(sizes.sum())) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    width = col_counts[entry]
+    x, y = local // width, local % width
+    keep = y > x
+    rows = (row_starts[entry] + x)[keep]
+    cols = (col_starts[entry] + y)[keep]
+
+    xor = np.bitwise_xor(_pack(row_fps, bits)[rows], _pack(col_fps, bits)[cols])
+    close = np.nonzero(similarity._popcount(xor) <= max_distance)[0]
+    matches = [(row_ids[rows[k]], col_ids[cols[k]]) for k in close]
+    return len(rows), matches
+
+
+def _pack(fingerprints: List[int], bits: int):
+    np = similarity.np
+    if bits == 64:
+        return np.array(fingerprints, dtype=np.uint64).reshape(-1, 1)
+    return similarity.pack_fingerprints(fingerprints, bits)
+
+
+# Keys the pure-Python sort holds in memory at once; longer inputs are
+# sorted in runs of this size, spilled to temporary files and merged
+_SORT_RUN = 1 << 17
+
+
+def _argsort(keys: Iterable[int], bits: int) -> array:
+    """
+    Positions of keys in ascending key order, equal keys in input order
+
+    Args:
+        keys: Non-negative ints of at most `bits` bits (128 at most); an
+            array('Q') or a FingerprintArray is sorted without copying
+        bits: Key width
+    """
+    if similarity.np is None:
+        return _external_argsort(keys, bits)
+
+    np = similarity.np
+    if isinstance(keys, array) and keys.typecode == 'Q':
+        matrix = np.frombuffer(keys, dtype=np.uint64).reshape(-1, 1)
+    else:
+        if not isinstance(keys, FingerprintArray):
+            keys = FingerprintArray.from_ints(keys, 64 if bits <= 64 else 128)
+        matrix = keys.to_numpy()
+    # lexsort is stable and takes its primary key last
+    order = np.lexsort(matrix.T[::-1]).astype(np.int64)
+    del matrix
+    ids = array('q')
+    ids.frombytes(order.tobytes())
+    return ids
+
+
+def _external_argsort(keys: Iterable[int], bits: int) -> array:
+    """_argsort without NumPy: sorted runs spilled to disk, then merged"""
+    width = (bits + 7) // 8
+    size = width + 8
+    runs: List[IO[bytes]] = []
+    run: List[bytes] = []
+
+    def spill():
+        run.sort()
+        spool = tempfile.TemporaryFile(mode='w+b')
+        spool.write(b''.join(run))
+        spool.seek(0)
+        runs.append(spool)
+        run.clear()
+
+    # Big-endian key then position: byte order is (key, position) order
+    for position, key in enumerate(keys):
+        run.append(key.to_bytes(width, 'big') + position.to_bytes(8, 'big'))
+        if len(run) >= _SORT_RUN:
+            spill()
+
+    ids = array('q')
+    if not runs:
+        run.sort()
+        ids.extend(int.from_bytes(record[width:], 'big') for record in run)
+        return ids
+
+    if run:
+        spill()
+    try:
+        for record in heapq.merge(*(_records(spool, size) for spool in runs)):
+            ids.append(int.from_bytes(record[width:], 'big'))
+    finally:
+        for spool in runs:
+            spool.close()
+    return ids
+
+
+def _records(spool: IO[bytes], size: int, per_read: int = 4096) -> Iterator[bytes]:
+    """Fixed-size records from a spilled run, read in blocks"""
+    while True:
+        block = spool.read(size * per_read)
+        if not block:
+            return
+        for start in range(0, len(block), size):
+            yield block[start:start + size]
+
+
+def _segments(distinct: FingerprintArray, low: int, width: int):
+    """
+    Bits low..low + width of every fingerprint, as an array('Q'), or the
+    fingerprints themselves when one segment spans all 128 bits
+    """
+    if width == distinct.bits:
+        return distinct
+
+    mask = (1 << width) - 1
+    segments = array('Q')
+    if similarity.np is None:
+        value_at = distinct._value_at
+        segments.extend((value_at(i) >> low) & mask for i in range(len(distinct)))
+        return segments
+
+    np = similarity.np
+    matrix = distinct.to_numpy()
+    word, shift = distinct.words - 1 - low // 64, low % 64
+    column = matrix[:, word] >> np.uint64(shift)
+    if shift + width > 64:  # The segment straddles the two words
+        column |= matrix[:, word - 1] << np.uint64(64 - shift)
+    column &= np.uint64(mask)
+    del matrix
+    segments.frombytes(column.tobytes())
+    return segments
+
+
+class _Buckets:
+    """
+    Ids sorted by segment, and the slice of them each segment occupies
+
+    Segments of up to DENSE_BITS bits are counting-sorted, and an array of
+    slice starts is indexed by the segment itself. Wider segments are
+    sorted with _argsort and found by binary search over those present.
+    """
+
+    DENSE_BITS = 20
+
+    def __init__(self, segments, width: int):
+        """
+        Args:
+            segments: Segment of every id, see _segments()
+            width: Segment width in bits
+        """
+        self.segments = segments
+        self.dense = width <= self.DENSE_BITS
+        if self.dense:
+            starts = array('q', [0]) * ((1 << width) + 1)
+            for segment in segments:
+                starts[segment + 1] += 1
+            for segment in range(1 << width):
+                starts[segment + 1] += starts[segment]
+            cursor = array('q', starts)
+            self.ids = array('q', [0]) * len(segments)
+            for i, segment in enumerate(segments):
+                self.ids[cursor[segment]] = i
+                cursor[segment] += 1
+            self.starts = starts
+        else:
+            self.ids = _argsort(segments, width)
+            self.keys = FingerprintArray(64 if width <= 64 else 128)
+            self.starts = array('q')
+            previous = None
+            for position, i in enumerate(self.ids):
+                segment = segments[i]
+                if segment != previous:
+                    self.keys.append(segment)
+                    self.starts.append(position)
+                    previous = segment
+            self.starts.append(len(self.ids))
+
+    def __iter__(self) -> Iterator[Tuple[int, int, int]]:
+        """(segment, start, end) of every non-empty bucket, by segment"""
+        if not self.dense:
+            for k in range(len(self.keys)):
+                yield self.keys[k], self.starts[k], self.starts[k + 1]
+            return
+
+        position = 0
+        while position < len(self.ids):
+            segment = self.segments[self.ids[position]]
+            end = self.starts[segment + 1]
+            yield segment, position, end
+            position = end
+
+    def get(self, segment: int) -> Optional[Tuple[int, int]]:
+        """Slice of ids whose segment is `segment`, or None"""
+        if self.dense:
+            start, end = self.starts[segment], self.starts[segment + 1]
+            return (start, end) if end > start else None
+        k = self.keys.index(segment)
+        return None if k is None else (self.starts[k], self.starts[k + 1])
+
+    def neighbours(self, segment: int, flips: List[int],
+                   radius: int) -> Iterator[Tuple[int, int]]:
+        """Slices of the buckets after `segment` that are 1..radius bits away"""
+        if self.dense or len(flips) < len(self.keys):
+            for flip in flips:
+                neighbour = segment ^ flip
+                bounds = self.get(neighbour) if neighbour > segment else None
+                if bounds is not None:
+                    yield bounds
+            return
+
+        # Fewer buckets than probes: test the later buckets instead
+        for k in range(self.keys.index(segment) + 1, len(self.keys)):
+            if _popcount(segment ^ self.keys[k]) <= radius:
+                yield self.starts[k], self.starts[k + 1]
+
+
+class _UnionFind:
+    """Disjoint sets over 0..n-1 with path halving and union by size"""
+
+    def __init__(self, n: int):
+        self.parent = array('q', range(n))
+        self.size = array('q', [1]) * n
+
+    def find(self, i: int) -> int:
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(self, i: int, j: int) -> bool:
+        i, j = self.find(i), self.find(j)
+        if i == j:
+            return False
+        if self.size[i] < self.size[j]:
+            i, j = j, i
+        self.parent[j] = i
+        self.size[i] += self.size[j]
+        return True
+
+
+class CloneClusterer:
+    """
+    Find clusters of near-duplicate functions and classes in a source tree
+
+    Two definitions are linked when their SimHashes differ in at most
+    ``floor((1 - threshold) * bits)`` bits; clusters are the connected
+    components of those links. Blocking splits fingerprints into
+    ``blocks`` segments: by the pigeonhole principle a linked pair has a
+    segment that differs in at most ``max_distance // blocks`` bits, so
+    only buckets whose segments are that close are compared.
+    """
+
+    # Approximate comparisons per work unit sent to a verification worker
+    UNIT_PAIRS = 1 << 18
+
+    def __init__(self, threshold: float = 0.9, bits: int = 64, blocks: Optional[int] = None,
+                 min_lines: int = 3, min_size: int = 2,
+                 max_bucket: Optional[int] = 20000,
+                 options: Optional[FingerprintOptions] = None,
+                 workers: Optional[int] = None):
+        """
+        Args:
+            threshold: Minimum SimHash similarity (0.0 to 1.0) for a link
+            bits: SimHash width (64 or 128)
+            blocks: Segments per fingerprint for blocking (default: enough
+                that buckets only probe neighbours one bit away)
+            min_lines: Skip definitions shorter than this
+            min_size: Smallest cluster to report
+            max_bucket: Skip blocking buckets larger than this (they are
+                counted in the stats); None compares every bucket
+            options: Fingerprint options (default: simhash mode, ignoring
+                variable names and string literals); mode and bits are
+                always set from the arguments above
+            workers: Processes for extraction and verification
+        """
+        if not 0.0 < threshold <= 1.0:
+            raise ValueError(f"threshold must be in (0, 1], got {threshold}")
+        max_distance = int(math.floor((1.0 - threshold) * bits + 1e-9))
+        if blocks is None:
+            blocks = min(bits, max(4, (max_distance + 2) // 2))
+        if blocks < 1 or blocks > bits:
+            raise ValueError(f"blocks must be between 1 and {bits}, got {blocks}")
+
+        options = options or FingerprintOptions(ignore_variable_names=True,
+                                                ignore_string_literals=True)
+        self.options = replace(options, mode='simhash', simhash_bits=bits)
+        CodeFingerprint(self.options)  # Validates the options
+
+        self.threshold = threshold
+        self.bits = bits
+        self.blocks = blocks
+        self.max_distance = max_distance
+        self.min_lines = min_lines
+        self.min_size = min_size
+        self.max_bucket = max_bucket
+        self.workers = workers
+        self.stats = ClusteringStats()
+
+    def cluster_tree(self, root: str) -> Iterator[CloneCluster]:
+        """
+        Cluster every Python definition under a directory
+
+        Returns:
+            Iterator of clusters, largest first; self.stats is filled in as
+            the run progresses
+        """
+        self.stats = ClusteringStats()
+        with tempfile.TemporaryFile(mode='w+b') as spool:
+            fingerprints, offsets = self._extract(root, spool)
+            distinct, members = self._group_identical(fingerprints)
+            union = self._link(distinct)
+            yield from self._clusters(union, members, offsets, spool)
+
+    def _extract(self, root: str, spool) -> Tuple[FingerprintArray, array]:
+        """Fingerprint definitions, spooling their records to a file"""
+        # Paths stream from the scanner; workers hand each one back
+        paths = (source.path for source in scan_files(root, ['python']))
+        worker = partial(_file_definitions, self.options, self.min_lines)
+
+        fingerprints = FingerprintArray(self.bits)
+        offsets = array('Q')
+        for path, definitions in ordered_map(worker, paths, workers=self.workers,
+                                             chunksize=16):
+            self.stats.files += 1
+            if definitions is None:
+                self.stats.failed_files += 1
+                continue
+            for name, kind, fp, start, end in definitions:
+                offsets.append(spool.tell())
+                record = [path, name, kind, fp, start, end]
+                spool.write(json.dumps(record).encode('utf-8') + b'\n')
+                fingerprints.append(fp)
+
+        self.stats.definitions = len(fingerprints)
+        return fingerprints, offsets
+
+    def _group_identical(self, fingerprints: FingerprintArray) -> Tuple[FingerprintArray, array]:
+        """
+        Collapse equal fingerprints
+
+        Returns:
+            Sorted distinct fingerprints, and for every definition the
+            position of its fingerprint among them
+        """
+        order = _argsort(fingerprints, self.bits)
+        distinct = FingerprintArray(self.bits)
+        members = array('q', [0]) * len(fingerprints)
+        value_at = fingerprints._value_at
+        previous = None
+        position = -1
+        for i in order:
+            value = value_at(i)
+            if value != previous:
+                distinct.append(value)
+                previous = value
+                position += 1
+            members[i] = position
+
+        self.stats.distinct = len(distinct)
+        return distinct, members
+
+    def _link(self, distinct: FingerprintArray) -> _UnionFind:
+        """Union distinct fingerprints that are within the threshold"""
+        union = _UnionFind(len(distinct))
+        worker = partial(_verify, self.max_distance, self.bits)
+        for compared, matches in ordered_map(worker, self._candidate_units(distinct),
+                                             workers=self.workers, chunksize=1):
+            self.stats.compared_pairs += compared
+            for i, j in matches:
+                if union.union(i, j):
+                    self.stats.merged_pairs += 1
+        return union
+
+    def _candidate_units(self, distinct: FingerprintArray) -> Iterator[List[_Entry]]:
+        """Batches of bucket comparisons, one segment table at a time"""
+        radius = self.max_distance // self.blocks
+        size, extra = divmod(self.bits, self.blocks)
+        value_at = distinct._value_at
+        low = self.bits
+
+        batch: List[_Entry] = []
+        pairs = 0
+        for block in range(self.blocks):
+            width = size + (1 if block < extra else 0)
+            low -= width
+            flips = list(_flips(width, radius))
+
+            # Only one table is held in memory at a time
+            buckets = _Buckets(_segments(distinct, low, width), width)
+            ids = buckets.ids
+
+            for segment, start, end in buckets:
+                if self.max_bucket is not None and end - start > self.max_bucket:
+                    self.stats.skipped_buckets += 1
+                    continue
+
+                # Each unordered pair of buckets once: only larger neighbours
+                other_ids: List[int] = []
+                for bounds in buckets.neighbours(segment, flips, radius):
+                    if self.max_bucket is not None and bounds[1] - bounds[0] > self.max_bucket:
+                        continue
+                    other_ids += ids[bounds[0]:bounds[1]]
+
+                if end - start < 2 and not other_ids:
+                    continue
+
+                # Split big buckets by rows so no entry is too large
+                rows = ids[start:end].tolist()
+                row_fps = [value_at(i) for i in rows]
+                other_fps = [value_at(i) for i in other_ids]
+                step = max(1, self.UNIT_PAIRS // (end - start + len(other_ids)))
+                for row in range(0, end - start, step):
+                    stop = min(row + step, end - start)
+                    batch.append((rows[row:stop], row_fps[row:stop],
+                                  rows[row:] + other_ids, row_fps[row:] + other_fps))
+                    pairs += (stop - row) * (end - start - row + len(other_ids))
+                    if pairs >= self.UNIT_PAIRS:
+                        yield batch
+                        batch, pairs = [], 0
+            del buckets, ids
+
+        if batch:
+            yield batch
+
+    def _clusters(self, union: _UnionFind, members: array, offsets: array,
+                  spool) -> Iterator[CloneCluster]:
+        """Group definitions by root and read their records back"""
+        # Counting sort of definitions by root: slice starts, then order
+        distinct = len(union.parent)
+        roots = array('q', (union.find(d) for d in members))
+        starts = array('q', [0]) * (distinct + 1)
+        for root in roots:
+            starts[root + 1] += 1
+        for root in range(distinct):
+            starts[root + 1] += starts[root]
+        cursor = array('q', starts)
+        order = array('q', [0]) * len(roots)
+        for i, root in enumerate(roots):
+            order[cursor[root]] = i
+            cursor[root] += 1
+        del roots, cursor
+
+        # Largest first, ties by first definition: key (n - size) * n + first
+        n = len(order)
+        min_size = max(self.min_size, 1)
+        wanted = array('q', (root for root in range(distinct)
+                             if starts[root + 1] - starts[root] >= min_size))
+        self.stats.clusters = len(wanted)
+        ranked = _argsort(((n - (starts[root + 1] - starts[root])) * n + order[starts[root]]
+                           for root in wanted), max(1, (n * n).bit_length()))
+
+        for cluster_id, k in enumerate(ranked):
+            root = wanted[k]
+            items = order[starts[root]:starts[root + 1]]
+            cluster = CloneCluster(cluster_id)
+            for i in items:
+                spool.seek(offsets[i])
+                path, name, kind, fp, start, end = json.loads(spool.readline())
+                cluster.members.append(ClusterMember(name, kind, fp,
+                                                     FileLocation(path, start, end)))
+            yield cluster
+
+    def write_jsonl(self, clusters: Iterator[CloneCluster], out: TextIO) -> int:
+        """
+        Write clusters as JSON lines
+
+        Returns:
+            Number of clusters written
+        """
+        count = 0
+        for cluster in clusters:
+            out.write(json.dumps(asdict(cluster)) + '\n')
+            count += 1
+        return count
+
+
+def _flips(width: int, radius: int) -> Iterator[int]:
+    """XOR masks that flip 1..radius of width bits"""
+    for distance in range(1, radius + 1):
+        for positions in combinations(range(width), distance):
+            yield sum(1 << p for p in positions)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('root', help='Directory to scan')
+    parser.add_argument('-o', '--output', help='JSON lines file (default: stdout)')
+    parser.add_argument('--threshold', type=float, default=0.9)
+    parser.add_argument('--bits', type=int, default=64, choices=(64, 128))
+    parser.add_argument('--blocks', type=int)
+    parser.add_argument('--min-lines', type=int, default=3)
+    parser.add_argument('--min-size', type=int, default=2)
+    parser.add_argument('--workers', type=int)
+    args = parser.parse_args()
+
+    clusterer = CloneClusterer(threshold=args.threshold, bits=args.bits, blocks=args.blocks,
+                               min_lines=args.min_lines, min_size=args.min_size,
+                               workers=args.workers)
+    clusters = clusterer.cluster_tree(args.root)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as out:
+            clusterer.write_jsonl(clusters, out)
+    else:
+        clusterer.write_jsonl(clusters, sys.stdout)
+
+    print(clusterer.stats, file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
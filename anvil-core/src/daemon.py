@@ -0,0 +1,397 @@
+"""
+Long-running analysis daemon with warm caches
+
+Importing anvil-core, building parsers and filling the AST and fingerprint
+caches costs far more than fingerprinting one small file, so tools that run
+on every save pay mostly for startup. The daemon keeps all of that warm in
+one process and answers requests over a Unix socket.
+
+The protocol is JSON lines: each request is one object
+``{"id": 1, "method": "fingerprint", "params": {...}}`` and is answered by
+``{"id": 1, "result": ...}`` or ``{"id": 1, "error": {"type": ..., "message": ...}}``.
+Requests on one connection are answered in order; connections are served
+concurrently. Small requests run directly on the event loop (a thread hop
+would cost more than the work); large fingerprint, definitions and
+summarize requests go to a worker thread so they do not hold up the queue.
+
+Methods:
+    fingerprint   code, language -> fingerprint
+    definitions   code, filename -> fingerprints of every function and class (Python)
+    summarize     code, language -> functions, classes, complexity, patterns
+    add           label, and code + language or fingerprint -> fingerprint
+    find_similar  code + language or fingerprint, threshold, k -> matches
+    stats         request counts and cache statistics
+    ping          -> "pong"
+
+Usage:
+    python -m anvil_core.daemon --socket /tmp/anvil.sock --index path/to/repo
+
+    with DaemonClient('/tmp/anvil.sock') as client:
+        client.fingerprint(code)
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import sys
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+from .ast_cache import shared_ast_cache
+from .cache import FingerprintCache
+from .fingerprinting import CodeFingerprint, FingerprintOptions
+from .index import FingerprintIndex
+from .repository import parse_source
+from .scanner import read_source, scan_files
+
+
+# Requests with more code than this are handled off the event loop
+INLINE_LIMIT = 64 * 1024
+
+# Methods that only read warm state, so they can safely run in a worker thread
+_THREAD_SAFE_METHODS = frozenset({'fingerprint', 'definitions', 'summarize'})
+
+# Longest request line accepted
+MAX_REQUEST_BYTES = 64 * 1024 * 1024
+
+
+class DaemonError(RuntimeError):
+    """A request failed in the daemon; ``error_type`` names the original exception"""
+
+    def __init__(self, error_type: str, message: str):
+        super().__init__(f"{error_type}: {message}")
+        self.error_type = error_type
+
+
+class AnalysisDaemon:
+    """
+    Serves fingerprint, summary and similarity requests from warm state
+
+    Args:
+        socket_path: Unix socket to listen on
+        options: Fingerprint options for every request (default: FingerprintOptions())
+        cache_path: Optional FingerprintCache database shared with batch runs
+        index_blocks: Segments of the similarity index (see FingerprintIndex)
+    """
+
+    def __init__(self, socket_path: str, options: Optional[FingerprintOptions] = None,
+                 cache_path: Optional[str] = None, index_blocks: int = 4):
+        self.socket_path = socket_path
+        self.options = options or FingerprintOptions()
+        self.cache = FingerprintCache(cache_path) if cache_path else None
+        self.fingerprinter = CodeFingerprint(self.options, self.cache)
+
+        if self.options.mode == 'simhash':
+            self.index = FingerprintIndex(width=self.options.simhash_bits // 4,
+                                          blocks=index_blocks, metric='bits')
+        else:
+            self.index = FingerprintIndex(blocks=index_blocks)
+        self.labels: Dict[str, List[str]] = {}
+
+        self.requests: Counter = Counter()
+        self.errors = 0
+        self.started = time.time()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._methods: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+            'fingerprint': self._fingerprint,
+            'definitions': self._definitions,
+            'summarize': self._summarize,
+            'add': self._add,
+            'find_similar': self._find_similar,
+            'stats': self._stats,
+            'ping': lambda params: 'pong',
+        }
+
+    def index_tree(self, root: str) -> int:
+        """
+        Add every Python function and class under a directory to the index
+
+        Labels are ``path:qualified_name:line``.
+
+        Returns:
+            Number of definitions added
+        """
+        added = 0
+        for source in scan_files(root, ['python']):
+            try:
+                definitions = self.fingerprinter.fingerprint_definitions(
+                    read_source(source.path), source.path)
+            except (OSError, UnicodeDecodeError, SyntaxError, ValueError, RecursionError):
+                continue
+            for d in definitions:
+                self._label(d.fingerprint,
+                            f"{source.path}:{d.qualified_name}:{d.location.start_line}")
+                added += 1
+        return added
+
+    def warm_up(self):
+        """Exercise every code path once so the first request is not slow"""
+        sample = "def f(x):\n    if x is None:\n        return 0\n    return x\n"
+        self.fingerprinter.generate(sample, 'python')
+        self.fingerprinter.generate("function f(x) { return x; }", 'javascript')
+        parse_source(sample, 'python')
+        parse_source("class A { m() {} }", 'typescript')
+
+    async def serve(self):
+        """Listen until stop() is called or the process gets SIGINT/SIGTERM"""
+        self._remove_stale_socket()
+        self._server = await asyncio.start_unix_server(
+            self._handle_connection, path=self.socket_path, limit=MAX_REQUEST_BYTES)
+        os.chmod(self.socket_path, 0o600)
+
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, self.stop)
+            except (NotImplementedError, RuntimeError, ValueError):
+                pass  # Not in the main thread
+
+        try:
+            async with self._server:
+                await self._server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            if self.cache is not None:
+                self.cache.flush()
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+
+    def stop(self):
+        if self._server is not None:
+            self._server.close()
+
+    def _remove_stale_socket(self):
+        """Delete a socket file left behind by a daemon that died"""
+        if not os.path.exists(self.socket_path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.socket_path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.unlink(self.socket_path)
+        else:
+            raise RuntimeError(f"A daemon is already listening on {self.socket_path}")
+        finally:
+            probe.close()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader,
+                                 writer: asyncio.StreamWriter):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # Longer than MAX_REQUEST_BYTES: the stream cannot be resynchronized
+                    writer.write(_encode(None, error=ValueError("Request too large")))
+                    break
+                if not line:
+                    break
+
+                request_id = None
+                try:
+                    request = json.loads(line)
+                    request_id = request.get('id')
+                    name = request.get('method')
+                    method = self._methods.get(name)
+                    if method is None:
+                        raise ValueError(f"Unknown method: {name}")
+                    params = request.get('params') or {}
+                    self.requests[name] += 1
+
+                    if name in _THREAD_SAFE_METHODS and len(params.get('code') or '') > INLINE_LIMIT:
+                        result = await loop.run_in_executor(None, method, params)
+                    else:
+                        result = method(params)
+                    response = _encode(request_id, result)
+                except Exception as e:
+                    self.errors += 1
+                    response = _encode(request_id, error=e)
+
+                writer.write(response)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def _fingerprint(self, params: Dict[str, Any]) -> str:
+        return self.fingerprinter.generate(params['code'], params.get('language', 'python'))
+
+    def _definitions(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        definitions = self.fingerprinter.fingerprint_definitions(
+            params['code'], params.get('filename', '<string>'))
+        return [{'qualified_name': d.qualified_name, 'kind': d.kind,
+                 'fingerprint': d.fingerprint,
+                 'start_line': d.location.start_line, 'end_line': d.location.end_line}
+                for d in definitions]
+
+    def _summarize(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        parsed = parse_source(params['code'], params.get('language', 'python'),
+                              params.get('filename', '<string>'))
+        return {
+            'complexity': parsed.complexity,
+            'functions': [record._asdict() for record in parsed.functions],
+            'classes': [record._asdict() for record in parsed.classes],
+            'patterns': parsed.patterns or {},
+        }
+
+    def _target(self, params: Dict[str, Any]) -> str:
+        fingerprint = params.get('fingerprint')
+        if fingerprint:
+            if not isinstance(fingerprint, str):
+                raise ValueError("fingerprint must be a string")
+            return fingerprint
+        if not isinstance(params.get('code'), str):
+            raise ValueError("code or fingerprint required")
+        return self._fingerprint(params)
+
+    def _label(self, fingerprint: str, label: str):
+        labels = self.labels.get(fingerprint)
+        if labels is None:
+            self.labels[fingerprint] = labels = []
+        labels.append(label)
+        self.index.add(fingerprint)
+
+    def _add(self, params: Dict[str, Any]) -> str:
+        fingerprint = self._target(params)
+        self._label(fingerprint, params['label'])
+        return fingerprint
+
+    def _find_similar(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        target = self._target(params)
+        if params.get('k'):
+            matches = self.index.top_k(target, int(params['k']))
+        else:
+            matches = self.index.query(target, float(params.get('threshold', 0.8)))
+        return [{'fingerprint': fp, 'similarity': similarity, 'labels': self.labels.get(fp, [])}
+                for fp, similarity in matches]
+
+    def _stats(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        ast_cache = shared_ast_cache()
+        stats = {
+            'uptime': time.time() - self.started,
+            'requests': dict(self.requests),
+            'errors': self.errors,
+            'indexed': len(self.labels),
+            'ast_cache': {'entries': len(ast_cache), 'hits': ast_cache.hits,
+                          'misses': ast_cache.misses},
+        }
+        if self.cache is not None:
+            stats['fingerprint_cache'] = {'hits': self.cache.hits, 'misses': self.cache.misses}
+        return stats
+
+
+def _encode(request_id: Any, result: Any = None, error: Optional[Exception] = None) -> bytes:
+    if error is not None:
+        message = {'id': request_id,
+                   'error': {'type': type(error).__name__, 'message': str(error)}}
+    else:
+        message = {'id': request_id, 'result': result}
+    return json.dumps(message, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+class DaemonClient:
+    """
+    Blocking client for AnalysisDaemon
+
+    One connection, one request at a time; editors and hooks are expected
+    to keep a client open rather than reconnect per request.
+
+    Args:
+        socket_path: Socket the daemon listens on
+        timeout: Seconds to wait for connecting and for each response
+    """
+
+    def __init__(self, socket_path: str, timeout: Optional[float] = 10.0):
+        self.socket_path = socket_path
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        self._socket.connect(socket_path)
+        self._file = self._socket.makefile('rb')
+        self._next_id = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+    def call(self, method: str, **params) -> Any:
+        """
+        Send one request and wait for its response
+
+        Raises:
+            DaemonError: If the daemon reports an error
+            ConnectionError: If the daemon closed the connection
+        """
+        self._next_id += 1
+        request = {'id': self._next_id, 'method': method, 'params': params}
+        self._socket.sendall(json.dumps(request, separators=(',', ':')).encode('utf-8') + b'\n')
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("Daemon closed the connection")
+        response = json.loads(line)
+        if 'error' in response:
+            raise DaemonError(response['error']['type'], response['error']['message'])
+        return response['result']
+
+    def fingerprint(self, code: str, language: str = 'python') -> str:
+        return self.call('fingerprint', code=code, language=language)
+
+    def definitions(self, code: str, filename: str = '<string>') -> List[Dict[str, Any]]:
+        return self.call('definitions', code=code, filename=filename)
+
+    def summarize(self, code: str, language: str = 'python') -> Dict[str, Any]:
+        return self.call('summarize', code=code, language=language)
+
+    def add(self, label: str, code: Optional[str] = None, language: str = 'python',
+            fingerprint: Optional[str] = None) -> str:
+        return self.call('add', label=label, code=code, language=language,
+                         fingerprint=fingerprint)
+
+    def find_similar(self, code: Optional[str] = None, language: str = 'python',
+                     fingerprint: Optional[str] = None, threshold: float = 0.8,
+                     k: Optional[int] = None) -> List[Dict[str, Any]]:
+        return self.call('find_similar', code=code, language=language,
+                         fingerprint=fingerprint, threshold=threshold, k=k)
+
+    def stats(self) -> Dict[str, Any]:
+        return self.call('stats')
+
+    def ping(self) -> str:
+        return self.call('ping')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--socket', required=True, help='Unix socket path')
+    parser.add_argument('--cache', help='FingerprintCache database')
+    parser.add_argument('--index', action='append', default=[],
+                        help='Directory whose definitions seed the similarity index')
+    parser.add_argument('--mode', choices=('exact', 'simhash'), default='exact')
+    parser.add_argument('--bits', type=int, default=64, choices=(64, 128))
+    args = parser.parse_args()
+
+    options = FingerprintOptions(mode=args.mode, simhash_bits=args.bits)
+    daemon = AnalysisDaemon(args.socket, options, cache_path=args.cache)
+    daemon.warm_up()
+    for root in args.index:
+        print(f"Indexed {daemon.index_tree(root)} definitions from {root}", file=sys.stderr)
+    print(f"Listening on {args.socket}", file=sys.stderr)
+    asyncio.run(daemon.serve())
+
+
+if __name__ == '__main__':
+    main()
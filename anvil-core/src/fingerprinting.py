@@ -2,11 +2,26 @@
 Semantic code fingerprinting algorithms
 """
 
+import codecs
 import hashlib
+import io
 import re
-from typing import Optional, List, Tuple
+import sys
+from collections import Counter
+from functools import partial
+from typing import Optional, List, Tuple, Union, Iterable, Iterator
 import ast
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
+
+from .ast_cache import ASTCache, shared_ast_cache
+from .cache import FingerprintCache, blob_sha, options_key
+from .index import FingerprintIndex
+from .models import FileLocation
+from .normalizer import TextNormalizer
+from .parallel import ordered_map
+from .parsers import detect_language
+from .scanner import map_source, read_source, scan_files
+from .winnowing import WinnowFingerprint, kgram_hashes, tokenize_code, winnow
 
 
 @dataclass
@@ -17,6 +32,522 @@ class FingerprintOptions:
     ignore_variable_names: bool = False
     ignore_string_literals: bool = False
     normalize_syntax: bool = True
+    mode: str = 'exact'  # 'exact' or 'simhash'
+    simhash_bits: int = 64  # 64 or 128, only used in simhash mode
+    ast_hash_version: int = 3  # See AST_HASH_VERSIONS
+
+
+SIMHASH_BITS = (64, 128)
+
+# How Python ASTs are serialized into the hash:
+#   1: the text of ast.dump() (the original format, kept so existing
+#      fingerprints stay valid)
+#   2: compact stream of node types and field values, without field names,
+#      that never drops fields, so ast.dump() changes cannot affect it
+#   3: version 2 hashed bottom-up: every function and class is hashed on its
+#      own, with its own variable numbering and its indentation removed from
+#      multi-line strings, and its parent sees only that digest, so every
+#      definition's fingerprint comes out of one pass over the tree
+AST_HASH_VERSIONS = (1, 2, 3)
+
+# Layout of CrossLanguageFingerprint.feature_vector: one slot per count,
+# then a histogram of control-structure nesting depths (the last bucket
+# collects everything deeper), then called names folded into buckets
+STRUCTURE_COUNTS = ('functions', 'loops', 'conditionals', 'assignments', 'calls', 'returns')
+DEPTH_BUCKETS = 8
+CALL_BUCKETS = 32
+FEATURE_DIM = len(STRUCTURE_COUNTS) + DEPTH_BUCKETS + CALL_BUCKETS
+
+# Bump whenever a change alters what generate() returns for the same
+# input and options, so cached fingerprints are not reused across versions
+#   2: text fingerprints strip comments before collapsing whitespace and
+#      leave comment markers inside strings alone
+ALGORITHM_VERSION = 2
+
+# How far update_incremental() widens an edited region that does not parse
+# before giving up on it: neighbouring statements absorbed, and lines
+# parsed over all attempts
+WIDEN_STEPS = 4
+WIDEN_LINES = 2000
+
+
+@dataclass
+class FingerprintResult:
+    """Outcome of fingerprinting one item of a batch"""
+    index: int  # Position in the batch
+    language: str
+    fingerprint: Optional[str] = None
+    path: Optional[str] = None
+    error: Optional[str] = None
+
+
+class _WorkerCache:
+    """
+    FingerprintCache stand-in for batch workers
+    
+    Reads go to the database; hits and new entries are collected and sent
+    back with the result, so the parent's cache records them (see
+    FingerprintCache.record) and keeps one set of counters and one LRU.
+    """
+    
+    def __init__(self, cache: FingerprintCache):
+        self.cache = cache
+        self.used: List[tuple] = []
+        self.added: List[tuple] = []
+    
+    def get(self, key):
+        fingerprint = self.cache.lookup(key)
+        if fingerprint is not None:
+            self.used.append(key)
+        return fingerprint
+    
+    def put(self, key, fingerprint: str):
+        self.added.append((key, fingerprint))
+
+
+# What a batch worker returns: the result, then the cache hits and new
+# entries for the parent to record
+_WorkerOutcome = Tuple[FingerprintResult, List[tuple], List[tuple]]
+
+
+def _fingerprint_source(options: FingerprintOptions, cache: Optional[FingerprintCache],
+                        item: Tuple[int, str, str]) -> _WorkerOutcome:
+    """Worker: fingerprint one code string"""
+    index, code, language = item
+    worker_cache = _WorkerCache(cache) if cache is not None else None
+    try:
+        fingerprint = CodeFingerprint(options, worker_cache).generate(code, language)
+        result = FingerprintResult(index, language, fingerprint)
+    except Exception as e:
+        result = FingerprintResult(index, language, error=f"{type(e).__name__}: {e}")
+    if worker_cache is None:
+        return result, [], []
+    return result, worker_cache.used, worker_cache.added
+
+
+def _fingerprint_file(options: FingerprintOptions, cache: Optional[FingerprintCache],
+                      item: Tuple[int, str, str]) -> _WorkerOutcome:
+    """Worker: read and fingerprint one file"""
+    index, path, language = item
+    worker_cache = _WorkerCache(cache) if cache is not None else None
+    try:
+        fingerprint = CodeFingerprint(options, worker_cache).generate_file(path, language)
+        result = FingerprintResult(index, language, fingerprint, path=path)
+    except Exception as e:
+        result = FingerprintResult(index, language, path=path,
+                                   error=f"{type(e).__name__}: {e}")
+    if worker_cache is None:
+        return result, [], []
+    return result, worker_cache.used, worker_cache.added
+
+
+def _popcount(value: int) -> int:
+    """Count set bits (int.bit_count needs Python 3.10)"""
+    return bin(value).count('1')
+
+
+@dataclass
+class DefinitionFingerprint:
+    """Fingerprint of one function or class inside a larger source"""
+    qualified_name: str  # Same convention as __qualname__, e.g. 'f.<locals>.g'
+    kind: str  # 'function', 'async_function' or 'class'
+    fingerprint: str
+    location: FileLocation
+
+
+@dataclass
+class TextEdit:
+    """Replacement of the text between two positions of a buffer"""
+    start_line: int  # 1-based
+    start_col: int  # 0-based, in characters
+    end_line: int
+    end_col: int
+    text: str
+    
+    def apply(self, lines: List[str]) -> Tuple[List[str], int]:
+        """
+        Apply the edit to a list of lines (with line endings)
+        
+        Returns:
+            The new lines and the change in line count
+        """
+        head = lines[self.start_line - 1][:self.start_col] if self.start_line <= len(lines) else ''
+        tail = lines[self.end_line - 1][self.end_col:] if self.end_line <= len(lines) else ''
+        replaced = (head + self.text + tail).splitlines(keepends=True)
+        
+        new_lines = lines[:self.start_line - 1] + replaced + lines[self.end_line:]
+        return new_lines, len(new_lines) - len(lines)
+
+
+@dataclass
+class _StatementState:
+    """A top-level statement (or group sharing lines) and its definitions"""
+    start_line: int
+    end_line: int
+    parsed_start: int  # start_line when the definitions were computed
+    definitions: List[DefinitionFingerprint]
+    parsed: bool = True  # False for a region that failed to parse
+    
+    def shifted(self, delta: int) -> '_StatementState':
+        if not delta:
+            return self
+        return _StatementState(self.start_line + delta, self.end_line + delta,
+                               self.parsed_start, self.definitions, self.parsed)
+
+
+@dataclass
+class IncrementalState:
+    """Parse state of an edited buffer, see CodeFingerprint.parse_incremental"""
+    lines: List[str]
+    statements: List[_StatementState]
+    filename: str = '<string>'
+    reparsed_lines: int = 0  # Lines parsed by the update that produced this state
+    
+    @property
+    def code(self) -> str:
+        return ''.join(self.lines)
+    
+    @property
+    def valid(self) -> bool:
+        """Whether every region of the buffer parsed"""
+        return all(statement.parsed for statement in self.statements)
+    
+    @property
+    def definitions(self) -> List[DefinitionFingerprint]:
+        """Definitions of the whole buffer with current locations"""
+        result = []
+        for statement in self.statements:
+            shift = statement.start_line - statement.parsed_start
+            for definition in statement.definitions:
+                if shift:
+                    location = replace(definition.location,
+                                       start_line=definition.location.start_line + shift,
+                                       end_line=definition.location.end_line + shift)
+                    definition = replace(definition, location=location)
+                result.append(definition)
+        return result
+
+
+_DEFINITION_KINDS = {
+    ast.FunctionDef: 'function',
+    ast.AsyncFunctionDef: 'async_function',
+    ast.ClassDef: 'class',
+}
+
+# Python 3.13 made ast.dump() omit None and [] fields
+_DUMP_SKIPS_EMPTY = sys.version_info >= (3, 13)
+_DUMP_KEEPS_NONE = tuple(getattr(ast, name) for name in ('Constant', 'MatchSingleton')
+                         if hasattr(ast, name))
+
+
+class _HashSink:
+    """
+    One SHA-256 being fed by _AstHasher, with its own variable numbering
+    
+    A sink hashing a definition carries the definition's column, which
+    multi-line strings lose when the definition is dedented on its own.
+    """
+    
+    __slots__ = ('hasher', 'buffer', 'var_mapping', 'indent')
+    
+    def __init__(self, indent: Optional[int] = None):
+        self.hasher = hashlib.sha256()
+        self.buffer = []
+        self.var_mapping = {}
+        self.indent = indent
+    
+    def write(self, text: str):
+        self.buffer.append(text)
+        if len(self.buffer) >= 512:
+            self.flush()
+    
+    def flush(self):
+        self.hasher.update(''.join(self.buffer).encode('utf-8'))
+        self.buffer.clear()
+    
+    def hexdigest(self) -> str:
+        self.flush()
+        return self.hasher.hexdigest()[:16]
+
+
+class _TextSink:
+    """Collects streamed text instead of hashing it"""
+    
+    def __init__(self):
+        self.parts = []
+        self.var_mapping = {}
+        self.indent = None
+    
+    def write(self, text: str):
+        self.parts.append(text)
+    
+    def getvalue(self) -> str:
+        return ''.join(self.parts)
+
+
+# Lines textwrap.dedent() empties: spaces and tabs only
+_BLANK_LINE_RE = re.compile(r'[ \t]*(\r\n|\r|\n)?')
+
+
+class _LiteralDedenter:
+    """
+    Multi-line string literals as they parse from a dedented definition
+    
+    A definition fingerprinted on its own is dedented the way
+    textwrap.dedent() does it: every line loses the definition's indentation
+    and lines of only spaces and tabs come out empty, continuation lines of
+    string literals included. Literals are re-parsed from their source text
+    with those lines changed, since escapes and implicit concatenation keep
+    a value from mapping back onto its source.
+    """
+    
+    def __init__(self, source: str):
+        # Split the way the tokenizer counts lines
+        self.lines = io.StringIO(source, newline='').readlines()
+        self._dedented = {}
+    
+    def dedent(self, node: ast.AST, indent: int) -> ast.AST:
+        """The literal node as parsed from its dedented source (node itself if unchanged)"""
+        key = (id(node), indent)
+        dedented = self._dedented.get(key)
+        if dedented is None:
+            dedented = self._dedented[key] = self._parse(node, indent)
+        return dedented
+    
+    def _parse(self, node: ast.AST, indent: int) -> ast.AST:
+        lines = self.lines[node.lineno - 1:node.end_lineno]
+        if len(lines) < 2:
+            return node
+        head = lines[0].encode('utf-8', 'surrogatepass')[node.col_offset:]
+        tail = lines[-1].encode('utf-8', 'surrogatepass')[:node.end_col_offset]
+        
+        source = [head.decode('utf-8', 'surrogatepass')]
+        changed = False
+        for i, line in enumerate(lines[1:-1] + [tail.decode('utf-8', 'surrogatepass')]):
+            if i < len(lines) - 2 and _BLANK_LINE_RE.fullmatch(line):
+                # The last line ends with the closing quote, so it is never blank
+                stripped = line.lstrip(' \t')
+            elif indent and not line[:indent].strip(' \t') and len(line) > indent:
+                stripped = line[indent:]
+            else:
+                stripped = line  # Less indented: the definition cannot be dedented
+            changed = changed or stripped != line
+            source.append(stripped)
+        if not changed:
+            return node
+        try:
+            return ast.parse('(' + ''.join(source) + ')', mode='eval').body
+        except SyntaxError:
+            return node
+
+
+class _AstHasher:
+    """
+    Stream a normalized serialization of a Python AST into hash sinks
+    
+    Variable renaming and string masking are applied on the fly, so the tree
+    is never mutated and the serialization is never built as one string.
+    With ast_hash_version 1 the stream is exactly the ast.dump() text of the
+    normalized tree, which keeps fingerprints from before streaming valid.
+    
+    With ast_hash_version 3 every function and class is hashed into a sink
+    of its own, and its parent's stream carries only the resulting digest,
+    so each node is serialized and hashed once and the fingerprint of every
+    definition falls out of the same traversal. With versions 1 and 2, whose
+    streams hold the whole tree, collecting definitions opens a sink per
+    definition that every node below it is written to as well.
+    
+    In both cases a definition is hashed as the lone statement of a module
+    parsed from its dedented source, as generate() would see it, which needs
+    the source to re-read multi-line strings (see _LiteralDedenter).
+    """
+    
+    _module_affixes = {}
+    
+    def __init__(self, options: FingerprintOptions, filename: str = '<string>',
+                 source: Optional[str] = None):
+        if options.ast_hash_version not in AST_HASH_VERSIONS:
+            raise ValueError(f"ast_hash_version must be one of {AST_HASH_VERSIONS}")
+        
+        self.compact = options.ast_hash_version >= 2
+        self.merkle = options.ast_hash_version == 3
+        self.rename = options.normalize_syntax and options.ignore_variable_names
+        self.mask_strings = options.normalize_syntax and options.ignore_string_literals
+        self.filename = filename
+        self.sinks: List[_HashSink] = []
+        self.collect = False
+        self.definitions: List[DefinitionFingerprint] = []
+        self.definition_nodes: List[ast.AST] = []
+        self._scope: List[str] = []
+        self._source = source
+        self._literals: Optional[_LiteralDedenter] = None
+        self._in_literal = False
+    
+    def hash_tree(self, tree: ast.AST) -> str:
+        """Fingerprint a whole tree"""
+        sink = _HashSink()
+        self.sinks.append(sink)
+        self._emit(tree)
+        self.sinks.pop()
+        return sink.hexdigest()
+    
+    def collect_definitions(self, tree: ast.AST) -> List[DefinitionFingerprint]:
+        """Fingerprint every function and class in a tree"""
+        self.collect = True
+        self.definitions = []
+        self.definition_nodes = []
+        self._emit(tree)
+        return self.definitions
+    
+    def _module_affix(self) -> Tuple[str, str]:
+        """Text around a statement parsed as its own module"""
+        key = self.compact
+        if key not in self._module_affixes:
+            text = _TextSink()
+            self.sinks.append(text)
+            self._emit(ast.Module(body=[ast.Pass()], type_ignores=[]))
+            self.sinks.pop()
+            self._module_affixes[key] = tuple(text.getvalue().split('Pass()'))
+        return self._module_affixes[key]
+    
+    def _write(self, text: str):
+        for sink in self.sinks:
+            sink.write(text)
+    
+    def _write_name(self, name: str):
+        for sink in self.sinks:
+            mapping = sink.var_mapping
+            if name not in mapping:
+                mapping[name] = f"var_{len(mapping)}"
+            sink.write(repr(mapping[name]))
+    
+    def _emit(self, node):
+        if isinstance(node, ast.AST):
+            cls = type(node)
+            kind = _DEFINITION_KINDS.get(cls) if self.collect or self.merkle else None
+            if kind is not None:
+                self._emit_definition(node, kind)
+            elif (cls is ast.JoinedStr or cls is ast.Constant) and not self._in_literal:
+                self._emit_literal(node)
+            else:
+                self._emit_node(node)
+        elif isinstance(node, list):
+            self._write('[')
+            for i, item in enumerate(node):
+                if i:
+                    self._write(', ')
+                self._emit(item)
+            self._write(']')
+        else:
+            self._write(repr(node))
+    
+    def _emit_node(self, node: ast.AST):
+        cls = type(node)
+        if not node._fields:
+            # Contexts and operators, e.g. Load() or Add()
+            self._write(cls.__name__ + '()')
+            return
+        
+        self._write(cls.__name__ + '(')
+        separator = ''
+        for name in node._fields:
+            try:
+                value = getattr(node, name)
+            except AttributeError:
+                value = None
+                if not self.compact:
+                    continue
+            if not self.compact:
+                if value is None and getattr(cls, name, ...) is None:
+                    continue
+                if (_DUMP_SKIPS_EMPTY and (value is None or value == [])
+                        and not isinstance(node, _DUMP_KEEPS_NONE)):
+                    continue
+            
+            label = separator if self.compact else f"{separator}{name}="
+            separator = ', '
+            if value == []:
+                self._write(label + '[]')
+            elif isinstance(value, (ast.AST, list)):
+                self._write(label)
+                self._emit(value)
+            elif self.rename and cls is ast.Name and name == 'id':
+                self._write(label)
+                self._write_name(value)
+            else:
+                if self.mask_strings and cls is ast.Constant and name == 'value' \
+                        and isinstance(value, str):
+                    value = "STRING"
+                # Scalars go out together with their label
+                self._write(label + repr(value))
+        self._write(')')
+    
+    def _emit_literal(self, node: ast.AST):
+        """Emit a string once for each indentation it is hashed with"""
+        sinks = self.sinks
+        multiline = (node.end_lineno or node.lineno) > node.lineno and self._source is not None \
+            and (type(node) is ast.JoinedStr or isinstance(node.value, (str, bytes)))
+        if multiline and self.mask_strings and isinstance(getattr(node, 'value', None), str):
+            multiline = False  # Masked: the text does not matter
+        
+        self._in_literal = True
+        try:
+            if not multiline or all(sink.indent is None for sink in sinks):
+                self._emit_node(node)
+                return
+            if self._literals is None:
+                self._literals = _LiteralDedenter(self._source)
+            for indent in dict.fromkeys(sink.indent for sink in sinks):
+                self.sinks = [sink for sink in sinks if sink.indent == indent]
+                self._emit_node(node if indent is None else self._literals.dedent(node, indent))
+        finally:
+            self.sinks = sinks
+            self._in_literal = False
+    
+    def _emit_definition(self, node: ast.AST, kind: str):
+        record = None
+        if self.collect:
+            start_line = min([node.lineno] + [d.lineno for d in node.decorator_list])
+            record = DefinitionFingerprint(
+                qualified_name='.'.join(self._scope + [node.name]),
+                kind=kind,
+                fingerprint='',
+                location=FileLocation(
+                    file=self.filename,
+                    start_line=start_line,
+                    end_line=node.end_lineno or node.lineno,
+                    start_col=node.col_offset,
+                    end_col=node.end_col_offset
+                )
+            )
+            self.definitions.append(record)
+            self.definition_nodes.append(node)
+        
+        prefix, suffix = self._module_affix()
+        sink = _HashSink(node.col_offset)
+        self._scope.append(node.name if kind == 'class' else f"{node.name}.<locals>")
+        
+        if self.merkle:
+            # Only this sink sees the definition; the parent gets its digest
+            sinks, self.sinks = self.sinks, [sink]
+            self._emit_node(node)
+            self.sinks = sinks
+            token = '#' + sink.hexdigest()
+            self._write(token)
+            if record is not None:
+                module = _HashSink()
+                module.write(prefix + token + suffix)
+                record.fingerprint = module.hexdigest()
+        else:
+            sink.write(prefix)
+            self.sinks.append(sink)
+            self._emit_node(node)
+            self.sinks.pop()
+            sink.write(suffix)
+            if record is not None:
+                record.fingerprint = sink.hexdigest()
+        
+        self._scope.pop()
 
 
 class CodeFingerprint:
@@ -24,82 +555,481 @@ class CodeFingerprint:
     Generate semantic fingerprints for code blocks that survive refactoring
     """
     
-    def __init__(self, options: Optional[FingerprintOptions] = None):
+    def __init__(self, options: Optional[FingerprintOptions] = None,
+                 cache: Optional[FingerprintCache] = None,
+                 ast_cache: Optional[ASTCache] = None):
         self.options = options or FingerprintOptions()
+        self.cache = cache
+        # Parsed trees are shared with PythonParser; nothing here mutates them
+        self.ast_cache = ast_cache if ast_cache is not None else shared_ast_cache()
+        
+        if self.options.mode not in ('exact', 'simhash'):
+            raise ValueError(f"Unknown fingerprint mode: {self.options.mode}")
+        if self.options.simhash_bits not in SIMHASH_BITS:
+            raise ValueError(f"simhash_bits must be one of {SIMHASH_BITS}")
+        
+        self._options_key = options_key(self.options)
     
-    def generate(self, code: str, language: str = 'python') -> str:
+    def generate(self, code: str, language: str = 'python',
+                 content_key: Optional[str] = None) -> str:
         """
         Generate a fingerprint for a code block
         
         Args:
             code: The code to fingerprint
             language: Programming language (currently only Python supported)
+            content_key: Git blob SHA of the code, if already known; only
+                used to look up the cache (computed from code otherwise)
+            
+        Returns:
+            Hex string fingerprint (in simhash mode, the zero-padded hex
+            form of the SimHash integer)
+        """
+        if self.cache is None:
+            return self._generate(code, language)
+        
+        if content_key is None:
+            content_key = blob_sha(code.encode('utf-8', 'surrogatepass'))
+        key = (content_key, language, self._options_key, ALGORITHM_VERSION)
+        
+        fingerprint = self.cache.get(key)
+        if fingerprint is None:
+            fingerprint = self._generate(code, language)
+            self.cache.put(key, fingerprint)
+        return fingerprint
+    
+    def generate_file(self, path: str, language: Optional[str] = None,
+                      chunk_size: int = 1 << 16) -> str:
+        """
+        Generate a fingerprint for a source file
+        
+        The result equals generate() on the file's decoded content. The
+        file is memory-mapped rather than read into a bytes object; in
+        languages without an AST path (and not in simhash mode) it is
+        decoded chunk_size bytes at a time and normalized into the hash as
+        it streams, so memory stays flat for multi-megabyte generated or
+        minified files.
+        
+        Args:
+            path: File to fingerprint (UTF-8)
+            language: Programming language (default: detected from the name)
+            chunk_size: Bytes decoded at a time
             
         Returns:
             Hex string fingerprint
         """
+        if language is None:
+            language = detect_language('', path)
+        
+        if language == 'python' or self.options.mode == 'simhash':
+            # The AST and SimHash paths need the whole source anyway
+            return self.generate(read_source(path), language)
+        
+        with map_source(path) as data:
+            key = None
+            if self.cache is not None:
+                sha = hashlib.sha1(b'blob %d\0' % len(data))
+                sha.update(data)
+                key = (sha.hexdigest(), language, self._options_key, ALGORITHM_VERSION)
+                fingerprint = self.cache.get(key)
+                if fingerprint is not None:
+                    return fingerprint
+            
+            sink = hashlib.sha256()
+            normalizer = self._text_normalizer(sink, language)
+            decoder = codecs.getincrementaldecoder('utf-8')()
+            for start in range(0, len(data), chunk_size):
+                normalizer.feed(decoder.decode(data[start:start + chunk_size]))
+            normalizer.feed(decoder.decode(b'', final=True))
+            normalizer.finish()
+            fingerprint = sink.hexdigest()[:16]
+        
+        if key is not None:
+            self.cache.put(key, fingerprint)
+        return fingerprint
+    
+    def _generate(self, code: str, language: str) -> str:
+        """Generate a fingerprint without consulting the cache"""
+        if self.options.mode == 'simhash':
+            width = self.options.simhash_bits // 4
+            return format(self.generate_simhash(code, language), f'0{width}x')
+        
         if language == 'python':
             return self._fingerprint_python(code)
         else:
-            # Fallback to simple text-based fingerprinting
-            return self._fingerprint_text(code)
+            # Fallback to text-based fingerprinting
+            return self._fingerprint_text(code, language)
+    
+    def generate_many(self, codes: Iterable[str], language: str = 'python',
+                      workers: Optional[int] = None,
+                      chunksize: int = 64) -> Iterator[FingerprintResult]:
+        """
+        Fingerprint many code blocks in a process pool
+        
+        Args:
+            codes: Code blocks to fingerprint, consumed lazily
+            language: Programming language of every block
+            workers: Number of processes (default: CPU count; 1 runs inline)
+            chunksize: Blocks per work unit
+            
+        Returns:
+            Iterator of FingerprintResult in input order; a block that
+            fails carries an error instead of aborting the batch
+        """
+        items = ((i, code, language) for i, code in enumerate(codes))
+        return self._record_outcomes(
+            ordered_map(partial(_fingerprint_source, self.options, self.cache), items,
+                        workers=workers, chunksize=chunksize))
+    
+    def fingerprint_tree(self, root: str, workers: Optional[int] = None,
+                         chunksize: int = 16,
+                         languages: Optional[Iterable[str]] = None) -> Iterator[FingerprintResult]:
+        """
+        Fingerprint every recognised source file under a directory
+        
+        Files come from scanner.scan_files(), in sorted path order, so the
+        results stream back in a stable order; ignored, vendored, generated
+        and binary files are skipped.
+        
+        Args:
+            root: Directory to scan
+            workers: Number of processes (default: CPU count; 1 runs inline)
+            chunksize: Files per work unit
+            languages: Only fingerprint these languages (default: all known)
+            
+        Returns:
+            Iterator of FingerprintResult with path set; unreadable files
+            carry an error instead of aborting the run
+        """
+        files = ((index, source.path, source.language)
+                 for index, source in enumerate(scan_files(root, languages)))
+        return self._record_outcomes(
+            ordered_map(partial(_fingerprint_file, self.options, self.cache), files,
+                        workers=workers, chunksize=chunksize))
+    
+    def _record_outcomes(self, outcomes: Iterable[_WorkerOutcome]) -> Iterator[FingerprintResult]:
+        """Record worker cache activity in self.cache; evict once the batch ends"""
+        try:
+            for result, used, added in outcomes:
+                if self.cache is not None and (used or added):
+                    self.cache.record(used, added)
+                yield result
+        finally:
+            if self.cache is not None:
+                self.cache.evict()
+    
+    def fingerprint_definitions(self, code: str,
+                                filename: str = '<string>') -> List[DefinitionFingerprint]:
+        """
+        Fingerprint every function and class in Python code with one parse
+        
+        Each fingerprint equals what generate() returns for the definition's
+        own lines, decorators included, dedented by textwrap.dedent(), so
+        multi-line strings lose the definition's indentation too. With
+        ast_hash_version 3 (the default) the tree is hashed bottom-up and
+        every node is hashed once; versions 1 and 2 hash each definition
+        again for every definition around it. Qualified names may repeat,
+        e.g. for property setters, so results are a list in source order
+        rather than a dict.
+        
+        Args:
+            code: Python source
+            filename: File name recorded in each location
+            
+        Returns:
+            List of DefinitionFingerprint, outer definitions first
+            
+        Raises:
+            SyntaxError: If the code cannot be parsed
+        """
+        return self._collect_definitions(self.ast_cache.get(code), filename, code)
+    
+    def _collect_definitions(self, node: ast.AST, filename: str,
+                             source: str) -> List[DefinitionFingerprint]:
+        """Fingerprint the definitions in a tree or statement parsed from source"""
+        hasher = _AstHasher(self.options, filename, source)
+        definitions = hasher.collect_definitions(node)
+        
+        if self.options.mode == 'simhash':
+            # SimHash features are not streamed, so walk each definition again
+            width = self.options.simhash_bits // 4
+            literals = _LiteralDedenter(source)
+            for record, node in zip(definitions, hasher.definition_nodes):
+                module = ast.Module(body=[node], type_ignores=[])
+                features = self._python_features(module, literals, node.col_offset)
+                record.fingerprint = format(self._simhash(features), f'0{width}x')
+        
+        return definitions
+    
+    def parse_incremental(self, code: str,
+                          filename: str = '<string>') -> 'IncrementalState':
+        """
+        Fingerprint Python code and keep the state needed for cheap updates
+        
+        The buffer may be syntactically invalid (as it often is while
+        typing); regions that do not parse yield no definitions until a
+        later edit repairs them.
+        
+        Returns:
+            IncrementalState to pass to update_incremental()
+        """
+        lines = code.splitlines(keepends=True)
+        state = IncrementalState(lines=lines, statements=[], filename=filename,
+                                 reparsed_lines=len(lines))
+        statements = self._parse_region(lines, 1, filename)
+        if statements is None:
+            statements = [_StatementState(1, len(lines), 1, [], parsed=False)] if lines else []
+        state.statements = statements
+        return state
+    
+    def update_incremental(self, state: 'IncrementalState', edit: 'TextEdit') -> 'IncrementalState':
+        """
+        Apply an edit to an incremental state and refresh its fingerprints
+        
+        Only the top-level statements touched by the edit (plus the one just
+        before it, which an indented line could extend) are re-parsed;
+        every other statement keeps its cached definitions and is merely
+        shifted by the number of lines the edit added or removed. If that
+        region does not parse, it is widened a few statements at a time (see
+        WIDEN_STEPS) and otherwise kept as an unparsed placeholder, so the
+        state turns invalid but the rest of the buffer is never re-parsed
+        and keeps the definitions of its last successful parse.
+        
+        Args:
+            state: State from parse_incremental() or a previous update
+            edit: Replacement of a (line, column) range with new text
+            
+        Returns:
+            New IncrementalState (the given state is left untouched)
+        """
+        old_lines = state.lines
+        lines, delta = edit.apply(old_lines)
+        
+        # Keep statements wholly before the edit, except the last one (an
+        # indented line typed after it would extend it), and those after it
+        statements = state.statements
+        before_count = sum(1 for st in statements if st.end_line < edit.start_line)
+        after_index = next((i for i, st in enumerate(statements)
+                            if st.start_line > edit.end_line), len(statements))
+        before = statements[:max(before_count - 1, 0)]
+        after = statements[after_index:]
+        
+        # Re-parse everything between the untouched neighbours. A bracket or
+        # string the edit opens or closes may pair up with a neighbour, so a
+        # region that does not parse absorbs the nearest neighbour (after,
+        # then before, alternately) and is tried again; past WIDEN_STEPS or
+        # WIDEN_LINES the neighbours keep their definitions and only the
+        # edited region is kept, as an unparsed placeholder
+        kept = before, after
+        edited = None
+        reparsed = 0
+        for step in range(WIDEN_STEPS + 1):
+            region_start = before[-1].end_line + 1 if before else 1
+            region_end = (after[0].start_line - 1 if after else len(old_lines)) + delta
+            region_end = min(max(region_end, region_start - 1), len(lines))
+            
+            region = self._parse_region(lines[region_start - 1:region_end], region_start,
+                                        state.filename)
+            reparsed += region_end - region_start + 1
+            if edited is None:
+                edited = region_start, region_end
+            if region is not None or step == WIDEN_STEPS or reparsed > WIDEN_LINES:
+                break
+            if after and (step % 2 == 0 or not before):
+                after = after[1:]
+            elif before:
+                before = before[:-1]
+            else:
+                break
+        
+        if region is None:
+            before, after = kept
+            region_start, region_end = edited
+            region = [_StatementState(region_start, region_end, region_start, [],
+                                      parsed=False)] if region_end >= region_start else []
+        
+        shifted = [statement.shifted(delta) for statement in after]
+        return IncrementalState(lines, before + region + shifted, state.filename, reparsed)
+    
+    def _parse_region(self, lines: List[str], start_line: int,
+                      filename: str) -> Optional[List['_StatementState']]:
+        """Parse consecutive lines into top-level statement states (None on error)"""
+        try:
+            source = ''.join(lines)
+            tree = ast.parse(source)
+        except SyntaxError:
+            return None
+        
+        offset = start_line - 1
+        statements: List[_StatementState] = []
+        for node in tree.body:
+            decorators = getattr(node, 'decorator_list', [])
+            first = min([node.lineno] + [d.lineno for d in decorators]) + offset
+            end = (node.end_lineno or node.lineno) + offset
+            
+            definitions = [
+                replace(d, location=replace(d.location, start_line=d.location.start_line + offset,
+                                            end_line=d.location.end_line + offset))
+                for d in self._collect_definitions(node, filename, source)
+            ]
+            
+            if statements and statements[-1].end_line >= first:
+                # Statements sharing a line (a = 1; b = 2) are re-parsed together
+                merged = statements[-1]
+                merged.end_line = max(merged.end_line, end)
+                merged.definitions.extend(definitions)
+            else:
+                statements.append(_StatementState(first, end, first, definitions))
+        
+        return statements
+    
+    def generate_simhash(self, code: str, language: str = 'python') -> int:
+        """
+        Generate a locality-sensitive SimHash for a code block
+        
+        Similar code yields integers that differ in few bits, so the Hamming
+        distance between two SimHashes approximates how different the code is.
+        
+        Returns:
+            Integer of options.simhash_bits bits
+        """
+        features = None
+        if language == 'python':
+            try:
+                features = self._python_features(self.ast_cache.get(code))
+            except SyntaxError:
+                pass
+        
+        if features is None:
+            features = self._text_features(code)
+        
+        return self._simhash(features)
+    
+    def generate_winnow(self, code: str, language: str = 'python',
+                        k: int = 5, window: int = 4) -> List[WinnowFingerprint]:
+        """
+        Generate winnowed k-gram fingerprints for partial clone detection
+        
+        Unlike generate(), which only matches whole blocks, the returned
+        hashes cover overlapping runs of tokens, so code that was copied and
+        then extended still shares most of them. Feed them to a WinnowIndex.
+        
+        Args:
+            code: Source code
+            language: Programming language
+            k: Tokens per k-gram (noise threshold)
+            window: Winnowing window; every shared run of k + window - 1
+                tokens is guaranteed to match, and 1 keeps every k-gram
+            
+        Returns:
+            Selected fingerprints with the lines they span
+        """
+        tokens = tokenize_code(code, language,
+                               ignore_comments=self.options.ignore_comments,
+                               ignore_variable_names=self.options.ignore_variable_names,
+                               ignore_string_literals=self.options.ignore_string_literals)
+        return winnow(kgram_hashes(tokens, k), window)
+    
+    def _python_features(self, tree: ast.AST, literals: Optional[_LiteralDedenter] = None,
+                         indent: int = 0) -> Counter:
+        """
+        Weighted structural features of a Python AST, normalized on the fly
+        
+        With literals, multi-line strings are read as they would parse once
+        the tree's source is dedented by indent columns.
+        """
+        rename = self.options.normalize_syntax and self.options.ignore_variable_names
+        mask_strings = self.options.normalize_syntax and self.options.ignore_string_literals
+        var_mapping = {}
+        features = Counter()
+        stack = [(tree, '', '', False)]
+        
+        # Pre-order, so variables are numbered in the same order as ast.dump()
+        while stack:
+            node, parent, grandparent, in_literal = stack.pop()
+            if isinstance(node, (ast.Constant, ast.JoinedStr)) and not in_literal:
+                in_literal = True
+                if literals is not None and (node.end_lineno or node.lineno) > node.lineno:
+                    node = literals.dedent(node, indent)
+            kind = type(node).__name__
+            features[f"T:{kind}"] += 1
+            if parent:
+                features[f"E:{parent}>{kind}"] += 1
+            if grandparent:
+                features[f"P:{grandparent}>{parent}>{kind}"] += 1
+            
+            if isinstance(node, ast.Name):
+                name = node.id
+                if rename:
+                    name = var_mapping.setdefault(name, f"var_{len(var_mapping)}")
+                features[f"N:{name}"] += 1
+            elif isinstance(node, ast.Attribute):
+                features[f"A:{node.attr}"] += 1
+            elif isinstance(node, ast.Constant):
+                value = node.value
+                if mask_strings and isinstance(value, str):
+                    value = "STRING"
+                features[f"C:{value!r:.64}"] += 1
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                if not self.options.ignore_variable_names:
+                    features[f"D:{node.name}"] += 1
+            
+            children = [child for child in ast.iter_child_nodes(node)
+                        # Contexts (Load/Store) add noise without adding structure
+                        if not isinstance(child, ast.expr_context)]
+            stack.extend((child, kind, parent, in_literal) for child in reversed(children))
+        
+        return features
+    
+    def _text_features(self, code: str) -> Counter:
+        """Weighted token-trigram features for code that cannot be parsed"""
+        tokens = re.findall(r'\w+|[^\w\s]', code)
+        features = Counter(tokens)
+        features.update(' '.join(tokens[i:i + 3]) for i in range(len(tokens) - 2))
+        return features
+    
+    def _simhash(self, features: Counter) -> int:
+        """Combine weighted features into a SimHash integer"""
+        bits = self.options.simhash_bits
+        totals = [0] * bits
+        
+        for feature, weight in features.items():
+            digest = hashlib.blake2b(feature.encode('utf-8'), digest_size=bits // 8).digest()
+            value = int.from_bytes(digest, 'big')
+            for i in range(bits):
+                if value >> i & 1:
+                    totals[i] += weight
+                else:
+                    totals[i] -= weight
+        
+        simhash = 0
+        for i, total in enumerate(totals):
+            if total > 0:
+                simhash |= 1 << i
+        return simhash
     
     def _fingerprint_python(self, code: str) -> str:
         """Generate fingerprint for Python code using AST"""
         try:
-            tree = ast.parse(code)
-            normalized = self._normalize_python_ast(tree)
-            return self._hash_string(ast.dump(normalized))
+            tree = self.ast_cache.get(code)
         except SyntaxError:
             # If parsing fails, fall back to text fingerprinting
-            return self._fingerprint_text(code)
-    
-    def _normalize_python_ast(self, tree: ast.AST) -> ast.AST:
-        """Normalize Python AST for consistent fingerprinting"""
-        
-        class Normalizer(ast.NodeTransformer):
-            def __init__(self, options):
-                self.options = options
-                self.var_mapping = {}
-                self.var_counter = 0
-            
-            def visit_Name(self, node):
-                """Normalize variable names if requested"""
-                if self.options.ignore_variable_names:
-                    if node.id not in self.var_mapping:
-                        self.var_mapping[node.id] = f"var_{self.var_counter}"
-                        self.var_counter += 1
-                    node.id = self.var_mapping[node.id]
-                return node
-            
-            def visit_Constant(self, node):
-                """Normalize string literals if requested"""
-                if self.options.ignore_string_literals and isinstance(node.value, str):
-                    node.value = "STRING"
-                return node
-        
-        if self.options.normalize_syntax:
-            normalizer = Normalizer(self.options)
-            tree = normalizer.visit(tree)
-        
-        return tree
-    
-    def _fingerprint_text(self, code: str) -> str:
-        """Simple text-based fingerprinting"""
-        normalized = code
-        
-        if self.options.ignore_whitespace:
-            # Remove extra whitespace but preserve structure
-            normalized = re.sub(r'\s+', ' ', normalized)
-            normalized = normalized.strip()
-        
-        if self.options.ignore_comments:
-            # Remove common comment patterns
-            normalized = re.sub(r'#.*$', '', normalized, flags=re.MULTILINE)
-            normalized = re.sub(r'/\*.*?\*/', '', normalized, flags=re.DOTALL)
-            normalized = re.sub(r'//.*$', '', normalized, flags=re.MULTILINE)
+            return self._fingerprint_text(code, 'python')
         
-        return self._hash_string(normalized)
+        return _AstHasher(self.options, source=code).hash_tree(tree)
+    
+    def _fingerprint_text(self, code: str, language: str = 'unknown') -> str:
+        """Text-based fingerprinting with the language's comment and string rules"""
+        sink = hashlib.sha256()
+        normalizer = self._text_normalizer(sink, language)
+        normalizer.feed(code)
+        normalizer.finish()
+        return sink.hexdigest()[:16]
+    
+    def _text_normalizer(self, sink, language: str) -> TextNormalizer:
+        return TextNormalizer(sink, language,
+                              ignore_whitespace=self.options.ignore_whitespace,
+                              ignore_comments=self.options.ignore_comments)
     
     def _hash_string(self, s: str) -> str:
         """Generate SHA-256 hash of a string"""
@@ -115,24 +1045,34 @@ class CodeFingerprint:
         if fp1 == fp2:
             return 1.0
         
+        if self.options.mode == 'simhash':
+            # Bitwise Hamming similarity between the SimHash integers
+            bits = self.options.simhash_bits
+            return 1.0 - _popcount(int(fp1, 16) ^ int(fp2, 16)) / bits
+        
         # Simple character-based similarity for now
         # TODO: Implement more sophisticated similarity metrics
         matches = sum(c1 == c2 for c1, c2 in zip(fp1, fp2))
         return matches / max(len(fp1), len(fp2))
     
-    def find_similar(self, target_fp: str, fingerprints: List[str], 
+    def find_similar(self, target_fp: str,
+                    fingerprints: Union[List[str], FingerprintIndex],
                     threshold: float = 0.8) -> List[Tuple[str, float]]:
         """
         Find fingerprints similar to target
         
         Args:
             target_fp: Target fingerprint
-            fingerprints: List of fingerprints to search
+            fingerprints: List of fingerprints to search, or a
+                FingerprintIndex for sublinear lookups
             threshold: Minimum similarity (0.0 to 1.0)
             
         Returns:
             List of (fingerprint, similarity) tuples above threshold
         """
+        if isinstance(fingerprints, FingerprintIndex):
+            return fingerprints.query(target_fp, threshold)
+        
         results = []
         for fp in fingerprints:
             sim = self.similarity(target_fp, fp)
@@ -142,6 +1082,16 @@ class CodeFingerprint:
         return sorted(results, key=lambda x: x[1], reverse=True)
 
 
+# Python nodes that open a nesting level for the depth histogram
+_NESTING_NODES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.For,
+                  ast.AsyncFor, ast.While, ast.If, ast.With, ast.AsyncWith, ast.Try)
+
+_FUNCTION_KEYWORDS = {'def', 'function', 'func', 'fn'}
+_OPERATOR_PREFIXES = {'=', '!', '<', '>', '+', '-', '*', '/', '%', '&', '|', '^', ':'}
+_NOT_CALLS = {'if', 'for', 'while', 'switch', 'catch', 'return', 'function',
+              'sizeof', 'typeof', 'new'}
+
+
 class CrossLanguageFingerprint(CodeFingerprint):
     """
     Experimental: Generate fingerprints that work across languages
@@ -161,6 +1111,40 @@ class CrossLanguageFingerprint(CodeFingerprint):
         
         return self._hash_string(normalized)
     
+    def feature_vector(self, code: str, language: str) -> List[float]:
+        """
+        Fixed-width numeric description of the code's structure
+        
+        Unlike generate_universal(), nearby structures give nearby vectors
+        (3 vs 4 conditionals differ in one slot), so vectors can be ranked by
+        cosine or L1 distance, e.g. with similarity.FeatureMatrix. The layout
+        is described by STRUCTURE_COUNTS, DEPTH_BUCKETS and CALL_BUCKETS.
+        
+        Returns:
+            List of FEATURE_DIM floats
+        """
+        structure = self._extract_structure(code, language)
+        
+        vector = [0.0] * FEATURE_DIM
+        vector[0] = float(len(structure['functions']))
+        vector[1] = float(structure['loops'])
+        vector[2] = float(structure['conditionals'])
+        vector[3] = float(structure['assignments'])
+        vector[4] = float(len(structure['calls']))
+        vector[5] = float(structure['returns'])
+        
+        offset = len(STRUCTURE_COUNTS)
+        for depth in structure['depths']:
+            vector[offset + min(depth, DEPTH_BUCKETS - 1)] += 1.0
+        
+        # Hashing trick: a stable hash, since str hashes vary between runs
+        offset += DEPTH_BUCKETS
+        for name in structure['calls']:
+            digest = hashlib.blake2b(name.encode('utf-8'), digest_size=4).digest()
+            vector[offset + int.from_bytes(digest, 'big') % CALL_BUCKETS] += 1.0
+        
+        return vector
+    
     def _extract_structure(self, code: str, language: str) -> dict:
         """Extract language-agnostic structural elements"""
         structure = {
@@ -168,30 +1152,78 @@ class CrossLanguageFingerprint(CodeFingerprint):
             'loops': 0,
             'conditionals': 0,
             'assignments': 0,
-            'calls': []
+            'calls': [],
+            'returns': 0,
+            'depths': []  # Nesting depth of each function, loop and conditional
         }
         
         # Language-specific extraction
         if language == 'python':
             try:
-                tree = ast.parse(code)
-                for node in ast.walk(tree):
-                    if isinstance(node, ast.FunctionDef):
-                        structure['functions'].append(node.name)
-                    elif isinstance(node, (ast.For, ast.While)):
-                        structure['loops'] += 1
-                    elif isinstance(node, ast.If):
-                        structure['conditionals'] += 1
-                    elif isinstance(node, ast.Assign):
-                        structure['assignments'] += 1
-                    elif isinstance(node, ast.Call):
-                        if hasattr(node.func, 'id'):
-                            structure['calls'].append(node.func.id)
-            except:
-                pass
+                tree = self.ast_cache.get(code)
+            except (SyntaxError, ValueError):
+                return structure
+            
+            stack = [(tree, 0)]
+            while stack:
+                node, depth = stack.pop()
+                if isinstance(node, ast.FunctionDef):
+                    structure['functions'].append(node.name)
+                    structure['depths'].append(depth)
+                elif isinstance(node, (ast.For, ast.While)):
+                    structure['loops'] += 1
+                    structure['depths'].append(depth)
+                elif isinstance(node, ast.If):
+                    structure['conditionals'] += 1
+                    structure['depths'].append(depth)
+                elif isinstance(node, ast.Assign):
+                    structure['assignments'] += 1
+                elif isinstance(node, ast.Return):
+                    structure['returns'] += 1
+                elif isinstance(node, ast.Call):
+                    if hasattr(node.func, 'id'):
+                        structure['calls'].append(node.func.id)
+                
+                if isinstance(node, _NESTING_NODES):
+                    depth += 1
+                stack.extend((child, depth) for child in ast.iter_child_nodes(node))
+        else:
+            self._extract_token_structure(code, language, structure)
         
         return structure
     
+    def _extract_token_structure(self, code: str, language: str, structure: dict):
+        """Approximate _extract_structure for brace languages from tokens"""
+        tokens = [text for text, _ in tokenize_code(code, language)]
+        depth = 0
+        
+        for i, text in enumerate(tokens):
+            prev = tokens[i - 1] if i else ''
+            following = tokens[i + 1] if i + 1 < len(tokens) else ''
+            
+            if text == '{':
+                depth += 1
+            elif text == '}':
+                depth = max(depth - 1, 0)
+            elif text in _FUNCTION_KEYWORDS and following.isidentifier():
+                structure['functions'].append(following)
+                structure['depths'].append(depth)
+            elif text in ('for', 'while'):
+                structure['loops'] += 1
+                structure['depths'].append(depth)
+            elif text == 'if':
+                structure['conditionals'] += 1
+                structure['depths'].append(depth)
+            elif text == 'return':
+                structure['returns'] += 1
+            elif text == '=':
+                # The lexer splits operators: skip ==, !=, <=, +=, => and friends
+                if prev not in _OPERATOR_PREFIXES and following not in ('=', '>'):
+                    structure['assignments'] += 1
+            elif (following == '(' and text.isidentifier()
+                  and text not in _NOT_CALLS and prev not in _FUNCTION_KEYWORDS):
+                structure['calls'].append(text)
+    
     def _normalize_structure(self, structure: dict) -> str:
         """Create a normalized string representation of structure"""
         parts = []
@@ -4,10 +4,47 @@ Git repository operations and analysis
 
 import re
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional, Tuple
+from typing import TYPE_CHECKING, List, Dict, Iterable, Iterator, Optional, Tuple
 from dataclasses import dataclass
 import subprocess
+import tempfile
 import json
+from contextlib import closing
+
+if TYPE_CHECKING:
+    from .git_index import CommitIndex
+
+
+# Keywords find_repeated_changes looks for in commit messages
+_CHANGE_KEYWORDS = ('fix', 'bug', 'update', 'refactor', 'optimize',
+                    'null', 'error', 'crash', 'performance')
+
+
+class GitError(RuntimeError):
+    """
+    A git command failed
+    
+    Attributes:
+        command: Full command line
+        returncode: Exit status, or None if git was killed
+        stderr: What git printed on stderr
+    """
+    
+    def __init__(self, command: List[str], returncode: Optional[int], stderr: str,
+                 message: Optional[str] = None):
+        super().__init__(message or f"Git command failed: {stderr}")
+        self.command = command
+        self.returncode = returncode
+        self.stderr = stderr
+
+
+class GitTimeoutError(GitError):
+    """A git command ran longer than its timeout and was killed"""
+    
+    def __init__(self, command: List[str], timeout: float):
+        super().__init__(command, None, '',
+                         f"Git command timed out after {timeout:g}s: {' '.join(command)}")
+        self.timeout = timeout
 
 
 @dataclass
@@ -22,10 +59,14 @@ class GitDiff:
 class GitAnalyzer:
     """
     Efficient Git repository analysis
+    
+    With a CommitIndex, get_commits, find_fix_patterns and
+    find_repeated_changes answer from the index instead of running git log.
     """
     
-    def __init__(self, repo_path: str):
+    def __init__(self, repo_path: str, commit_index: Optional['CommitIndex'] = None):
         self.repo_path = repo_path
+        self.commit_index = commit_index
     
     def _run_git_command(self, args: List[str]) -> str:
         """Run a git command and return output"""
@@ -34,7 +75,58 @@ class GitAnalyzer:
             result = subprocess.run(cmd, capture_output=True, text=True, check=True)
             return result.stdout
         except subprocess.CalledProcessError as e:
-            raise RuntimeError(f"Git command failed: {e.stderr}")
+            raise GitError(cmd, e.returncode, e.stderr)
+    
+    def _stream_git_command(self, args: List[str],
+                            input: Optional[Iterable[str]] = None,
+                            separator: str = '\n') -> Iterator[str]:
+        """
+        Run a git command and yield its output record by record as it arrives
+        
+        Args:
+            args: Git arguments
+            input: Lines written to the command's stdin (for --stdin)
+            separator: Record terminator, '\n' for lines or '\0' with -z
+            
+        Returns:
+            Iterator of records without their terminator; stopping early
+            kills the command
+            
+        Raises:
+            GitError: If the command fails
+        """
+        cmd = ['git', '-C', self.repo_path] + args
+        # stderr goes to a file so a chatty command cannot block on a full pipe
+        with tempfile.TemporaryFile() as stderr:
+            process = subprocess.Popen(
+                cmd, stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+                stdout=subprocess.PIPE, stderr=stderr,
+                encoding='utf-8', errors='replace')
+            finished = False
+            try:
+                if input is not None:
+                    # Commands reading revisions from stdin consume all of it
+                    # before writing anything, so this cannot deadlock
+                    try:
+                        for line in input:
+                            process.stdin.write(line + '\n')
+                        process.stdin.close()
+                    except BrokenPipeError:
+                        pass  # git exited early; its status says why
+                if separator == '\n':
+                    for line in process.stdout:
+                        yield line[:-1] if line.endswith('\n') else line
+                else:
+                    yield from _split_records(process.stdout, separator)
+                finished = True
+            finally:
+                if not finished and process.poll() is None:
+                    process.kill()
+                process.stdout.close()
+                returncode = process.wait()
+            if finished and returncode != 0:
+                stderr.seek(0)
+                raise GitError(cmd, returncode, stderr.read().decode('utf-8', 'replace'))
     
     def get_commits(self, since: Optional[str] = None, 
                    until: Optional[str] = None,
@@ -50,31 +142,37 @@ class GitAnalyzer:
         Returns:
             List of commit dictionaries
         """
-        args = ['log', '--format=format:%H|%an|%ae|%at|%s', f'--max-count={max_count}']
-        
-        if since:
-            args.append(f'--since={since}')
-        if until:
-            args.append(f'--until={until}')
+        if self.commit_index is not None:
+            return self.commit_index.commits(since, until, max_count)
+        return list(self.iter_commits(since, until, max_count))
+    
+    def iter_commits(self, since: Optional[str] = None,
+                     until: Optional[str] = None,
+                     max_count: Optional[int] = None,
+                     grep: Optional[str] = None) -> Iterator[Dict]:
+        """
+        Stream commits from the repository, newest first
         
-        output = self._run_git_command(args)
-        commits = []
+        Commits are parsed as git writes them, so memory does not depend on
+        the length of the history. Stopping early (break, close(), or
+        dropping the iterator) kills the git process.
         
-        for line in output.strip().split('\n'):
-            if not line:
-                continue
+        Args:
+            since: Start date (e.g., '3 months ago', '2024-01-01')
+            until: End date
+            max_count: Maximum number of commits to return (default: all)
+            grep: Only commits whose message matches this extended regular
+                expression, case-insensitively
             
-            parts = line.split('|', 4)
-            if len(parts) >= 5:
-                commits.append({
-                    'hash': parts[0],
-                    'author_name': parts[1],
-                    'author_email': parts[2],
-                    'timestamp': datetime.fromtimestamp(int(parts[3])),
-                    'message': parts[4]
-                })
-        
-        return commits
+        Returns:
+            Iterator of commit dictionaries
+        """
+        args = _commits_args(since, until, max_count, grep)
+        with closing(self._stream_git_command(args)) as lines:
+            for line in lines:
+                commit = _parse_commit(line)
+                if commit is not None:
+                    yield commit
     
     def get_file_changes(self, file_path: str, max_commits: int = 100) -> List[Dict]:
         """
@@ -87,44 +185,35 @@ class GitAnalyzer:
         Returns:
             List of changes with commit info and diffs
         """
-        args = ['log', '--follow', f'--max-count={max_commits}', 
-                '--format=format:%H|%at|%s', '-p', '--', file_path]
+        return list(self.iter_file_changes(file_path, max_commits))
+    
+    def iter_file_changes(self, file_path: str,
+                          max_commits: Optional[int] = None) -> Iterator[Dict]:
+        """
+        Stream the history of changes for a specific file, newest first
         
-        output = self._run_git_command(args)
-        changes = []
-        current_commit = None
-        current_diff = []
+        Renames are followed. Only one commit's diff is held at a time;
+        stopping early kills the git process.
         
-        for line in output.split('\n'):
-            if line.startswith('commit '):
-                if current_commit and current_diff:
-                    current_commit['diff'] = '\n'.join(current_diff)
-                    changes.append(current_commit)
-                    current_diff = []
-                
-                # Skip the 'commit' line, next line has our format
-                continue
-            
-            elif '|' in line and not line.startswith(('+++', '---', '@@')):
-                # This is our formatted commit info
-                parts = line.split('|', 2)
-                if len(parts) >= 3:
-                    current_commit = {
-                        'hash': parts[0],
-                        'timestamp': datetime.fromtimestamp(int(parts[1])),
-                        'message': parts[2],
-                        'file': file_path
-                    }
+        Args:
+            file_path: Path to the file
+            max_commits: Maximum number of commits to analyze (default: all)
             
-            elif current_commit:
-                current_diff.append(line)
+        Returns:
+            Iterator of changes with commit info and diffs; commits that
+            show no diff for the file (such as merges) are skipped
+        """
+        parser = _FileChangeParser(file_path)
+        with closing(self._stream_git_command(_file_changes_args(file_path, max_commits))) as lines:
+            for line in lines:
+                change = parser.feed(line)
+                if change is not None:
+                    yield change
         
         # Don't forget the last commit
-        if current_commit and current_diff:
-            current_commit['diff'] = '\n'.join(current_diff)
-            changes.append(current_commit)
-        
-        return changes
+        change = parser.close()
+        if change is not None:
+            yield change
     
     def find_fix_patterns(self, keywords: Optional[List[str]] = None) -> List[Dict]:
         """
@@ -137,29 +226,22 @@ class GitAnalyzer:
             List of commits that appear to be fixes
         """
         if keywords is None:
-            keywords = ['fix', 'bug', 'patch', 'resolve', 'correct', 'repair']
-        
-        pattern = '|'.join(keywords)
-        args = ['log', '--grep', pattern, '-i', 
-                '--format=format:%H|%at|%s', '--max-count=500']
+            keywords = FIX_KEYWORDS
         
-        output = self._run_git_command(args)
-        fixes = []
-        
-        for line in output.strip().split('\n'):
-            if not line:
-                continue
-            
-            parts = line.split('|', 2)
-            if len(parts) >= 3:
-                fixes.append({
-                    'hash': parts[0],
-                    'timestamp': datetime.fromtimestamp(int(parts[1])),
-                    'message': parts[2],
-                    'type': self._classify_fix(parts[2])
-                })
+        if self.commit_index is not None:
+            commits = self.commit_index.commits(max_count=500, keywords=keywords)
+        else:
+            commits = self.iter_commits(max_count=500, grep=_keywords_pattern(keywords))
         
-        return fixes
+        return [self._fix_record(commit) for commit in commits]
+    
+    def _fix_record(self, commit: Dict) -> Dict:
+        return {
+            'hash': commit['hash'],
+            'timestamp': commit['timestamp'],
+            'message': commit['message'],
+            'type': self._classify_fix(commit['message'])
+        }
     
     def _classify_fix(self, message: str) -> str:
         """Classify the type of fix based on commit message"""
@@ -188,114 +270,344 @@ class GitAnalyzer:
         Returns:
             List of GitDiff objects
         """
-        args = ['show', '--format=', '--numstat', commit_hash]
-        output = self._run_git_command(args)
-        
-        diffs = []
-        for line in output.strip().split('\n'):
-            if not line:
-                continue
-            
-            parts = line.split('\t')
-            if len(parts) >= 3:
-                try:
-                    additions = int(parts[0]) if parts[0] != '-' else 0
-                    deletions = int(parts[1]) if parts[1] != '-' else 0
-                    file_path = parts[2]
-                    
-                    # Get the actual diff hunks
-                    hunks = self._get_hunks(commit_hash, file_path)
-                    
-                    diffs.append(GitDiff(
-                        file=file_path,
-                        additions=additions,
-                        deletions=deletions,
-                        hunks=hunks
-                    ))
-                except ValueError:
-                    continue
-        
-        return diffs
+        for diffs in self.get_diffs([commit_hash]).values():
+            return diffs
+        return []
     
-    def _get_hunks(self, commit_hash: str, file_path: str) -> List[str]:
-        """Get the diff hunks for a specific file in a commit"""
-        args = ['show', commit_hash, '--', file_path]
-        output = self._run_git_command(args)
-        
-        hunks = []
-        current_hunk = []
-        
-        for line in output.split('\n'):
-            if line.startswith('@@'):
-                if current_hunk:
-                    hunks.append('\n'.join(current_hunk))
-                current_hunk = [line]
-            elif current_hunk:
-                current_hunk.append(line)
+    def get_diffs(self, commits: Iterable[str]) -> Dict[str, List[GitDiff]]:
+        """
+        Get the diffs of many commits from a single git process
         
-        if current_hunk:
-            hunks.append('\n'.join(current_hunk))
+        Line counts and hunks of every file come from one streamed
+        ``git log --no-walk -p --numstat`` run. Merge commits are diffed
+        against their first parent.
         
-        return hunks
+        Args:
+            commits: Commit hashes or other revisions
+            
+        Returns:
+            Dict from full commit hash to its list of GitDiff objects,
+            in the order the commits were given
+        """
+        commits = list(commits)
+        if not commits:
+            return {}
+        with closing(self._stream_git_command(_DIFFS_ARGS, input=commits)) as lines:
+            return dict(_parse_diff_stream(lines))
     
-    def find_repeated_changes(self, min_occurrences: int = 2) -> List[Dict]:
+    def find_repeated_changes(self, min_occurrences: int = 2,
+                              since: Optional[str] = None,
+                              until: Optional[str] = None,
+                              max_count: Optional[int] = None,
+                              max_messages: Optional[int] = 100) -> List[Dict]:
         """
         Find files that have been changed multiple times for similar reasons
         
+        Commit subjects and touched files come from one streamed
+        ``git log --name-only -z`` and are tallied as they arrive, so memory
+        depends on the number of files, not on the length of the history.
+        
         Args:
             min_occurrences: Minimum number of similar changes
+            since: Start date (e.g., '3 months ago', '2024-01-01')
+            until: End date
+            max_count: Maximum number of commits to read (default: all)
+            max_messages: Messages kept per file and pattern (None keeps all)
             
         Returns:
             List of patterns with their occurrences
         """
-        # Get all commits
-        commits = self.get_commits(max_count=1000)
-        
-        # Group by files and look for patterns
-        file_changes = {}
-        
-        for commit in commits:
-            # Get files changed in this commit
-            args = ['show', '--name-only', '--format=', commit['hash']]
-            output = self._run_git_command(args)
-            
-            for file_path in output.strip().split('\n'):
-                if not file_path:
-                    continue
-                
-                if file_path not in file_changes:
-                    file_changes[file_path] = []
-                
-                file_changes[file_path].append(commit['message'])
+        if self.commit_index is not None:
+            with closing(self.commit_index.touched_files(since, until, max_count)) as changes:
+                return _tally_repeated_changes(changes, min_occurrences, max_messages)
         
-        # Find repeated patterns
-        repeated = []
-        for file_path, messages in file_changes.items():
-            if len(messages) >= min_occurrences:
-                # Look for similar messages
-                patterns = self._find_message_patterns(messages)
-                for pattern, count in patterns.items():
-                    if count >= min_occurrences:
-                        repeated.append({
-                            'file': file_path,
-                            'pattern': pattern,
-                            'occurrences': count,
-                            'messages': [m for m in messages if pattern.lower() in m.lower()]
-                        })
-        
-        return repeated
+        args = _repeated_changes_args(since, until, max_count)
+        with closing(self._stream_git_command(args, separator='\0')) as records:
+            return _tally_repeated_changes(_iter_touched_files(records),
+                                           min_occurrences, max_messages)
     
     def _find_message_patterns(self, messages: List[str]) -> Dict[str, int]:
         """Find common patterns in commit messages"""
         patterns = {}
         
-        # Common keywords to look for
-        keywords = ['fix', 'bug', 'update', 'refactor', 'optimize', 
-                   'null', 'error', 'crash', 'performance']
-        
-        for keyword in keywords:
+        for keyword in _CHANGE_KEYWORDS:
             count = sum(1 for m in messages if keyword in m.lower())
             if count > 0:
                 patterns[keyword] = count
         
-        return patterns
\ No newline at end of file
+        return patterns
+
+
+# Shared with AsyncGitAnalyzer: command lines, and parsers that are fed one
+# record at a time so they work on blocking and asyncio streams alike
+
+def _commits_args(since: Optional[str], until: Optional[str],
+                  max_count: Optional[int], grep: Optional[str]) -> List[str]:
+    args = ['log', '--format=format:%H%x00%an%x00%ae%x00%at%x00%s']
+    if max_count is not None:
+        args.append(f'--max-count={max_count}')
+    if since:
+        args.append(f'--since={since}')
+    if until:
+        args.append(f'--until={until}')
+    if grep:
+        args.extend(['-E', '-i', f'--grep={grep}'])
+    return args
+
+
+def _file_changes_args(file_path: str, max_commits: Optional[int]) -> List[str]:
+    args = ['log', '--follow', '--format=format:%x00%H%x00%at%x00%s', '-p']
+    if max_commits is not None:
+        args.append(f'--max-count={max_commits}')
+    return args + ['--', file_path]
+
+
+def _repeated_changes_args(since: Optional[str], until: Optional[str],
+                           max_count: Optional[int]) -> List[str]:
+    args = ['log', '--name-only', '-z', '--format=format:%x01%s']
+    if max_count is not None:
+        args.append(f'--max-count={max_count}')
+    if since:
+        args.append(f'--since={since}')
+    if until:
+        args.append(f'--until={until}')
+    return args
+
+
+# Revisions are written to stdin, one per line
+_DIFFS_ARGS = ['log', '--no-walk=unsorted', '--stdin', '--format=format:%x00%H',
+               '--numstat', '-p', '--diff-merges=first-parent']
+
+# Default keywords of find_fix_patterns
+FIX_KEYWORDS = ['fix', 'bug', 'patch', 'resolve', 'correct', 'repair']
+
+
+def _keywords_pattern(keywords: Iterable[str]) -> str:
+    """Extended regular expression matching any of the keywords literally"""
+    return '|'.join(re.escape(keyword) for keyword in keywords)
+
+
+def _parse_commit(line: str) -> Optional[Dict]:
+    """One line of _commits_args() output"""
+    parts = line.split('\0', 4)
+    if len(parts) < 5:
+        return None
+    
+    return {
+        'hash': parts[0],
+        'author_name': parts[1],
+        'author_email': parts[2],
+        'timestamp': datetime.fromtimestamp(int(parts[3])),
+        'message': parts[4]
+    }
+
+
+class _FileChangeParser:
+    """Lines of _file_changes_args() output in, one change per commit out"""
+    
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self._commit: Optional[Dict] = None
+        self._diff: List[str] = []
+    
+    def feed(self, line: str) -> Optional[Dict]:
+        """Returns the previous commit's change when a new commit starts"""
+        if line.startswith('\0'):
+            # Header line; a diff line always starts with a prefix or 'diff'
+            change = self.close()
+            parts = line[1:].split('\0', 2)
+            self._commit = {
+                'hash': parts[0],
+                'timestamp': datetime.fromtimestamp(int(parts[1])),
+                'message': parts[2] if len(parts) > 2 else '',
+                'file': self.file_path
+            }
+            return change
+        if self._commit is not None:
+            self._diff.append(line)
+        return None
+    
+    def close(self) -> Optional[Dict]:
+        """The pending change, or None if there is none or it has no diff"""
+        commit, diff_lines = self._commit, self._diff
+        self._commit, self._diff = None, []
+        if commit is None:
+            return None
+        
+        while diff_lines and not diff_lines[-1]:
+            diff_lines.pop()
+        start = 0
+        while start < len(diff_lines) and not diff_lines[start]:
+            start += 1
+        if start == len(diff_lines):
+            return None
+        commit['diff'] = '\n'.join(diff_lines[start:])
+        return commit
+
+
+class _DiffParser:
+    """
+    Lines of ``git log --format=format:%x00%H --numstat -p`` in,
+    (commit hash, diffs) out
+    
+    Each commit's numstat block lists its files in the same order as the
+    ``diff --git`` sections of its patch, so hunks are attributed by
+    position rather than by re-parsing (possibly renamed) paths.
+    """
+    
+    def __init__(self):
+        self._commit: Optional[str] = None
+        self._diffs: List[GitDiff] = []
+        self._section = -1
+        self._hunk: Optional[List[str]] = None
+    
+    def feed(self, line: str) -> Optional[Tuple[str, List[GitDiff]]]:
+        """Returns the previous commit when a new one starts"""
+        if line.startswith('\0'):
+            done = self.close()
+            self._commit = line[1:]
+            return done
+        if line.startswith('diff --git '):
+            self._close_hunk()
+            self._section += 1
+        elif self._section < 0:
+            parts = line.split('\t', 2)
+            if len(parts) == 3:
+                try:
+                    additions = int(parts[0]) if parts[0] != '-' else 0
+                    deletions = int(parts[1]) if parts[1] != '-' else 0
+                except ValueError:
+                    return None
+                self._diffs.append(GitDiff(file=parts[2], additions=additions,
+                                           deletions=deletions, hunks=[]))
+        elif line.startswith('@@'):
+            self._close_hunk()
+            self._hunk = [line]
+        elif self._hunk is not None and line:
+            # Hunk lines always carry a prefix; empty lines separate commits
+            self._hunk.append(line)
+        return None
+    
+    def close(self) -> Optional[Tuple[str, List[GitDiff]]]:
+        """The pending commit, if any"""
+        self._close_hunk()
+        done = (self._commit, self._diffs) if self._commit is not None else None
+        self._commit, self._diffs, self._section = None, [], -1
+        return done
+    
+    def _close_hunk(self):
+        if self._hunk is not None and 0 <= self._section < len(self._diffs):
+            self._diffs[self._section].hunks.append('\n'.join(self._hunk))
+        self._hunk = None
+
+
+class _TouchedFilesParser:
+    """Records of _repeated_changes_args() output in, (subject, files) per commit out"""
+    
+    def __init__(self):
+        self._message: Optional[str] = None
+        self._files: List[str] = []
+    
+    def feed(self, record: str) -> Optional[Tuple[str, List[str]]]:
+        """Returns the previous commit when a new one starts"""
+        done = None
+        if record.startswith('\x01'):
+            done = self.close()
+            # With -z the first file name follows the subject on a new line
+            self._message, _, record = record[1:].partition('\n')
+        if record and self._message is not None:
+            self._files.append(record)
+        return done
+    
+    def close(self) -> Optional[Tuple[str, List[str]]]:
+        done = (self._message, self._files) if self._message is not None else None
+        self._message, self._files = None, []
+        return done
+
+
+class _RepeatedChangesTally:
+    """
+    Keyword matches per file, counted over (message, files) pairs as they arrive
+    
+    Each message is matched against _CHANGE_KEYWORDS once, so memory
+    grows with the number of files, not with the length of the history.
+    """
+    
+    def __init__(self, min_occurrences: int, max_messages: Optional[int]):
+        self.min_occurrences = min_occurrences
+        self.max_messages = max_messages
+        # file -> keyword -> [count, messages], in order of first appearance
+        self._files: Dict[str, Dict[str, list]] = {}
+    
+    def add(self, message: str, files: List[str]):
+        message_lower = message.lower()
+        keywords = [k for k in _CHANGE_KEYWORDS if k in message_lower]
+        
+        for file_path in files:
+            patterns = self._files.get(file_path)
+            if patterns is None:
+                self._files[file_path] = patterns = {}
+            for keyword in keywords:
+                entry = patterns.get(keyword)
+                if entry is None:
+                    patterns[keyword] = entry = [0, []]
+                entry[0] += 1
+                if self.max_messages is None or len(entry[1]) < self.max_messages:
+                    entry[1].append(message)
+    
+    def result(self) -> List[Dict]:
+        # Keywords in the order _find_message_patterns reports them
+        repeated = []
+        for file_path, patterns in self._files.items():
+            for keyword in _CHANGE_KEYWORDS:
+                entry = patterns.get(keyword)
+                if entry is not None and entry[0] >= self.min_occurrences:
+                    repeated.append({
+                        'file': file_path,
+                        'pattern': keyword,
+                        'occurrences': entry[0],
+                        'messages': entry[1]
+                    })
+        return repeated
+
+
+def _iter_touched_files(records: Iterable[str]) -> Iterator[Tuple[str, List[str]]]:
+    parser = _TouchedFilesParser()
+    for record in records:
+        done = parser.feed(record)
+        if done is not None:
+            yield done
+    done = parser.close()
+    if done is not None:
+        yield done
+
+
+def _tally_repeated_changes(changes: Iterable[Tuple[str, List[str]]],
+                            min_occurrences: int,
+                            max_messages: Optional[int]) -> List[Dict]:
+    tally = _RepeatedChangesTally(min_occurrences, max_messages)
+    for message, files in changes:
+        tally.add(message, files)
+    return tally.result()
+
+
+def _parse_diff_stream(lines: Iterable[str]) -> Iterator[Tuple[str, List[GitDiff]]]:
+    parser = _DiffParser()
+    for line in lines:
+        done = parser.feed(line)
+        if done is not None:
+            yield done
+    done = parser.close()
+    if done is not None:
+        yield done
+
+
+def _split_records(stream, separator: str, size: int = 1 << 16) -> Iterator[str]:
+    """Split a text stream on a separator, reading it in blocks"""
+    pending = ''
+    for block in iter(lambda: stream.read(size), ''):
+        records = (pending + block).split(separator)
+        pending = records.pop()
+        yield from records
+    if pending:
+        yield pending
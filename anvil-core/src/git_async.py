@@ -0,0 +1,388 @@
+"""
+asyncio counterpart of GitAnalyzer
+
+Services that analyse many repositories at once, or serve git queries
+from an event loop, cannot afford a blocking subprocess call per query.
+AsyncGitAnalyzer offers the GitAnalyzer API as coroutines and async
+iterators on top of ``asyncio.create_subprocess_exec``, sharing its
+command lines and parsers, with three additions:
+
+- A semaphore bounds how many git processes run at once. Pass the same
+  one to several analyzers to bound them together.
+- Every command has a timeout; when it expires, or when the awaiting task
+  is cancelled, the git process is killed and reaped before the error
+  propagates.
+- Failures raise GitError (GitTimeoutError for timeouts), carrying the
+  command line, exit status and stderr.
+
+Usage:
+    analyzer = AsyncGitAnalyzer(repo_path, max_concurrency=4, timeout=30)
+    commits, fixes = await asyncio.gather(analyzer.get_commits(),
+                                          analyzer.find_fix_patterns())
+"""
+
+import asyncio
+import codecs
+import io
+from functools import partial
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Iterable, List, Optional
+
+from .git import (
+    FIX_KEYWORDS,
+    GitAnalyzer,
+    GitDiff,
+    GitError,
+    GitTimeoutError,
+    _DIFFS_ARGS,
+    _DiffParser,
+    _FileChangeParser,
+    _RepeatedChangesTally,
+    _TouchedFilesParser,
+    _commits_args,
+    _file_changes_args,
+    _keywords_pattern,
+    _parse_commit,
+    _repeated_changes_args,
+)
+
+if TYPE_CHECKING:
+    from .git_index import CommitIndex
+
+
+# Default number of git processes an analyzer runs at once
+MAX_CONCURRENCY = 4
+
+# Default per-command timeout in seconds
+DEFAULT_TIMEOUT = 60.0
+
+# Bytes read from git's stdout at a time
+_CHUNK_BYTES = 1 << 16
+
+
+def _decoder() -> io.IncrementalNewlineDecoder:
+    """Decodes git output the way GitAnalyzer's text-mode pipes do"""
+    return io.IncrementalNewlineDecoder(
+        codecs.getincrementaldecoder('utf-8')('replace'), translate=True)
+
+
+class AsyncGitAnalyzer:
+    """
+    GitAnalyzer for asyncio: bounded concurrency, timeouts and cancellation
+
+    Methods mirror GitAnalyzer's and return the same values; the iter_*
+    methods are async generators. An async generator keeps its git process
+    (and its concurrency slot) until it is exhausted or closed with
+    ``aclose()``; closing it early kills the process. ``async for`` does not
+    close a generator it leaves by break or exception, so wrap early exits
+    in ``try``/``finally: await it.aclose()`` (or contextlib.aclosing).
+
+    Args:
+        repo_path: Repository to analyse
+        max_concurrency: Git processes this analyzer runs at once; ignored
+            when ``semaphore`` is given
+        timeout: Seconds each command may run, None for no limit. For
+            streamed commands this covers the whole command, including the
+            time the consumer spends between records.
+        semaphore: asyncio.Semaphore shared with other analyzers
+        commit_index: CommitIndex to answer history queries from; its
+            queries run in the default executor
+    """
+
+    def __init__(self, repo_path: str, max_concurrency: int = MAX_CONCURRENCY,
+                 timeout: Optional[float] = DEFAULT_TIMEOUT,
+                 semaphore: Optional[asyncio.Semaphore] = None,
+                 commit_index: Optional['CommitIndex'] = None):
+        if semaphore is None and max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        if timeout is not None and timeout <= 0:
+            raise ValueError("timeout must be positive")
+        self.repo_path = repo_path
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.commit_index = commit_index
+        # Created on first use: before Python 3.10 a semaphore binds to the
+        # event loop current at construction
+        self._semaphore = semaphore
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def _run_git_command(self, args: List[str],
+                               input: Optional[Iterable[str]] = None) -> str:
+        """
+        Run a git command and return its output
+
+        Args:
+            args: Git arguments
+            input: Lines written to the command's stdin (for --stdin)
+
+        Raises:
+            GitError: If the command fails
+            GitTimeoutError: If it runs longer than ``timeout``
+        """
+        return ''.join([text async for text in self._read_git_command(args, input)])
+
+    async def _stream_git_command(self, args: List[str],
+                                  input: Optional[Iterable[str]] = None,
+                                  separator: str = '\n') -> AsyncIterator[str]:
+        """
+        Run a git command and yield its output record by record as it arrives
+
+        Args:
+            args: Git arguments
+            input: Lines written to the command's stdin (for --stdin)
+            separator: Record terminator, '\n' for lines or '\0' with -z
+
+        Returns:
+            Async iterator of records without their terminator; closing it
+            early kills the command
+
+        Raises:
+            GitError: If the command fails
+            GitTimeoutError: If it runs longer than ``timeout``
+        """
+        blocks = self._read_git_command(args, input)
+        pending = ''
+        try:
+            async for text in blocks:
+                records = (pending + text).split(separator)
+                pending = records.pop()
+                for record in records:
+                    yield record
+        finally:
+            await blocks.aclose()
+        if pending:
+            yield pending
+
+    async def _read_git_command(self, args: List[str],
+                                input: Optional[Iterable[str]]) -> AsyncIterator[str]:
+        """Run a git command under the semaphore and timeout, yielding decoded output blocks"""
+        cmd = ['git', '-C', self.repo_path] + args
+
+        async with self.semaphore:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.timeout if self.timeout is not None else None
+            process = await asyncio.create_subprocess_exec(
+                *cmd, stdin=asyncio.subprocess.PIPE if input is not None else asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+            # Drain stderr alongside stdout so a chatty command cannot block on a full pipe
+            stderr = asyncio.ensure_future(process.stderr.read())
+            writer = asyncio.ensure_future(_write_input(process.stdin, input)) \
+                if input is not None else None
+            finished = False
+            try:
+                decoder = _decoder()
+                while True:
+                    read = process.stdout.read(_CHUNK_BYTES)
+                    if deadline is not None:
+                        try:
+                            chunk = await asyncio.wait_for(read, max(deadline - loop.time(), 0))
+                        except asyncio.TimeoutError:
+                            raise GitTimeoutError(cmd, self.timeout) from None
+                    else:
+                        chunk = await read
+
+                    text = decoder.decode(chunk, final=not chunk)
+                    if text:
+                        yield text
+                    if not chunk:
+                        break
+                finished = True
+            finally:
+                if not finished:
+                    # Timed out, cancelled or closed early: don't leave git running
+                    if process.returncode is None:
+                        process.kill()
+                    if writer is not None:
+                        writer.cancel()
+                        process.stdin.close()
+                    # wait() also waits for the pipes to close, and a full pipe
+                    # nobody reads never does, so drain what git left behind
+                    await process.stdout.read()
+                returncode = await process.wait()
+            if returncode != 0:
+                message = await stderr
+                raise GitError(cmd, returncode, message.decode('utf-8', 'replace'))
+
+    async def _from_index(self, method: str, *args, **kwargs):
+        """Answer a query from the CommitIndex through GitAnalyzer, in the default executor"""
+        query = getattr(GitAnalyzer(self.repo_path, self.commit_index), method)
+        return await asyncio.get_running_loop().run_in_executor(
+            None, partial(query, *args, **kwargs))
+
+    async def get_commits(self, since: Optional[str] = None,
+                          until: Optional[str] = None,
+                          max_count: int = 1000) -> List[Dict]:
+        """
+        Get commits in date range
+
+        Args:
+            since: Start date (e.g., '3 months ago')
+            until: End date
+            max_count: Maximum number of commits
+
+        Returns:
+            List of commit dictionaries
+        """
+        if self.commit_index is not None:
+            return await self._from_index('get_commits', since, until, max_count)
+        return [commit async for commit in self.iter_commits(since, until, max_count)]
+
+    async def iter_commits(self, since: Optional[str] = None,
+                           until: Optional[str] = None,
+                           max_count: Optional[int] = None,
+                           grep: Optional[str] = None) -> AsyncIterator[Dict]:
+        """
+        Stream commits newest first, as git produces them
+
+        See GitAnalyzer.iter_commits.
+        """
+        lines = self._stream_git_command(_commits_args(since, until, max_count, grep))
+        try:
+            async for line in lines:
+                commit = _parse_commit(line)
+                if commit is not None:
+                    yield commit
+        finally:
+            await lines.aclose()
+
+    async def get_file_changes(self, file_path: str, max_commits: int = 100) -> List[Dict]:
+        """
+        Get change history for a specific file
+
+        Args:
+            file_path: Path to file relative to repo root
+            max_commits: Maximum number of commits to analyze
+
+        Returns:
+            List of changes with diffs
+        """
+        return [change async for change in self.iter_file_changes(file_path, max_commits)]
+
+    async def iter_file_changes(self, file_path: str,
+                                max_commits: Optional[int] = None) -> AsyncIterator[Dict]:
+        """
+        Stream a file's changes newest first, following renames
+
+        See GitAnalyzer.iter_file_changes.
+        """
+        parser = _FileChangeParser(file_path)
+        lines = self._stream_git_command(_file_changes_args(file_path, max_commits))
+        try:
+            async for line in lines:
+                change = parser.feed(line)
+                if change is not None:
+                    yield change
+        finally:
+            await lines.aclose()
+
+        # Don't forget the last commit
+        change = parser.close()
+        if change is not None:
+            yield change
+
+    async def find_fix_patterns(self, keywords: Optional[List[str]] = None) -> List[Dict]:
+        """
+        Find bug fix patterns in commit history
+
+        Args:
+            keywords: Keywords to search for in commit messages
+
+        Returns:
+            List of fix patterns
+        """
+        if keywords is None:
+            keywords = FIX_KEYWORDS
+        if self.commit_index is not None:
+            return await self._from_index('find_fix_patterns', keywords)
+
+        commits = [commit async for commit in
+                   self.iter_commits(max_count=500, grep=_keywords_pattern(keywords))]
+        return [self._fix_record(commit) for commit in commits]
+
+    _fix_record = GitAnalyzer._fix_record
+    _classify_fix = GitAnalyzer._classify_fix
+    _find_message_patterns = GitAnalyzer._find_message_patterns
+
+    async def get_diff(self, commit_hash: str) -> List[GitDiff]:
+        """
+        Get diff for a specific commit
+
+        Args:
+            commit_hash: Commit hash
+
+        Returns:
+            List of file diffs
+        """
+        return next(iter((await self.get_diffs([commit_hash])).values()), [])
+
+    async def get_diffs(self, commits: Iterable[str]) -> Dict[str, List[GitDiff]]:
+        """
+        Get the diffs of many commits from a single git process
+
+        See GitAnalyzer.get_diffs.
+        """
+        commits = list(commits)
+        if not commits:
+            return {}
+
+        parser = _DiffParser()
+        diffs = {}
+        lines = self._stream_git_command(_DIFFS_ARGS, input=commits)
+        try:
+            async for line in lines:
+                done = parser.feed(line)
+                if done is not None:
+                    diffs[done[0]] = done[1]
+        finally:
+            await lines.aclose()
+        done = parser.close()
+        if done is not None:
+            diffs[done[0]] = done[1]
+        return diffs
+
+    async def find_repeated_changes(self, min_occurrences: int = 2,
+                                    since: Optional[str] = None,
+                                    until: Optional[str] = None,
+                                    max_count: Optional[int] = None,
+                                    max_messages: Optional[int] = 100) -> List[Dict]:
+        """
+        Find files with repeated changes of similar nature
+
+        See GitAnalyzer.find_repeated_changes.
+        """
+        if self.commit_index is not None:
+            return await self._from_index('find_repeated_changes', min_occurrences,
+                                          since, until, max_count, max_messages)
+
+        parser = _TouchedFilesParser()
+        tally = _RepeatedChangesTally(min_occurrences, max_messages)
+        records = self._stream_git_command(
+            _repeated_changes_args(since, until, max_count), separator='\0')
+        try:
+            async for record in records:
+                done = parser.feed(record)
+                if done is not None:
+                    tally.add(*done)
+        finally:
+            await records.aclose()
+        done = parser.close()
+        if done is not None:
+            tally.add(*done)
+        return tally.result()
+
+
+async def _write_input(stdin: asyncio.StreamWriter, lines: Iterable[str]):
+    # Written from its own task so a command that answers before it has read
+    # all of its input cannot deadlock against us
+    try:
+        for line in lines:
+            stdin.write((line + '\n').encode('utf-8'))
+            await stdin.drain()
+        stdin.close()
+    except (BrokenPipeError, ConnectionResetError):
+        pass  # git exited early; its status says why
+
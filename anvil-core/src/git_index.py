@@ -0,0 +1,426 @@
+"""
+Persistent, incrementally updated index of a repository's history
+"""
+
+import os
+import sqlite3
+import threading
+from contextlib import closing
+from datetime import datetime
+from itertools import groupby
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from .git import GitAnalyzer, GitError
+
+
+# Bump when the schema or what gets stored changes; older indexes are rebuilt
+INDEX_VERSION = 2
+
+# Hash, parents, author name, author email, author time, commit time, body,
+# subject. The body may span lines, so it goes before the subject, the only
+# field whose end is marked by a newline
+_LOG_FORMAT = 'format:%x01%H%x00%P%x00%an%x00%ae%x00%at%x00%ct%x00%b%x00%s'
+_LOG_FIELDS = 8
+
+# Rows written per executemany() while indexing
+_BATCH = 1000
+
+Date = Union[str, datetime, None]
+NumstatEntry = Tuple[str, Optional[int], Optional[int]]
+
+_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    );
+    -- git log lists commits newest commit_time first; id grows with
+    -- indexing order, oldest first, and breaks ties between equal times.
+    -- It alone is not log order: an update can index a merged branch whose
+    -- commits are older than ones already indexed
+    CREATE TABLE IF NOT EXISTS commits (
+        id INTEGER PRIMARY KEY,
+        hash TEXT NOT NULL UNIQUE,
+        parents TEXT NOT NULL,
+        author_name TEXT NOT NULL,
+        author_email TEXT NOT NULL,
+        author_time INTEGER NOT NULL,
+        commit_time INTEGER NOT NULL,
+        body TEXT NOT NULL,
+        message TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS commits_commit_time ON commits (commit_time);
+    CREATE TABLE IF NOT EXISTS paths (
+        id INTEGER PRIMARY KEY,
+        path TEXT NOT NULL UNIQUE
+    );
+    -- additions and deletions are NULL for binary files
+    CREATE TABLE IF NOT EXISTS files (
+        commit_id INTEGER NOT NULL,
+        path_id INTEGER NOT NULL,
+        additions INTEGER,
+        deletions INTEGER,
+        PRIMARY KEY (commit_id, path_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS files_path ON files (path_id);
+'''
+
+
+class CommitIndex:
+    """
+    SQLite index of commits, authors, timestamps, messages, parents and
+    per-file numstat for one branch of a repository
+
+    History is append-only in practice, so update() only reads the commits
+    between the last indexed head and the current one. A head that is not
+    a descendant of the indexed one (force-push, rebase, reset, switching
+    branches) rebuilds the index. Queries read SQLite only, apart from one
+    ``git rev-parse`` for the head check and for date strings.
+
+    Args:
+        repo_path: Repository to index
+        path: Database file (default: anvil-commits.sqlite in the git directory)
+        ref: Branch or revision to follow
+        auto_update: Run update() before every query
+    """
+
+    def __init__(self, repo_path: str, path: Optional[str] = None,
+                 ref: str = 'HEAD', auto_update: bool = True):
+        self.repo_path = repo_path
+        self.ref = ref
+        self.auto_update = auto_update
+        self._git = GitAnalyzer(repo_path)
+        if path is None:
+            git_dir = self._git._run_git_command(['rev-parse', '--absolute-git-dir']).strip()
+            path = os.path.join(git_dir, 'anvil-commits.sqlite')
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection().execute('SELECT COUNT(*) FROM commits').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+            if self._meta('version') != str(INDEX_VERSION):
+                with conn:
+                    # Check again under the write lock: another process
+                    # opening a new index may have set it up meanwhile
+                    conn.execute('BEGIN IMMEDIATE')
+                    if self._meta('version') != str(INDEX_VERSION):
+                        # Written by another version: start over with the current layout
+                        for table in ('files', 'paths', 'commits'):
+                            conn.execute(f'DROP TABLE {table}')
+                        conn.execute('DELETE FROM meta')
+                        for statement in _statements(_SCHEMA):
+                            conn.execute(statement)
+                        self._set_meta(conn, 'version', str(INDEX_VERSION))
+        return self._conn
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self._conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def _set_meta(conn: sqlite3.Connection, key: str, value: str):
+        conn.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', (key, value))
+
+    @staticmethod
+    def _clear(conn: sqlite3.Connection):
+        for table in ('files', 'paths', 'commits', 'meta'):
+            conn.execute(f'DELETE FROM {table}')
+
+    @property
+    def head(self) -> Optional[str]:
+        """Last indexed commit"""
+        with self._lock:
+            self._connection()
+            return self._meta('head')
+
+    def update(self) -> int:
+        """
+        Bring the index up to date with ``ref``
+
+        Returns:
+            Number of commits added; a rebuild counts every commit
+
+        Raises:
+            GitError: If a git command fails
+        """
+        with self._lock:
+            conn = self._connection()
+            head = self._git._run_git_command(['rev-parse', '--verify', '--quiet',
+                                               f'{self.ref}^{{commit}}']).strip()
+            seen = self._meta('head')
+            if head == seen:
+                return 0
+
+            with conn:
+                # Take the write lock before reading what is indexed, so
+                # concurrent updaters (other processes included) queue here
+                # instead of ingesting the same commits
+                conn.execute('BEGIN IMMEDIATE')
+                indexed = self._meta('head')
+                if indexed == head or (indexed != seen and indexed is not None
+                                       and self._is_ancestor(head, indexed)):
+                    # Another writer indexed this head, or a later one, meanwhile
+                    return 0
+
+                if indexed is not None and not self._is_ancestor(indexed, head):
+                    # History was rewritten under us
+                    indexed = None
+
+                revisions = [f'{indexed}..{head}'] if indexed else [head]
+                args = ['log', '--reverse', '-z', '--numstat',
+                        f'--format={_LOG_FORMAT}'] + revisions
+                if indexed is None:
+                    self._clear(conn)
+                    self._set_meta(conn, 'version', str(INDEX_VERSION))
+                with closing(self._git._stream_git_command(args, separator='\0')) as records:
+                    added = self._ingest(conn, _parse_log(records))
+                self._set_meta(conn, 'head', head)
+            return added
+
+    def _is_ancestor(self, commit: str, head: str) -> bool:
+        try:
+            self._git._run_git_command(['merge-base', '--is-ancestor', commit, head])
+        except GitError:
+            # Not an ancestor (exit 1) or no longer in the repository
+            return False
+        return True
+
+    def _ingest(self, conn: sqlite3.Connection,
+                commits: Iterable[Tuple[List[str], List[NumstatEntry]]]) -> int:
+        path_ids: Dict[str, int] = {}
+
+        def path_id(path: str) -> int:
+            found = path_ids.get(path)
+            if found is None:
+                conn.execute('INSERT OR IGNORE INTO paths (path) VALUES (?)', (path,))
+                found = conn.execute('SELECT id FROM paths WHERE path = ?', (path,)).fetchone()[0]
+                path_ids[path] = found
+            return found
+
+        next_id = conn.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM commits').fetchone()[0]
+        commit_rows = []
+        file_rows = []
+        added = 0
+        for fields, files in commits:
+            hash_, parents, name, email, author_time, commit_time, body, message = fields
+            commit_rows.append((next_id, hash_, parents, name, email,
+                                int(author_time), int(commit_time), body, message))
+            for path, additions, deletions in files:
+                file_rows.append((next_id, path_id(path), additions, deletions))
+            next_id += 1
+            added += 1
+            if len(commit_rows) >= _BATCH:
+                self._write(conn, commit_rows, file_rows)
+        self._write(conn, commit_rows, file_rows)
+        return added
+
+    @staticmethod
+    def _write(conn: sqlite3.Connection, commit_rows: list, file_rows: list):
+        conn.executemany('INSERT INTO commits VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', commit_rows)
+        conn.executemany('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)', file_rows)
+        commit_rows.clear()
+        file_rows.clear()
+
+    def _refresh(self):
+        if self.auto_update:
+            self.update()
+
+    def _time_bounds(self, since: Date, until: Date) -> Tuple[Optional[int], Optional[int]]:
+        """Commit time bounds, parsing date strings the way git log does"""
+        args = []
+        bounds = [None, None]
+        for i, (option, value) in enumerate((('--since', since), ('--until', until))):
+            if isinstance(value, datetime):
+                bounds[i] = int(value.timestamp())
+            elif value:
+                args.append(f'{option}={value}')
+        if args:
+            # rev-parse turns --since/--until into --max-age/--min-age timestamps
+            for line in self._git._run_git_command(['rev-parse'] + args).split():
+                if line.startswith('--max-age='):
+                    bounds[0] = int(line.split('=', 1)[1])
+                elif line.startswith('--min-age='):
+                    bounds[1] = int(line.split('=', 1)[1])
+        return bounds[0], bounds[1]
+
+    def _commit_filter(self, since: Date, until: Date,
+                       keywords: Optional[Iterable[str]] = None) -> Tuple[str, list]:
+        clauses = []
+        params: list = []
+        start, end = self._time_bounds(since, until)
+        if start is not None:
+            clauses.append('commit_time >= ?')
+            params.append(start)
+        if end is not None:
+            clauses.append('commit_time <= ?')
+            params.append(end)
+        if keywords:
+            # LIKE is case-insensitive for ASCII, like git log -i --grep, which
+            # searches the whole message
+            likes = []
+            for keyword in keywords:
+                likes.append("message LIKE ? ESCAPE '\\' OR body LIKE ? ESCAPE '\\'")
+                escaped = keyword.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+                params.extend([f'%{escaped}%'] * 2)
+            clauses.append('(' + ' OR '.join(likes) + ')')
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    def commits(self, since: Date = None, until: Date = None,
+                max_count: Optional[int] = None,
+                keywords: Optional[Iterable[str]] = None) -> List[Dict]:
+        """
+        Commits in git log order, as returned by GitAnalyzer.get_commits
+
+        Args:
+            since: Start date (git date string or datetime)
+            until: End date
+            max_count: Maximum number of commits to return (default: all)
+            keywords: Only commits whose message contains one of these
+                (case-insensitive)
+        """
+        with self._lock:
+            self._refresh()
+            where, params = self._commit_filter(since, until, keywords)
+            rows = self._connection().execute(
+                'SELECT hash, author_name, author_email, author_time, message FROM commits'
+                + where + ' ORDER BY commit_time DESC, id DESC LIMIT ?',
+                params + [_limit(max_count)]).fetchall()
+        return [{
+            'hash': hash_,
+            'author_name': name,
+            'author_email': email,
+            'timestamp': datetime.fromtimestamp(author_time),
+            'message': message
+        } for hash_, name, email, author_time, message in rows]
+
+    def touched_files(self, since: Date = None, until: Date = None,
+                      max_count: Optional[int] = None) -> Iterator[Tuple[str, List[str]]]:
+        """
+        (subject, paths) of each commit in git log order, paths sorted
+
+        Rows stream from SQLite; the index stays locked until the iterator
+        is exhausted or closed.
+        """
+        with self._lock:
+            self._refresh()
+            where, params = self._commit_filter(since, until)
+            rows = self._connection().execute(
+                'SELECT c.id, c.message, p.path FROM '
+                '(SELECT id, commit_time, message FROM commits' + where
+                + ' ORDER BY commit_time DESC, id DESC LIMIT ?) AS c '
+                'LEFT JOIN files AS f ON f.commit_id = c.id '
+                'LEFT JOIN paths AS p ON p.id = f.path_id '
+                'ORDER BY c.commit_time DESC, c.id DESC, p.path', params + [_limit(max_count)])
+            for (_, message), group in groupby(rows, key=lambda row: row[:2]):
+                yield message, [path for _, _, path in group if path is not None]
+
+    def changed_files(self, commit_hash: str) -> List[NumstatEntry]:
+        """
+        (path, additions, deletions) of an indexed commit; binary files
+        have None counts, renamed files their new path
+        """
+        with self._lock:
+            self._refresh()
+            return self._connection().execute(
+                'SELECT p.path, f.additions, f.deletions FROM files AS f '
+                'JOIN commits AS c ON c.id = f.commit_id JOIN paths AS p ON p.id = f.path_id '
+                'WHERE c.hash = ? ORDER BY p.path', (commit_hash,)).fetchall()
+
+    def parents(self, commit_hash: str) -> List[str]:
+        """Parent hashes of an indexed commit"""
+        with self._lock:
+            self._refresh()
+            row = self._connection().execute(
+                'SELECT parents FROM commits WHERE hash = ?', (commit_hash,)).fetchone()
+        return row[0].split() if row else []
+
+
+def _statements(script: str) -> Iterator[str]:
+    """Split an SQL script into statements (executescript() would commit)"""
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            yield statement
+            statement = ''
+
+
+def _limit(max_count: Optional[int]) -> int:
+    return -1 if max_count is None else max_count
+
+
+def _parse_log(records: Iterable[str]) -> Iterator[Tuple[List[str], List[NumstatEntry]]]:
+    """
+    Split ``git log -z --numstat --format=_LOG_FORMAT`` output into
+    (fields, numstat) per commit
+
+    With -z the header fields are separate records (empty ones included),
+    the first numstat entry follows the subject after a newline, and a
+    rename is an entry with an empty path followed by the old and new
+    path records.
+    """
+    fields: Optional[List[str]] = None
+    files: List[NumstatEntry] = []
+    missing = 0  # Header fields still to read
+    rename: Optional[Tuple[Optional[int], Optional[int]]] = None
+    rename_paths = 0
+
+    for record in records:
+        if missing:
+            if missing == 1:
+                subject, _, record = record.partition('\n')
+                fields.append(subject)
+                missing = 0
+                if not record:
+                    continue
+            else:
+                fields.append(record)
+                missing -= 1
+                continue
+        elif record.startswith('\x01'):
+            if fields is not None:
+                yield fields, files
+            fields, files = [record[1:]], []
+            missing = _LOG_FIELDS - 1
+            continue
+
+        if rename_paths:
+            rename_paths -= 1
+            if rename_paths == 0:
+                files.append((record,) + rename)
+            continue
+        if not record or fields is None:
+            continue
+
+        parts = record.split('\t', 2)
+        if len(parts) != 3:
+            continue
+        counts = tuple(int(n) if n.isdigit() else None for n in parts[:2])
+        if parts[2]:
+            files.append((parts[2],) + counts)
+        else:
+            rename, rename_paths = counts, 2
+
+    if fields is not None:
+        yield fields, files
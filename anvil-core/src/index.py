@@ -0,0 +1,216 @@
+"""
+Sublinear similarity index for code fingerprints
+"""
+
+import math
+from itertools import combinations, product
+from typing import Dict, Iterable, Iterator, List, Tuple, Union
+
+from .storage import FingerprintArray
+
+
+HEX_ALPHABET = '0123456789abcdef'
+
+
+class FingerprintIndex:
+    """
+    Multi-index Hamming structure over fixed-width hex fingerprints
+
+    Each fingerprint is split into ``blocks`` contiguous segments and every
+    segment is stored in its own hash table. By the pigeonhole principle two
+    fingerprints that differ in at most ``d`` positions share at least one
+    segment that differs in at most ``d // blocks`` positions, so a threshold
+    query only has to probe the segment tables around the target instead of
+    comparing against every stored fingerprint.
+
+    Similarity matches ``CodeFingerprint.similarity``: with the default
+    ``metric='hex'`` it is matching characters divided by width, and with
+    ``metric='bits'`` (for simhash mode) matching bits divided by bit count.
+    Segments are hex substrings either way; with ``metric='bits'`` the
+    probes around a target segment flip bits rather than characters.
+    """
+
+    def __init__(self, width: int = 16, blocks: int = 4, metric: str = 'hex'):
+        if blocks < 1 or blocks > width:
+            raise ValueError(f"blocks must be between 1 and {width}, got {blocks}")
+        if metric not in ('hex', 'bits'):
+            raise ValueError(f"Unknown metric: {metric}")
+
+        self.width = width
+        self.blocks = blocks
+        self.metric = metric
+        self._units = width * 4 if metric == 'bits' else width
+
+        # Spread the remainder over the first segments so all widths work
+        size, extra = divmod(width, blocks)
+        self._bounds: List[Tuple[int, int]] = []
+        start = 0
+        for i in range(blocks):
+            end = start + size + (1 if i < extra else 0)
+            self._bounds.append((start, end))
+            start = end
+
+        self._tables: List[Dict[str, List[str]]] = [{} for _ in range(blocks)]
+        self._counts: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def __contains__(self, fp: str) -> bool:
+        return fp in self._counts
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._counts)
+
+    def add(self, fp: str):
+        """Add a fingerprint (adding an existing one only bumps its count)"""
+        self._check_width(fp)
+
+        if fp in self._counts:
+            self._counts[fp] += 1
+            return
+
+        self._counts[fp] = 1
+        for table, (start, end) in zip(self._tables, self._bounds):
+            table.setdefault(fp[start:end], []).append(fp)
+
+    def add_many(self, fingerprints: Union[Iterable[str], FingerprintArray]):
+        """Add several fingerprints (hex strings or a FingerprintArray)"""
+        if isinstance(fingerprints, FingerprintArray):
+            fingerprints = fingerprints.iter_hex()
+        for fp in fingerprints:
+            self.add(fp)
+
+    def remove(self, fp: str):
+        """
+        Remove one occurrence of a fingerprint
+
+        Raises:
+            KeyError: If the fingerprint is not in the index
+        """
+        count = self._counts[fp]
+        if count > 1:
+            self._counts[fp] = count - 1
+            return
+
+        del self._counts[fp]
+        for table, (start, end) in zip(self._tables, self._bounds):
+            key = fp[start:end]
+            bucket = table[key]
+            bucket.remove(fp)
+            if not bucket:
+                del table[key]
+
+    def query(self, target_fp: str, threshold: float = 0.8) -> List[Tuple[str, float]]:
+        """
+        Find indexed fingerprints similar to target
+
+        Args:
+            target_fp: Target fingerprint
+            threshold: Minimum similarity (0.0 to 1.0)
+
+        Returns:
+            List of (fingerprint, similarity) tuples above threshold,
+            most similar first
+        """
+        self._check_width(target_fp)
+
+        min_matches = math.ceil(threshold * self._units - 1e-9)
+        max_distance = self._units - max(min_matches, 0)
+        if max_distance < 0:
+            return []
+
+        results = []
+        for fp in self._candidates(target_fp, max_distance):
+            distance = self._distance(target_fp, fp)
+            if distance <= max_distance:
+                results.append((fp, (self._units - distance) / self._units))
+
+        return sorted(results, key=lambda x: (-x[1], x[0]))
+
+    def top_k(self, target_fp: str, k: int = 10) -> List[Tuple[str, float]]:
+        """
+        Find the k indexed fingerprints most similar to target
+
+        The search radius grows one position at a time; a radius is complete
+        once probed, so the search stops as soon as k results are known to
+        be the closest ones.
+        """
+        self._check_width(target_fp)
+        if k <= 0 or not self._counts:
+            return []
+
+        found: Dict[str, int] = {}
+        for radius in range(self._units + 1):
+            for fp in self._candidates(target_fp, radius):
+                if fp not in found:
+                    found[fp] = self._distance(target_fp, fp)
+
+            within = sum(1 for d in found.values() if d <= radius)
+            if within >= k or len(found) == len(self._counts):
+                break
+
+        ranked = sorted(found.items(), key=lambda x: (x[1], x[0]))[:k]
+        return [(fp, (self._units - d) / self._units) for fp, d in ranked]
+
+    def _candidates(self, target_fp: str, max_distance: int) -> Iterable[str]:
+        """Collect fingerprints that may be within max_distance of target"""
+        radius = max_distance // self.blocks
+
+        probes = sum(self._probe_count(end - start, radius)
+                     for start, end in self._bounds)
+        if probes >= len(self._counts):
+            # Probing would cost more than looking at everything
+            return list(self._counts)
+
+        seen = set()
+        for table, (start, end) in zip(self._tables, self._bounds):
+            for key in self._neighbours(target_fp[start:end], radius):
+                bucket = table.get(key)
+                if bucket:
+                    seen.update(bucket)
+        return seen
+
+    def _probe_count(self, length: int, radius: int) -> int:
+        """Number of keys within radius of a segment of the given length"""
+        if self.metric == 'bits':
+            return sum(math.comb(length * 4, i)
+                       for i in range(min(radius, length * 4) + 1))
+        return sum(math.comb(length, i) * (len(HEX_ALPHABET) - 1) ** i
+                   for i in range(min(radius, length) + 1))
+
+    def _neighbours(self, segment: str, radius: int) -> Iterator[str]:
+        """Yield every segment within radius positions (or bits) of segment"""
+        yield segment
+        if self.metric == 'bits':
+            value = int(segment, 16)
+            bits = len(segment) * 4
+            for distance in range(1, min(radius, bits) + 1):
+                for positions in combinations(range(bits), distance):
+                    flipped = value
+                    for p in positions:
+                        flipped ^= 1 << p
+                    yield format(flipped, f'0{len(segment)}x')
+            return
+
+        chars = list(segment)
+        for distance in range(1, min(radius, len(segment)) + 1):
+            for positions in combinations(range(len(segment)), distance):
+                choices = [[c for c in HEX_ALPHABET if c != segment[p]]
+                           for p in positions]
+                for replacement in product(*choices):
+                    variant = chars[:]
+                    for p, c in zip(positions, replacement):
+                        variant[p] = c
+                    yield ''.join(variant)
+
+    def _distance(self, fp1: str, fp2: str) -> int:
+        """Number of positions (or bits) where two fingerprints differ"""
+        if self.metric == 'bits':
+            return bin(int(fp1, 16) ^ int(fp2, 16)).count('1')
+        return sum(c1 != c2 for c1, c2 in zip(fp1, fp2))
+
+    def _check_width(self, fp: str):
+        if len(fp) != self.width:
+            raise ValueError(f"Fingerprint {fp!r} has width {len(fp)}, "
+                             f"index expects {self.width}")
@@ -0,0 +1,157 @@
+"""
+Single-pass JavaScript/TypeScript tokenizer
+
+Good enough to recover program structure, not to validate it: strings,
+template literals (with nested ``${...}`` expressions), regular expression
+literals and comments are recognised so that the braces and keywords
+inside them are never mistaken for code. Every step consumes input, so
+the cost is linear in the size of the source, minified bundles included.
+"""
+
+import re
+from typing import Dict, List, NamedTuple, Tuple
+
+
+class Token(NamedTuple):
+    kind: str  # 'name', 'number', 'string', 'template', 'regex' or 'punct'
+    text: str
+    line: int  # Line of the first character
+    newline: bool  # A line break separates it from the previous token
+
+
+_TOKEN_RE = re.compile(r'''
+    (?P<space>[^\S\n]+)
+  | (?P<newline>\n)
+  | (?P<comment>//[^\n]*|/\*.*?(?:\*/|\Z))
+  | (?P<string>"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')
+  | (?P<template>`)
+  | (?P<number>\.?\d[\w.]*)
+  | (?P<name>[\w$]+)
+  | (?P<punct>=>|\.\.\.|\?\?=?|\?\.(?!\d)|&&=?|\|\|=?|[=!]==?|\*\*=?|\+\+|--|<<=?|>>>?=?|[-+*/%&|^<>]=?|.)
+''', re.VERBOSE | re.DOTALL)
+
+# Rest of a template literal up to its end (`) or the next ${
+_TEMPLATE_RE = re.compile(r'(?:[^`\\$]|\\.|\$(?!\{))*(?:`|\$\{|\Z)', re.DOTALL)
+
+_REGEX_RE = re.compile(r'/(?:[^/\\\[\n]|\\.|\[(?:[^\]\\\n]|\\.)*\])+/[A-Za-z]*')
+
+# After these words an expression starts, so a / opens a regex literal
+EXPRESSION_KEYWORDS = frozenset({
+    'return', 'typeof', 'instanceof', 'in', 'of', 'new', 'delete', 'void',
+    'throw', 'case', 'do', 'else', 'yield', 'await',
+})
+
+_OPENERS = {'(': ')', '[': ']', '{': '}'}
+_CLOSERS = frozenset(_OPENERS.values())
+
+
+def _regex_allowed(previous: Token) -> bool:
+    """Whether a / after this token starts a regex rather than a division"""
+    if previous is None:
+        return True
+    if previous.kind == 'name':
+        return previous.text in EXPRESSION_KEYWORDS
+    if previous.kind == 'punct':
+        return previous.text not in (')', ']', '}')
+    if previous.kind == 'template':
+        return previous.text.endswith('${')
+    return False
+
+
+def tokenize(code: str) -> Tuple[List[Token], Dict[int, str]]:
+    """
+    Split JavaScript or TypeScript source into tokens
+
+    Comments are dropped; JSDoc comments (/** ... */) are returned
+    separately, keyed by the index of the token that follows them.
+
+    Returns:
+        (tokens, docs)
+    """
+    tokens: List[Token] = []
+    docs: Dict[int, str] = {}
+    # One open-brace count per template literal whose ${ expression we are in
+    templates: List[int] = []
+    previous = None
+    line = 1
+    newline = False
+    pos = 0
+    length = len(code)
+    match = _TOKEN_RE.match
+
+    while pos < length:
+        if code[pos] == '/' and _regex_allowed(previous) and code[pos + 1:pos + 2] not in ('/', '*'):
+            m = _REGEX_RE.match(code, pos)
+            if m is not None:
+                previous = Token('regex', m.group(), line, newline)
+                tokens.append(previous)
+                newline = False
+                pos = m.end()
+                continue
+
+        m = match(code, pos)
+        kind = m.lastgroup
+        text = m.group()
+        pos = m.end()
+
+        if kind == 'space':
+            continue
+        if kind == 'newline':
+            line += 1
+            newline = True
+            continue
+        if kind == 'comment':
+            if text.startswith('/**') and text != '/**/':
+                docs[len(tokens)] = text
+            line += text.count('\n')
+            newline = newline or '\n' in text
+            continue
+
+        if kind == 'template' or (kind == 'punct' and text == '}' and templates
+                                  and templates[-1] == 0):
+            # Start of a template literal, or the } closing a ${ expression
+            if kind == 'punct':
+                templates.pop()
+            rest = _TEMPLATE_RE.match(code, pos)
+            pos = rest.end()
+            text += rest.group()
+            if text.endswith('${'):
+                templates.append(0)
+            kind = 'template'
+        elif kind == 'punct' and templates:
+            if text == '{':
+                templates[-1] += 1
+            elif text == '}':
+                templates[-1] -= 1
+
+        previous = Token(kind, text, line, newline)
+        tokens.append(previous)
+        line += text.count('\n') if kind in ('string', 'template') else 0
+        newline = False
+
+    return tokens, docs
+
+
+def match_brackets(tokens: List[Token]) -> List[int]:
+    """
+    Index of the matching bracket for every (, [, { and their closers
+
+    Other tokens, and brackets left unbalanced, map to -1.
+    """
+    matches = [-1] * len(tokens)
+    stack: List[int] = []
+    for i, token in enumerate(tokens):
+        if token.kind != 'punct':
+            continue
+        text = token.text
+        if text in _OPENERS:
+            stack.append(i)
+        elif text in _CLOSERS:
+            # Skip openers a stray closer cannot belong to
+            while stack and _OPENERS[tokens[stack[-1]].text] != text:
+                stack.pop()
+            if stack:
+                opener = stack.pop()
+                matches[opener] = i
+                matches[i] = opener
+    return matches
@@ -0,0 +1,201 @@
+"""
+Streaming comment- and whitespace-normalizer for text fingerprints
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+
+@dataclass(frozen=True)
+class LanguageRules:
+    """Lexical rules the normalizer needs to tell comments from strings"""
+    line_comments: Tuple[str, ...] = ()
+    block_comments: Tuple[Tuple[str, str], ...] = ()
+    # Delimiters open and close a string; single-character ones other
+    # than ` stop at the end of the line so a stray quote cannot swallow
+    # the rest of the file
+    strings: Tuple[str, ...] = ('"', "'")
+
+
+_C_STYLE = LanguageRules(line_comments=('//',), block_comments=(('/*', '*/'),))
+
+LANGUAGE_RULES = {
+    'python': LanguageRules(line_comments=('#',),
+                            strings=('"""', "'''", '"', "'")),
+    'javascript': LanguageRules(line_comments=('//',), block_comments=(('/*', '*/'),),
+                                strings=('"', "'", '`')),
+    'typescript': LanguageRules(line_comments=('//',), block_comments=(('/*', '*/'),),
+                                strings=('"', "'", '`')),
+    'go': LanguageRules(line_comments=('//',), block_comments=(('/*', '*/'),),
+                        strings=('"', "'", '`')),
+    'java': _C_STYLE,
+    'rust': _C_STYLE,
+    'cpp': _C_STYLE,
+    'c': _C_STYLE,
+}
+
+# Used for languages without rules: every comment style seen so far
+DEFAULT_RULES = LanguageRules(line_comments=('#', '//'), block_comments=(('/*', '*/'),))
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+class TextNormalizer:
+    """
+    Incremental normalizer that writes normalized code into a hash
+
+    Text is fed in chunks of any size and scanned with a small state
+    machine (code, string, line comment, block comment), so comment
+    markers inside strings are left alone and comments are removed before
+    whitespace is collapsed. Only a few characters that could start a
+    multi-character marker are held between chunks, and output is passed
+    to ``sink.update`` in batches, so memory stays flat however large the
+    input is. The result does not depend on how the input was chunked.
+
+    With ``ignore_whitespace``, runs of whitespace outside strings become a
+    single space and leading and trailing whitespace is dropped.
+    """
+
+    FLUSH_PIECES = 1024
+
+    def __init__(self, sink, language: str = 'unknown',
+                 ignore_whitespace: bool = True, ignore_comments: bool = True):
+        """
+        Args:
+            sink: Object with an update(bytes) method, e.g. hashlib.sha256()
+            language: Language name as returned by parsers.detect_language
+            ignore_whitespace: Collapse whitespace outside strings
+            ignore_comments: Drop comments
+        """
+        self.sink = sink
+        self.rules = LANGUAGE_RULES.get(language, DEFAULT_RULES)
+        self.ignore_whitespace = ignore_whitespace
+        self.ignore_comments = ignore_comments
+
+        rules = self.rules
+        openers = []
+        for marker in rules.line_comments:
+            openers.append((marker, ('line', None)))
+        for start, end in rules.block_comments:
+            openers.append((start, ('block', re.compile(re.escape(end)))))
+        for quote in rules.strings:
+            stop = '' if len(quote) > 1 or quote == '`' else r'|\n'
+            openers.append((quote, ('string', re.compile(r'\\.|' + re.escape(quote) + stop,
+                                                         re.DOTALL))))
+        # Longest first, so ''' wins over '
+        openers.sort(key=lambda item: -len(item[0]))
+        self._openers = dict(openers)
+        self._code_re = re.compile('|'.join(re.escape(m) for m, _ in openers) or '(?!)')
+        self._newline_re = re.compile(r'\n')
+        # Characters held back between chunks: enough to see a whole marker
+        # (or an escape) that starts before the cut
+        markers = [m for m, _ in openers] + [end for _, end in rules.block_comments]
+        self._hold = max([len(m) for m in markers] + [2])
+
+        self._pending = ''
+        self._state: Optional[Tuple[str, Optional[re.Pattern]]] = None  # None is code
+        self._out = []
+        self._started = False
+        self._space = False
+
+    def feed(self, text: str):
+        """Normalize the next chunk of input"""
+        self._scan(self._pending + text, final=False)
+
+    def finish(self):
+        """Normalize whatever is held back and flush all output"""
+        self._scan(self._pending, final=True)
+        self._flush()
+
+    def _scan(self, text: str, final: bool):
+        limit = len(text) if final else max(len(text) - self._hold, 0)
+        pos = 0
+
+        while pos < limit:
+            state = self._state
+            if state is None:
+                match = self._code_re.search(text, pos)
+            elif state[0] == 'line':
+                match = self._newline_re.search(text, pos)
+            else:
+                match = state[1].search(text, pos)
+
+            if match is None or match.start() >= limit:
+                self._consume(text[pos:limit])
+                pos = limit
+                break
+
+            self._consume(text[pos:match.start()])
+            token = match.group()
+            pos = match.end()
+
+            if state is None:
+                self._state = self._openers[token]
+                if self._state[0] == 'string' or not self.ignore_comments:
+                    self._write(token)
+            elif state[0] == 'string':
+                if token == '\n':
+                    # Unterminated single-line string
+                    self._state = None
+                    self._whitespace(token)
+                else:
+                    self._write(token)
+                    if not token.startswith('\\'):
+                        self._state = None
+            else:
+                # End of a comment; a line comment's newline is whitespace
+                if state[0] == 'line':
+                    self._state = None
+                    self._whitespace(token)
+                else:
+                    if not self.ignore_comments:
+                        self._write(token)
+                    self._state = None
+
+        self._pending = text[pos:]
+
+    def _consume(self, piece: str):
+        """Handle text that contains no token for the current state"""
+        if not piece:
+            return
+        state = self._state
+        if state is not None and state[0] == 'string':
+            self._write(piece)
+        elif state is None or not self.ignore_comments:
+            if not self.ignore_whitespace:
+                self._write(piece)
+                return
+            # Collapse the whole span at once; spaces at its edges may
+            # merge with whitespace in neighbouring spans
+            collapsed = _WHITESPACE.sub(' ', piece)
+            if collapsed[0] == ' ':
+                self._whitespace(' ')
+                collapsed = collapsed[1:]
+            trailing = collapsed.endswith(' ')
+            if trailing:
+                collapsed = collapsed[:-1]
+            if collapsed:
+                self._write(collapsed)
+            if trailing:
+                self._whitespace(' ')
+
+    def _whitespace(self, piece: str):
+        if not self.ignore_whitespace:
+            self._write(piece)
+        elif self._started:
+            self._space = True
+
+    def _write(self, piece: str):
+        if self._space:
+            self._out.append(' ')
+            self._space = False
+        self._out.append(piece)
+        self._started = True
+        if len(self._out) >= self.FLUSH_PIECES:
+            self._flush()
+
+    def _flush(self):
+        if self._out:
+            self.sink.update(''.join(self._out).encode('utf-8', 'surrogatepass'))
+            self._out.clear()
@@ -0,0 +1,75 @@
+"""
+Process-pool helpers shared by the batch APIs
+"""
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List, Optional, TypeVar
+
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+def _run_chunk(func: Callable[[T], R], chunk: List[T]) -> List[R]:
+    return [func(item) for item in chunk]
+
+
+def default_workers() -> int:
+    """Number of worker processes to use when none is given"""
+    return os.cpu_count() or 1
+
+
+def ordered_map(func: Callable[[T], R], items: Iterable[T],
+                workers: Optional[int] = None, chunksize: int = 32,
+                max_in_flight: Optional[int] = None) -> Iterator[R]:
+    """
+    Map func over items in a process pool, streaming results in input order
+
+    Items are grouped into chunks of ``chunksize`` so each task amortizes
+    the pickling overhead, and at most ``max_in_flight`` chunks are queued
+    at once so huge inputs never sit in memory all at the same time.
+
+    Args:
+        func: Picklable (module-level) function applied to each item
+        items: Input items, consumed lazily
+        workers: Number of processes (default: CPU count); 1 runs inline
+        chunksize: Items per work unit
+        max_in_flight: Chunks submitted ahead of the consumer
+            (default: twice the worker count)
+
+    Returns:
+        Iterator over func(item) in the same order as items
+    """
+    workers = workers or default_workers()
+    chunksize = max(chunksize, 1)
+    items = iter(items)
+
+    if workers == 1:
+        for item in items:
+            yield func(item)
+        return
+
+    max_in_flight = max_in_flight or workers * 2
+    pending = deque()
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        try:
+            while True:
+                while len(pending) < max_in_flight:
+                    chunk = list(islice(items, chunksize))
+                    if not chunk:
+                        break
+                    pending.append(executor.submit(_run_chunk, func, chunk))
+
+                if not pending:
+                    break
+
+                for result in pending.popleft().result():
+                    yield result
+        finally:
+            # Consumer stopped early: drop queued work instead of finishing it
+            for future in pending:
+                future.cancel()
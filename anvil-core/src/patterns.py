@@ -0,0 +1,253 @@
+"""
+Declarative Python AST patterns compiled into a single-pass matcher
+
+A pattern names a node type and a set of field predicates::
+
+    PatternSpec('null_check', ast.Compare, {
+        'ops': Node((ast.Is, ast.IsNot)),
+        'comparators': Node(ast.Constant, value=None),
+    })
+
+Any number of patterns is compiled into one table from concrete node type to
+the checks registered for it, so a traversal looks at each node once and
+only runs the checks for that node's type: the cost grows with the size of
+the tree, not with the number of patterns times the size of the tree.
+"""
+
+import ast
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Tuple, Type, Union
+
+from .models import FileLocation
+
+
+NodeTypes = Union[Type[ast.AST], Tuple[Type[ast.AST], ...]]
+_Check = Callable[[Any], bool]
+
+
+@dataclass(frozen=True)
+class Node:
+    """
+    Predicate on a child node: its type and, recursively, its fields
+
+    On a list field (Compare.ops, Call.args, ...) it holds if any element
+    matches.
+    """
+    node_type: NodeTypes
+    fields: Mapping[str, Any] = field(default_factory=dict)
+
+    def __init__(self, node_type: NodeTypes, **fields):
+        object.__setattr__(self, 'node_type', node_type)
+        object.__setattr__(self, 'fields', fields)
+
+
+@dataclass(frozen=True)
+class PatternSpec:
+    """
+    A named pattern: node type(s) plus predicates on the node's fields
+
+    Each value in ``fields`` is one of:
+
+    - a Node, matched against the child node (any element of a list field)
+    - a callable, called with the raw field value and returning a bool
+    - anything else, compared with the field value (any element of a list
+      field); True does not match 1, nor 0.0 match False
+
+    Abstract node types such as ast.stmt or ast.expr stand for all of their
+    concrete subclasses. ``where`` is an optional predicate on the whole
+    node for conditions that involve several fields.
+    """
+    name: str
+    node_type: NodeTypes
+    fields: Mapping[str, Any] = field(default_factory=dict)
+    where: Optional[Callable[[ast.AST], bool]] = None
+    description: str = ''
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'PatternSpec':
+        """
+        Build a spec from plain data, e.g. loaded from JSON
+
+        Node types are ast class names and a nested dict with a 'node' key
+        is a Node, e.g. ``{"name": "print_call", "node": "Call",
+        "fields": {"func": {"node": "Name", "id": "print"}}}``.
+        """
+        fields = {name: _from_data(value) for name, value in data.get('fields', {}).items()}
+        return cls(name=data['name'], node_type=_node_types(data['node']), fields=fields,
+                   description=data.get('description', ''))
+
+
+@dataclass
+class PatternMatch:
+    """A node matched by a pattern"""
+    pattern: str
+    node: ast.AST
+    location: FileLocation
+
+
+class PatternSet:
+    """
+    A group of patterns compiled for evaluation in one traversal
+    """
+
+    def __init__(self, specs: Iterable[PatternSpec]):
+        self.specs = list(specs)
+        names = [spec.name for spec in self.specs]
+        if len(set(names)) != len(names):
+            raise ValueError("Pattern names must be unique")
+
+        self._dispatch: Dict[type, List[Tuple[str, _Check]]] = {}
+        for spec in self.specs:
+            check = _compile_fields(spec.fields)
+            if spec.where is not None:
+                check = _both(check, spec.where)
+            for node_type in _concrete_types(spec.node_type):
+                self._dispatch.setdefault(node_type, []).append((spec.name, check))
+
+    @property
+    def names(self) -> List[str]:
+        return [spec.name for spec in self.specs]
+
+    def match(self, node: ast.AST) -> List[str]:
+        """Names of the patterns matching this node (its children are not visited)"""
+        checks = self._dispatch.get(type(node))
+        if not checks:
+            return []
+        return [name for name, check in checks if check(node)]
+
+    def find(self, tree: ast.AST, filename: str = '<string>') -> List[PatternMatch]:
+        """
+        Match every pattern against every node of a tree in one traversal
+
+        Args:
+            tree: Parsed tree
+            filename: File name recorded in each location
+
+        Returns:
+            Matches in source order; nodes without a position (operators,
+            contexts) get the location of the nearest enclosing node that has one
+        """
+        matches = []
+        dispatch = self._dispatch
+        stack: List[Tuple[ast.AST, Optional[ast.AST]]] = [(tree, None)]
+        while stack:
+            node, anchor = stack.pop()
+            if hasattr(node, 'lineno'):
+                anchor = node
+
+            checks = dispatch.get(type(node))
+            if checks:
+                for name, check in checks:
+                    if check(node):
+                        matches.append(PatternMatch(name, node, _location(anchor, filename)))
+
+            children = list(ast.iter_child_nodes(node))
+            for child in reversed(children):
+                stack.append((child, anchor))
+
+        return matches
+
+    def find_nodes(self, tree: ast.AST) -> Dict[str, List[ast.AST]]:
+        """Matching nodes grouped by pattern name, without locations"""
+        found: Dict[str, List[ast.AST]] = {name: [] for name in self.names}
+        for match in self.find(tree):
+            found[match.pattern].append(match.node)
+        return found
+
+
+def _location(node: Optional[ast.AST], filename: str) -> FileLocation:
+    if node is None:
+        return FileLocation(file=filename, start_line=0, end_line=0)
+    return FileLocation(
+        file=filename,
+        start_line=node.lineno,
+        end_line=node.end_lineno or node.lineno,
+        start_col=node.col_offset,
+        end_col=node.end_col_offset
+    )
+
+
+def _concrete_types(node_type: NodeTypes) -> List[type]:
+    """Expand abstract AST classes into the classes ast.parse instantiates"""
+    pending = list(node_type) if isinstance(node_type, tuple) else [node_type]
+    result = []
+    while pending:
+        cls = pending.pop()
+        subclasses = cls.__subclasses__()
+        if subclasses:
+            pending.extend(subclasses)
+        if not subclasses or cls._fields:
+            if cls not in result:
+                result.append(cls)
+    return result
+
+
+def _compile_fields(fields: Mapping[str, Any]) -> _Check:
+    tests = [(name, _compile_value(predicate)) for name, predicate in fields.items()]
+    if not tests:
+        return lambda node: True
+
+    def check(node):
+        for name, test in tests:
+            if not test(getattr(node, name, None)):
+                return False
+        return True
+    return check
+
+
+def _compile_value(predicate: Any) -> _Check:
+    """Compile one field predicate into a function of the field value"""
+    if isinstance(predicate, Node):
+        types = tuple(_concrete_types(predicate.node_type))
+        fields = _compile_fields(predicate.fields)
+
+        def one(value):
+            return isinstance(value, types) and fields(value)
+    elif callable(predicate):
+        return predicate
+    else:
+        def one(value):
+            return value is predicate or (type(value) is type(predicate) and value == predicate)
+
+    def test(value):
+        if isinstance(value, list):
+            return any(one(item) for item in value)
+        return one(value)
+    return test
+
+
+def _both(first: _Check, second: _Check) -> _Check:
+    return lambda node: first(node) and second(node)
+
+
+def _node_types(names: Union[str, List[str]]) -> NodeTypes:
+    if isinstance(names, str):
+        names = [names]
+    types = []
+    for name in names:
+        node_type = getattr(ast, name, None)
+        if not (isinstance(node_type, type) and issubclass(node_type, ast.AST)):
+            raise ValueError(f"Unknown AST node type: {name}")
+        types.append(node_type)
+    return types[0] if len(types) == 1 else tuple(types)
+
+
+def _from_data(value: Any) -> Any:
+    if isinstance(value, dict) and 'node' in value:
+        fields = {name: _from_data(v) for name, v in value.items() if name != 'node'}
+        return Node(_node_types(value['node']), **fields)
+    return value
+
+
+BUILTIN_PATTERNS = {
+    spec.name: spec for spec in [
+        PatternSpec('null_check', ast.Compare, {
+            'ops': Node((ast.Is, ast.IsNot)),
+            'comparators': Node(ast.Constant, value=None),
+        }, description="Comparison with None using is / is not"),
+        PatternSpec('exception_handling', ast.Try,
+                    description="try/except block"),
+    ]
+}
+
+DEFAULT_PATTERNS = PatternSet(BUILTIN_PATTERNS.values())
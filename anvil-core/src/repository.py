@@ -0,0 +1,159 @@
+"""
+Repository-wide parsing in a process pool
+
+Workers parse and summarize one file each and send back flat NamedTuple
+records instead of trees or dataclasses, so only a few strings and ints
+per definition cross the process boundary.
+"""
+
+from typing import Dict, Iterable, Iterator, NamedTuple, Optional, Tuple
+
+from .parallel import ordered_map
+from .parsers import ClassInfo, FunctionInfo, PythonParser, _PARSERS, get_parser
+from .scanner import SourceFile, read_source, scan_files
+
+
+class FunctionRecord(NamedTuple):
+    """Compact form of a FunctionInfo (docstrings are not shipped)"""
+    qualified_name: str
+    parameters: Tuple[str, ...]
+    start_line: int
+    end_line: int
+    complexity: int
+    is_async: bool = False
+    has_docstring: bool = False
+
+    @property
+    def name(self) -> str:
+        return self.qualified_name.rpartition('.')[2]
+
+    @classmethod
+    def from_info(cls, info: FunctionInfo) -> 'FunctionRecord':
+        return cls(info.qualified_name or info.name, tuple(info.parameters),
+                   info.start_line, info.end_line, info.complexity,
+                   info.is_async, info.docstring is not None)
+
+    def to_info(self) -> FunctionInfo:
+        return FunctionInfo(name=self.name, parameters=list(self.parameters),
+                            start_line=self.start_line, end_line=self.end_line,
+                            complexity=self.complexity,
+                            qualified_name=self.qualified_name, is_async=self.is_async)
+
+
+class ClassRecord(NamedTuple):
+    """Compact form of a ClassInfo; methods are indices into ParsedFile.functions"""
+    qualified_name: str
+    base_classes: Tuple[str, ...]
+    start_line: int
+    end_line: int
+    methods: Tuple[int, ...] = ()
+    has_docstring: bool = False
+
+    @property
+    def name(self) -> str:
+        return self.qualified_name.rpartition('.')[2]
+
+
+class ParsedFile(NamedTuple):
+    """Everything parse_repository() learned about one file"""
+    path: str
+    language: str
+    complexity: int = 0
+    functions: Tuple[FunctionRecord, ...] = ()
+    classes: Tuple[ClassRecord, ...] = ()
+    patterns: Optional[Dict[str, Tuple[int, ...]]] = None  # Pattern name -> start lines
+    error: Optional[str] = None
+
+    def class_infos(self) -> Iterator[ClassInfo]:
+        """Rebuild ClassInfo objects, methods included"""
+        for record in self.classes:
+            yield ClassInfo(name=record.name,
+                            methods=[self.functions[i].to_info() for i in record.methods],
+                            base_classes=list(record.base_classes),
+                            start_line=record.start_line, end_line=record.end_line,
+                            qualified_name=record.qualified_name)
+
+
+def parse_source(code: str, language: str, path: str = '<string>',
+                 cache_ast: bool = True) -> ParsedFile:
+    """
+    Parse and summarize source code into a ParsedFile
+
+    Args:
+        code: Source text
+        language: Language name, see parsers.get_parser()
+        path: Path recorded in the result
+        cache_ast: Parse Python through the process-wide AST cache, so
+            fingerprinting the same source later does not parse it again;
+            False parses a private tree that is never stored
+
+    Raises:
+        SyntaxError: If Python code cannot be parsed
+        ValueError: If the language has no parser
+    """
+    parser = get_parser(language)
+    if cache_ast or not isinstance(parser, PythonParser):
+        tree = parser.parse(code)
+    else:
+        tree = parser.parse(code, copy=True)
+    summary = parser.summarize(tree)
+
+    functions = tuple(FunctionRecord.from_info(info) for info in summary.functions)
+    positions = {id(info): i for i, info in enumerate(summary.functions)}
+    classes = tuple(
+        ClassRecord(info.qualified_name or info.name,
+                    tuple(info.base_classes), info.start_line, info.end_line,
+                    tuple(positions[id(m)] for m in info.methods if id(m) in positions),
+                    info.docstring is not None)
+        for info in summary.classes
+    )
+    patterns = {name: tuple(getattr(node, 'lineno', 0) for node in nodes)
+                for name, nodes in summary.patterns.items()}
+    return ParsedFile(path, language, summary.complexity, functions, classes, patterns)
+
+
+def _parse_file(source: SourceFile) -> ParsedFile:
+    """Worker: parse and summarize one file"""
+    try:
+        # Each file is parsed once, so caching its tree would only hold it in memory
+        return parse_source(read_source(source.path), source.language, source.path,
+                            cache_ast=False)
+    except Exception as e:
+        return ParsedFile(source.path, source.language, error=f"{type(e).__name__}: {e}")
+
+
+def parse_repository(path: str, languages: Optional[Iterable[str]] = None,
+                     workers: Optional[int] = None, chunksize: int = 16,
+                     max_in_flight: Optional[int] = None) -> Iterator[ParsedFile]:
+    """
+    Parse every supported source file under a directory in a process pool
+
+    Files come from scanner.scan_files(), which skips ignored, vendored,
+    generated and binary files. They are visited in sorted path order and
+    results stream back in that order; at most ``max_in_flight`` chunks of
+    files are being worked on or waiting to be consumed at any time, so
+    memory does not grow with the repository.
+
+    Args:
+        path: Directory to scan
+        languages: Languages to parse (default: every language with a parser)
+        workers: Number of processes (default: CPU count; 1 runs inline)
+        chunksize: Files per work unit
+        max_in_flight: Chunks submitted ahead of the consumer
+            (default: twice the worker count)
+
+    Returns:
+        Iterator of ParsedFile; files that cannot be read or parsed carry an
+        error instead of aborting the run
+
+    Raises:
+        ValueError: If a requested language has no parser
+    """
+    languages = list(languages) if languages is not None else list(_PARSERS)
+    for language in languages:
+        if language not in _PARSERS:
+            raise ValueError(f"Unsupported language: {language}. "
+                             f"Supported: {list(_PARSERS.keys())}")
+
+    return ordered_map(_parse_file, scan_files(path, languages),
+                       workers=workers, chunksize=chunksize, max_in_flight=max_in_flight)
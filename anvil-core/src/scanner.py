@@ -0,0 +1,342 @@
+"""
+Repository walker shared by the parsing and fingerprinting batch APIs
+"""
+
+import mmap
+import os
+import re
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from .parsers import language_from_extension
+
+
+# Bytes read from each candidate file to sniff its type
+SNIFF_BYTES = 4096
+
+# Directories holding third-party code or caches, at any depth
+VENDORED_DIRS = frozenset({
+    'node_modules', 'bower_components', 'jspm_packages', 'site-packages', '__pycache__',
+})
+# Names that are only conventionally vendored or build output at the top
+# of the tree (deeper down, a package may well be called dist); nested
+# ones are left to .gitignore
+TOP_LEVEL_VENDORED_DIRS = frozenset({'vendor', 'third_party', 'dist'})
+# A virtualenv, whatever it is called, has this file at its root
+VIRTUALENV_MARKER = 'pyvenv.cfg'
+
+_GENERATED_NAME_RE = re.compile(
+    r'(\.min\.js|[.-]bundle\.js|_pb2(_grpc)?\.py|\.pb\.go|_generated\.go'
+    r'|\.generated\.\w+|\.g\.dart)$'
+)
+_GENERATED_MARKER_RE = re.compile(
+    rb'@generated|do not edit|automatically generated|auto-?generated (?:file|code|by)',
+    re.IGNORECASE
+)
+# Comments and docstrings that may hold the marker, before any code
+_LINE_COMMENTS = (b'#', b'//', b'--', b'*')
+_BLOCK_COMMENTS = ((b'/*', b'*/'), (b'"""', b'"""'), (b"'''", b"'''"), (b'<!--', b'-->'))
+# Sniffed text with lines longer than this on average is minified
+_MINIFIED_LINE_LENGTH = 500
+
+
+@dataclass
+class ScanStats:
+    """What scan_files() skipped, for callers that pass one in"""
+    vendored_dirs: int = 0
+    ignored: int = 0
+    generated: int = 0
+    binary: int = 0
+    unreadable: int = 0
+
+
+class SourceFile(NamedTuple):
+    """A file scan_files() found worth parsing"""
+    path: str
+    language: str
+    size: int
+
+
+class _IgnoreRule(NamedTuple):
+    pattern: 're.Pattern'
+    negate: bool
+    dir_only: bool
+
+
+def _translate_glob(glob: str) -> str:
+    """Regex for one gitignore glob (wildmatch rules: * stops at /, ** does not)"""
+    parts = []
+    i = 0
+    while i < len(glob):
+        c = glob[i]
+        if glob.startswith('**/', i):
+            parts.append('(?:.*/)?')
+            i += 3
+            continue
+        if glob.startswith('**', i):
+            parts.append('.*')
+            i += 2
+            continue
+        if c == '*':
+            parts.append('[^/]*')
+        elif c == '?':
+            parts.append('[^/]')
+        elif c == '[':
+            end = glob.find(']', i + 2)
+            if end < 0:
+                parts.append(re.escape(c))
+            else:
+                body = glob[i + 1:end]
+                if body[0] == '!':
+                    body = '^' + body[1:]
+                parts.append('[' + body.replace('\\', '\\\\') + ']')
+                i = end
+        elif c == '\\' and i + 1 < len(glob):
+            i += 1
+            parts.append(re.escape(glob[i]))
+        else:
+            parts.append(re.escape(c))
+        i += 1
+    return ''.join(parts)
+
+
+def _parse_ignore_line(line: str) -> Optional[_IgnoreRule]:
+    line = line.rstrip('\n').rstrip('\r')
+    if not line.endswith('\\ '):
+        line = line.rstrip(' ')
+    if not line or line.startswith('#'):
+        return None
+
+    negate = line.startswith('!')
+    if negate or line.startswith('\\!') or line.startswith('\\#'):
+        line = line[1:]
+    dir_only = line.endswith('/')
+    line = line.rstrip('/')
+    if not line:
+        return None
+
+    # A slash anywhere but the end anchors the pattern to the .gitignore's directory
+    anchored = '/' in line
+    line = line.lstrip('/')
+    prefix = '' if anchored else '(?:.*/)?'
+    return _IgnoreRule(re.compile(prefix + _translate_glob(line) + r'\Z', re.DOTALL),
+                       negate, dir_only)
+
+
+def _load_ignore_file(path: str) -> List[_IgnoreRule]:
+    try:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            rules = [_parse_ignore_line(line) for line in f]
+    except OSError:
+        return []
+    return [rule for rule in rules if rule is not None]
+
+
+# (directory relative to the root, its rules), outermost first
+_IgnoreChain = List[Tuple[str, List[_IgnoreRule]]]
+
+
+def _ignored(chain: _IgnoreChain, path: str, is_dir: bool) -> bool:
+    """Whether a root-relative POSIX path is ignored; the last matching rule wins"""
+    ignored = False
+    for base, rules in chain:
+        relative = path[len(base) + 1:] if base else path
+        for rule in rules:
+            if (is_dir or not rule.dir_only) and rule.pattern.match(relative):
+                ignored = not rule.negate
+    return ignored
+
+
+def _shebang_language(head: bytes) -> str:
+    """Language named by a #! line, e.g. #!/usr/bin/env python3"""
+    if not head.startswith(b'#!'):
+        return 'unknown'
+    line = head[2:].split(b'\n', 1)[0].decode('utf-8', 'replace')
+    words = [w for w in line.split() if not w.startswith('-')]
+    if words and os.path.basename(words[0]) == 'env':
+        words = words[1:]
+    if not words:
+        return 'unknown'
+    interpreter = os.path.basename(words[0])
+    if interpreter.startswith('python'):
+        return 'python'
+    if interpreter in ('node', 'nodejs'):
+        return 'javascript'
+    if interpreter in ('ts-node', 'deno', 'tsx'):
+        return 'typescript'
+    return 'unknown'
+
+
+def _generated_header(head: bytes) -> bool:
+    """
+    Whether a generated-file marker appears in the header: the comments,
+    docstring and blank lines in the first KB before any code
+    """
+    closing = None  # End of an open block comment or docstring
+    for line in head[:1024].splitlines():
+        stripped = line.strip()
+        if closing is not None:
+            if closing in stripped:
+                closing = None
+        else:
+            for opening, end in _BLOCK_COMMENTS:
+                if stripped.startswith(opening):
+                    if end not in stripped[len(opening):]:
+                        closing = end
+                    break
+            else:
+                if stripped and not stripped.startswith(_LINE_COMMENTS):
+                    return False
+        if _GENERATED_MARKER_RE.search(line):
+            return True
+    return False
+
+
+def _looks_generated(head: bytes) -> bool:
+    if _generated_header(head):
+        return True
+    # Minified: long lines all the way through the sniffed block
+    return len(head) >= SNIFF_BYTES // 2 and \
+        len(head) > (head.count(b'\n') + 1) * _MINIFIED_LINE_LENGTH
+
+
+def scan_files(root: str, languages: Optional[Iterable[str]] = None,
+               gitignore: bool = True, skip_vendored: bool = True,
+               skip_generated: bool = True,
+               stats: Optional[ScanStats] = None) -> Iterator[SourceFile]:
+    """
+    Source files under a directory, in sorted path order
+
+    Hidden directories are skipped, and so are, by default:
+
+    - paths excluded by .gitignore files (nested ones included, with git's
+      glob, anchoring, directory-only and negation rules) and by
+      .git/info/exclude
+    - vendored directories: node_modules and the like at any depth
+      (VENDORED_DIRS), vendor, third_party and dist at the top of the tree
+      (TOP_LEVEL_VENDORED_DIRS), and virtualenvs, found by their
+      pyvenv.cfg rather than by name
+    - generated files, recognised by name (*.min.js, *_pb2.py, ...), by a
+      marker such as @generated in the header comments or docstring, or by
+      minified line lengths
+    - binary files (a NUL byte in the first SNIFF_BYTES)
+
+    The language comes from the extension, or for files without one from
+    a #! line; files are only opened to read their first SNIFF_BYTES.
+
+    Args:
+        root: Directory to scan
+        languages: Only yield these languages (default: all recognised)
+        gitignore: Honour .gitignore files
+        skip_vendored: Skip vendored directories and virtualenvs
+        skip_generated: Skip generated and minified files
+        stats: Counts what was skipped, if given
+
+    Returns:
+        Iterator of SourceFile
+    """
+    wanted = set(languages) if languages is not None else None
+    stats = stats if stats is not None else ScanStats()
+
+    base_chain: _IgnoreChain = []
+    if gitignore:
+        exclude = _load_ignore_file(os.path.join(root, '.git', 'info', 'exclude'))
+        if exclude:
+            base_chain.append(('', exclude))
+    chains = {root: base_chain}
+
+    for dirpath, dirnames, filenames in os.walk(root):
+        chain = chains.pop(dirpath, base_chain)
+        relative_dir = os.path.relpath(dirpath, root).replace(os.sep, '/')
+        if relative_dir == '.':
+            relative_dir = ''
+        if gitignore and '.gitignore' in filenames:
+            rules = _load_ignore_file(os.path.join(dirpath, '.gitignore'))
+            if rules:
+                chain = chain + [(relative_dir, rules)]
+
+        kept = []
+        for name in sorted(dirnames):
+            if name.startswith('.'):
+                continue
+            if skip_vendored and (
+                    name in VENDORED_DIRS
+                    or (not relative_dir and name in TOP_LEVEL_VENDORED_DIRS)
+                    or os.path.isfile(os.path.join(dirpath, name, VIRTUALENV_MARKER))):
+                stats.vendored_dirs += 1
+                continue
+            relative = f"{relative_dir}/{name}" if relative_dir else name
+            if chain and _ignored(chain, relative, True):
+                stats.ignored += 1
+                continue
+            kept.append(name)
+            chains[os.path.join(dirpath, name)] = chain
+        dirnames[:] = kept
+
+        for name in sorted(filenames):
+            language = language_from_extension(name)
+            has_extension = '.' in name.lstrip('.')
+            if language == 'unknown' and has_extension:
+                continue  # Only extensionless files can still be scripts
+            if wanted is not None and language != 'unknown' and language not in wanted:
+                continue
+            if skip_generated and _GENERATED_NAME_RE.search(name):
+                stats.generated += 1
+                continue
+            relative = f"{relative_dir}/{name}" if relative_dir else name
+            if chain and _ignored(chain, relative, False):
+                stats.ignored += 1
+                continue
+
+            path = os.path.join(dirpath, name)
+            try:
+                with open(path, 'rb') as f:
+                    size = os.fstat(f.fileno()).st_size
+                    head = f.read(SNIFF_BYTES)
+            except OSError:
+                stats.unreadable += 1
+                continue
+
+            if b'\0' in head:
+                stats.binary += 1
+                continue
+            if language == 'unknown':
+                language = _shebang_language(head)
+                if language == 'unknown' or (wanted is not None and language not in wanted):
+                    continue
+            if skip_generated and _looks_generated(head):
+                stats.generated += 1
+                continue
+            yield SourceFile(path, language, size)
+
+
+@contextmanager
+def map_source(path: str) -> Iterator[memoryview]:
+    """
+    Memory-map a file and expose it as a read-only memoryview
+
+    Slices of the view are zero-copy; they must not outlive the with block.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield memoryview(b'')  # Empty files cannot be mapped
+            return
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        try:
+            yield view
+        finally:
+            view.release()
+            mapped.close()
+
+
+def read_source(path: str, errors: str = 'strict') -> str:
+    """
+    Decode a UTF-8 file straight from its memory map
+
+    Equivalent to open(path, encoding='utf-8', newline='').read() without
+    the intermediate bytes copy.
+    """
+    with map_source(path) as data:
+        return str(data, 'utf-8', errors)
@@ -0,0 +1,265 @@
+"""
+Vectorized similarity for SimHash fingerprints and feature vectors (requires NumPy)
+
+Fingerprints are packed into a ``(n, words)`` uint64 matrix once, after which
+one query is compared against every row in a single vectorized call. A
+FingerprintArray can be passed wherever a packed matrix is expected; it is
+viewed in place rather than copied.
+
+FeatureMatrix does the same for CrossLanguageFingerprint feature vectors,
+ranking stored vectors by cosine similarity or L1 distance.
+"""
+
+from typing import Iterable, List, Tuple, Union
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is an optional dependency
+    np = None
+
+from .storage import FingerprintArray
+
+
+Fingerprint = Union[str, int]
+Packed = Union['np.ndarray', FingerprintArray]
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("Vectorized similarity requires NumPy: "
+                          "pip install anvil-core[numpy]")
+
+
+def _words(bits: int) -> int:
+    if bits not in (64, 128):
+        raise ValueError(f"bits must be 64 or 128, got {bits}")
+    return bits // 64
+
+
+def _as_matrix(packed: Packed) -> 'np.ndarray':
+    if isinstance(packed, FingerprintArray):
+        return packed.to_numpy()
+    return packed.reshape(len(packed), -1)
+
+
+def _split(fp: Fingerprint, words: int) -> List[int]:
+    """Split a fingerprint into 64-bit words, most significant first"""
+    value = int(fp, 16) if isinstance(fp, str) else fp
+    return [(value >> (64 * (words - 1 - i))) & 0xFFFFFFFFFFFFFFFF
+            for i in range(words)]
+
+
+def pack_fingerprints(fingerprints: Iterable[Fingerprint], bits: int = 64) -> 'np.ndarray':
+    """
+    Pack hex or integer fingerprints into a uint64 matrix
+
+    Args:
+        fingerprints: Hex strings or integers
+        bits: Fingerprint width (64 or 128)
+
+    Returns:
+        Array of shape (n, bits // 64) and dtype uint64
+    """
+    _require_numpy()
+    words = _words(bits)
+    if words == 1:
+        values = (int(fp, 16) if isinstance(fp, str) else fp for fp in fingerprints)
+        return np.fromiter(values, dtype=np.uint64).reshape(-1, 1)
+
+    rows = [_split(fp, words) for fp in fingerprints]
+    return np.array(rows, dtype=np.uint64).reshape(len(rows), words)
+
+
+if np is not None and hasattr(np, 'bitwise_count'):
+    def _popcount(values: 'np.ndarray') -> 'np.ndarray':
+        return np.bitwise_count(values).sum(axis=-1, dtype=np.uint32)
+elif np is not None:
+    _BYTE_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+    def _popcount(values: 'np.ndarray') -> 'np.ndarray':
+        as_bytes = np.ascontiguousarray(values).view(np.uint8)
+        return _BYTE_POPCOUNT[as_bytes].reshape(len(values), -1).sum(axis=-1, dtype=np.uint32)
+
+
+def hamming_distances(query: Fingerprint, packed: Packed) -> 'np.ndarray':
+    """
+    Hamming distance from query to every packed fingerprint
+
+    Args:
+        query: Hex string or integer fingerprint
+        packed: Matrix from pack_fingerprints, or a FingerprintArray
+
+    Returns:
+        uint32 array with one distance per row
+    """
+    _require_numpy()
+    packed = _as_matrix(packed)
+    target = np.array(_split(query, packed.shape[1]), dtype=np.uint64)
+    return _popcount(np.bitwise_xor(packed, target))
+
+
+def batch_similarity(query: Fingerprint, packed: Packed) -> 'np.ndarray':
+    """
+    Similarity (0.0 to 1.0) from query to every packed fingerprint
+
+    Uses the same measure as CodeFingerprint.similarity in simhash mode.
+    """
+    _require_numpy()
+    packed = _as_matrix(packed)
+    bits = packed.shape[1] * 64
+    return 1.0 - hamming_distances(query, packed) / bits
+
+
+def find_similar_batch(query: Fingerprint, packed: Packed,
+                       threshold: float = 0.8) -> List[Tuple[int, float]]:
+    """
+    Find packed fingerprints similar to query
+
+    Returns:
+        List of (row index, similarity) tuples above threshold,
+        most similar first
+    """
+    similarities = batch_similarity(query, packed)
+    rows = np.nonzero(similarities >= threshold)[0]
+    order = rows[np.argsort(-similarities[rows], kind='stable')]
+    return [(int(i), float(similarities[i])) for i in order]
+
+
+class FeatureMatrix:
+    """
+    Growable matrix of structural feature vectors with batched top-k search
+
+    Rows are stored as float32 in one contiguous array (capacity doubles as
+    it fills), alongside their norms so cosine queries are a single matrix
+    product. Queries are processed in row blocks, which bounds the memory
+    of the intermediate L1 differences for very large stores.
+
+    Example:
+        fingerprinter = CrossLanguageFingerprint()
+        matrix = FeatureMatrix(FEATURE_DIM)
+        matrix.add_many(fingerprinter.feature_vector(code, lang) for code, lang in blocks)
+        matrix.top_k(fingerprinter.feature_vector(snippet, 'javascript'), k=10)
+    """
+
+    METRICS = ('cosine', 'l1')
+    BLOCK_ROWS = 65536
+
+    def __init__(self, dim: int, capacity: int = 1024):
+        _require_numpy()
+        if dim < 1:
+            raise ValueError(f"dim must be positive, got {dim}")
+
+        self.dim = dim
+        self._rows = np.zeros((max(capacity, 1), dim), dtype=np.float32)
+        self._norms = np.zeros(max(capacity, 1), dtype=np.float32)
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def vectors(self) -> 'np.ndarray':
+        """The stored rows (a view, not a copy)"""
+        return self._rows[:self._size]
+
+    def add(self, vector: Iterable[float]) -> int:
+        """
+        Append one vector
+
+        Returns:
+            Row number of the vector
+        """
+        return self.add_many([vector]).start
+
+    def add_many(self, vectors: Iterable[Iterable[float]]) -> range:
+        """
+        Append several vectors
+
+        Returns:
+            Range of the row numbers assigned to them
+        """
+        block = np.asarray(vectors if isinstance(vectors, np.ndarray) else list(vectors),
+                           dtype=np.float32)
+        if block.size == 0:
+            return range(self._size, self._size)
+        block = block.reshape(-1, self.dim) if block.ndim == 1 else block
+        if block.shape[1] != self.dim:
+            raise ValueError(f"Expected vectors of length {self.dim}, got {block.shape[1]}")
+
+        start, end = self._size, self._size + len(block)
+        if end > len(self._rows):
+            capacity = max(end, len(self._rows) * 2)
+            rows = np.zeros((capacity, self.dim), dtype=np.float32)
+            rows[:start] = self._rows[:start]
+            norms = np.zeros(capacity, dtype=np.float32)
+            norms[:start] = self._norms[:start]
+            self._rows, self._norms = rows, norms
+
+        self._rows[start:end] = block
+        self._norms[start:end] = np.linalg.norm(block, axis=1)
+        self._size = end
+        return range(start, end)
+
+    def top_k(self, query: Iterable[float], k: int = 10,
+              metric: str = 'cosine') -> List[Tuple[int, float]]:
+        """
+        Find the rows closest to one query vector
+
+        Returns:
+            Up to k (row, score) tuples, best first; the score is cosine
+            similarity (higher is closer) or L1 distance (lower is closer)
+        """
+        return self.top_k_batch([query], k, metric)[0]
+
+    def top_k_batch(self, queries: Iterable[Iterable[float]], k: int = 10,
+                    metric: str = 'cosine') -> List[List[Tuple[int, float]]]:
+        """
+        Find the rows closest to each of several query vectors
+
+        Returns:
+            One top_k() result list per query
+        """
+        if metric not in self.METRICS:
+            raise ValueError(f"metric must be one of {self.METRICS}, got {metric!r}")
+
+        queries = np.asarray(queries if isinstance(queries, np.ndarray) else list(queries),
+                             dtype=np.float32).reshape(-1, self.dim)
+        k = min(k, self._size)
+        if k <= 0:
+            return [[] for _ in range(len(queries))]
+
+        if metric == 'cosine':
+            norms = np.linalg.norm(queries, axis=1)
+            queries = queries / np.where(norms == 0, 1, norms)[:, None]
+
+        # Keep the best k of every block, then pick the overall best k
+        best_rows, best_scores = [], []
+        for start in range(0, self._size, self.BLOCK_ROWS):
+            end = min(start + self.BLOCK_ROWS, self._size)
+            scores = self._block_scores(queries, start, end, metric)
+            keep = min(k, end - start)
+            rows = np.argpartition(scores, keep - 1, axis=1)[:, :keep]
+            best_rows.append(rows + start)
+            best_scores.append(np.take_along_axis(scores, rows, axis=1))
+
+        rows = np.concatenate(best_rows, axis=1)
+        scores = np.concatenate(best_scores, axis=1)
+
+        results = []
+        for query_rows, query_scores in zip(rows, scores):
+            order = np.lexsort((query_rows, query_scores))[:k]
+            sign = -1.0 if metric == 'cosine' else 1.0
+            results.append([(int(query_rows[i]), float(sign * query_scores[i]))
+                            for i in order])
+        return results
+
+    def _block_scores(self, queries: 'np.ndarray', start: int, end: int,
+                      metric: str) -> 'np.ndarray':
+        """Scores for rows start:end where lower is better"""
+        rows = self._rows[start:end]
+        if metric == 'cosine':
+            norms = self._norms[start:end]
+            similarity = (queries @ rows.T) / np.where(norms == 0, 1, norms)
+            return -similarity
+        # One query at a time keeps the temporary at block size
+        return np.stack([np.abs(rows - query).sum(axis=1) for query in queries])
@@ -0,0 +1,236 @@
+"""
+Compact array-backed fingerprint storage
+"""
+
+import mmap
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from typing import Iterable, Iterator, List, Optional, Union
+
+
+Fingerprint = Union[str, int]
+
+_MAGIC = b'ANVILFP\0'
+# magic, bits, flags, reserved, count
+_HEADER = struct.Struct('<8sHHIQ')
+_FLAG_SORTED = 1
+_FLAG_BIG_ENDIAN = 2
+
+_WORD_MASK = 0xFFFFFFFFFFFFFFFF
+
+
+class FingerprintArray:
+    """
+    Fixed-width fingerprints packed as uint64 words in one contiguous buffer
+
+    A 64-bit fingerprint takes 8 bytes (a 16-char hex str takes ~65 bytes
+    plus a list slot), 128-bit ones take two words, most significant first,
+    so numeric order and word order agree. Arrays can be sorted for binary
+    search membership tests and saved to a file that load() maps back
+    without copying.
+    """
+
+    def __init__(self, bits: int = 64):
+        if bits not in (64, 128):
+            raise ValueError(f"bits must be 64 or 128, got {bits}")
+
+        self.bits = bits
+        self.words = bits // 64
+        self.is_sorted = True
+        self._data = array('Q')
+        self._view: Optional[memoryview] = None  # Set when backed by a mapped file
+        self._mmap: Optional[mmap.mmap] = None
+
+    @classmethod
+    def from_hex(cls, fingerprints: Iterable[str], bits: int = 64) -> 'FingerprintArray':
+        """Pack hex fingerprints"""
+        result = cls(bits)
+        result.extend(fingerprints)
+        return result
+
+    @classmethod
+    def from_ints(cls, fingerprints: Iterable[int], bits: int = 64) -> 'FingerprintArray':
+        """Pack integer fingerprints"""
+        result = cls(bits)
+        result.extend(fingerprints)
+        return result
+
+    def __len__(self) -> int:
+        return len(self._buffer) // self.words
+
+    def __getitem__(self, i: int) -> int:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("FingerprintArray index out of range")
+        return self._value_at(i)
+
+    def __iter__(self) -> Iterator[int]:
+        for i in range(len(self)):
+            yield self._value_at(i)
+
+    def __contains__(self, fp: Fingerprint) -> bool:
+        return self.contains(fp)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def _buffer(self):
+        return self._view if self._view is not None else self._data
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the packed data in bytes"""
+        return len(self._buffer) * 8
+
+    def _value_at(self, i: int) -> int:
+        buffer = self._buffer
+        if self.words == 1:
+            return buffer[i]
+        return (buffer[2 * i] << 64) | buffer[2 * i + 1]
+
+    def _to_int(self, fp: Fingerprint) -> int:
+        value = int(fp, 16) if isinstance(fp, str) else fp
+        if value < 0 or value >> self.bits:
+            raise ValueError(f"Fingerprint {fp!r} does not fit in {self.bits} bits")
+        return value
+
+    def append(self, fp: Fingerprint):
+        """Append a hex or integer fingerprint"""
+        if self._view is not None:
+            raise TypeError("FingerprintArray loaded from a file is read-only")
+
+        value = self._to_int(fp)
+        if self.is_sorted and len(self) and value < self._value_at(len(self) - 1):
+            self.is_sorted = False
+
+        if self.words == 1:
+            self._data.append(value)
+        else:
+            self._data.append(value >> 64)
+            self._data.append(value & _WORD_MASK)
+
+    def extend(self, fingerprints: Iterable[Fingerprint]):
+        """Append several fingerprints"""
+        for fp in fingerprints:
+            self.append(fp)
+
+    def sort(self):
+        """Sort in place so contains() can binary search"""
+        if self.is_sorted:
+            return
+        if self._view is not None:
+            raise TypeError("FingerprintArray loaded from a file is read-only")
+
+        if self.words == 1:
+            self._data = array('Q', sorted(self._data))
+        else:
+            data = array('Q')
+            for value in sorted(self):
+                data.append(value >> 64)
+                data.append(value & _WORD_MASK)
+            self._data = data
+        self.is_sorted = True
+
+    def contains(self, fp: Fingerprint) -> bool:
+        """Membership test: binary search when sorted, a scan otherwise"""
+        value = self._to_int(fp)
+        if self.is_sorted:
+            return self.index(value) is not None
+        return any(v == value for v in self)
+
+    def index(self, fp: Fingerprint) -> Optional[int]:
+        """Position of a fingerprint in a sorted array, or None"""
+        if not self.is_sorted:
+            raise ValueError("index() needs a sorted array, call sort() first")
+
+        value = self._to_int(fp)
+        if self.words == 1:
+            i = bisect_left(self._buffer, value)
+        else:
+            lo, hi = 0, len(self)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if self._value_at(mid) < value:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            i = lo
+        return i if i < len(self) and self._value_at(i) == value else None
+
+    def hex(self, i: int) -> str:
+        """Hex form of the fingerprint at position i"""
+        return format(self[i], f'0{self.bits // 4}x')
+
+    def iter_hex(self) -> Iterator[str]:
+        """Iterate over the fingerprints in hex form"""
+        width = f'0{self.bits // 4}x'
+        for value in self:
+            yield format(value, width)
+
+    def to_hex(self) -> List[str]:
+        """Convert back to the hex string form used elsewhere"""
+        return list(self.iter_hex())
+
+    def to_numpy(self):
+        """
+        View the data as a (n, bits // 64) uint64 NumPy array without copying
+        """
+        import numpy as np
+        return np.frombuffer(self._buffer, dtype=np.uint64).reshape(-1, self.words)
+
+    def save(self, path: str):
+        """Write the array to a file that load() can map"""
+        flags = _FLAG_SORTED if self.is_sorted else 0
+        if sys.byteorder == 'big':
+            flags |= _FLAG_BIG_ENDIAN
+
+        with open(path, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, self.bits, flags, 0, len(self)))
+            f.write(memoryview(self._buffer).cast('B'))
+
+    @classmethod
+    def load(cls, path: str, use_mmap: bool = True) -> 'FingerprintArray':
+        """
+        Load an array written by save()
+
+        With use_mmap the file is mapped and used in place (read-only, no
+        copy); otherwise it is read into a regular, appendable array.
+        """
+        with open(path, 'rb') as f:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                raise ValueError(f"{path} is not a fingerprint array")
+            magic, bits, flags, _, count = _HEADER.unpack(header)
+            if magic != _MAGIC:
+                raise ValueError(f"{path} is not a fingerprint array")
+            if bool(flags & _FLAG_BIG_ENDIAN) != (sys.byteorder == 'big'):
+                raise ValueError(f"{path} was written on a machine with another byte order")
+
+            result = cls(bits)
+            result.is_sorted = bool(flags & _FLAG_SORTED)
+            size = count * result.words * 8
+
+            if use_mmap and size:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                result._mmap = mapped
+                result._view = memoryview(mapped)[_HEADER.size:_HEADER.size + size].cast('Q')
+            else:
+                result._data.frombytes(f.read(size))
+
+        return result
+
+    def close(self):
+        """Release the file mapping, if any"""
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
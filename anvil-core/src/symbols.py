@@ -0,0 +1,222 @@
+"""
+Line-to-symbol index: which function or class encloses a given line
+"""
+
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from .cache import blob_sha
+from .parsers import get_parser
+
+
+class Symbol(NamedTuple):
+    """A function or class and its place in the nesting"""
+    qualified_name: str
+    kind: str  # 'function' or 'class'
+    start_line: int
+    end_line: int
+    parent: int = -1  # Index of the enclosing symbol in SymbolIndex.symbols, or -1
+    depth: int = 0
+
+
+class SymbolIndex:
+    """
+    Sorted-array index from line numbers to the symbols that contain them
+
+    Definitions either nest or do not overlap, so their line ranges cut
+    the file into segments, each owned by the innermost symbol covering it.
+    The segment start lines are kept in one sorted list, so point lookups
+    and the innermost symbols of a range are a binary search away
+    (O(log n), plus the size of the answer for ranges). Parent links give
+    the enclosing chain. A range that crosses its enclosing symbol's end
+    (not produced by the parsers here) is clipped to it.
+    """
+
+    def __init__(self, symbols: Iterable[Tuple[str, str, int, int]]):
+        """
+        Args:
+            symbols: (qualified_name, kind, start_line, end_line) tuples, in any order
+        """
+        ordered = sorted(symbols, key=lambda s: (s[2], -s[3]))
+
+        self.symbols: List[Symbol] = []
+        self._starts: List[int] = []
+        self._bounds: List[int] = []  # First line of each segment
+        self._owners: List[int] = []  # Innermost symbol of each segment, or -1
+
+        stack: List[int] = []
+        for name, kind, start, end in ordered:
+            while stack and self.symbols[stack[-1]].end_line < start:
+                self._close(stack)
+            parent = stack[-1] if stack else -1
+            if parent >= 0:
+                end = min(end, self.symbols[parent].end_line)
+            index = len(self.symbols)
+            self.symbols.append(Symbol(name, kind, start, end, parent, len(stack)))
+            self._starts.append(start)
+            self._segment(start, index)
+            stack.append(index)
+        while stack:
+            self._close(stack)
+
+    @classmethod
+    def from_definitions(cls, functions: Iterable, classes: Iterable = ()) -> 'SymbolIndex':
+        """
+        Build from FunctionInfo/ClassInfo objects or their repository records
+
+        Anything with name (or qualified_name), start_line and end_line works.
+        """
+        def entries(items, kind):
+            for item in items:
+                name = getattr(item, 'qualified_name', None) or item.name
+                yield name, kind, item.start_line, item.end_line
+
+        return cls(list(entries(functions, 'function')) + list(entries(classes, 'class')))
+
+    @classmethod
+    def from_source(cls, code: str, language: str = 'python') -> 'SymbolIndex':
+        """
+        Parse code and index its definitions
+
+        Raises:
+            SyntaxError: If Python code cannot be parsed
+            ValueError: If the language has no parser
+        """
+        parser = get_parser(language)
+        summary = parser.summarize(parser.parse(code))
+        return cls.from_definitions(summary.functions, summary.classes)
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    def _segment(self, line: int, owner: int):
+        if self._bounds and self._bounds[-1] == line:
+            self._owners[-1] = owner
+        else:
+            self._bounds.append(line)
+            self._owners.append(owner)
+
+    def _close(self, stack: List[int]):
+        ended = stack.pop()
+        self._segment(self.symbols[ended].end_line + 1, stack[-1] if stack else -1)
+
+    def _owner_at(self, line: int) -> int:
+        i = bisect_right(self._bounds, line) - 1
+        return self._owners[i] if i >= 0 else -1
+
+    def innermost(self, line: int) -> Optional[Symbol]:
+        """The innermost symbol containing a line, or None"""
+        owner = self._owner_at(line)
+        return self.symbols[owner] if owner >= 0 else None
+
+    def enclosing(self, line: int) -> List[Symbol]:
+        """Every symbol containing a line, outermost first"""
+        chain = []
+        owner = self._owner_at(line)
+        while owner >= 0:
+            chain.append(self.symbols[owner])
+            owner = self.symbols[owner].parent
+        chain.reverse()
+        return chain
+
+    def overlapping(self, start_line: int, end_line: int) -> List[Symbol]:
+        """Every symbol sharing at least one line with a range, in start order"""
+        if end_line < start_line:
+            return []
+        result = self.enclosing(start_line)
+        first = bisect_right(self._starts, start_line)
+        last = bisect_right(self._starts, end_line)
+        result.extend(self.symbols[first:last])
+        return result
+
+    def innermost_in_range(self, start_line: int, end_line: int) -> List[Symbol]:
+        """
+        The distinct innermost symbols of the lines in a range, in line order
+
+        This is what a diff hunk touching those lines is attributed to.
+        """
+        if end_line < start_line or not self._bounds:
+            return []
+        first = max(bisect_right(self._bounds, start_line) - 1, 0)
+        last = bisect_right(self._bounds, end_line)
+        seen = set()
+        result = []
+        for owner in self._owners[first:last]:
+            if owner >= 0 and owner not in seen:
+                seen.add(owner)
+                result.append(self.symbols[owner])
+        return result
+
+    def innermost_many(self, lines: Sequence[int]) -> List[Optional[Symbol]]:
+        """
+        innermost() for many lines at once
+
+        The lines are sorted and merged against the segment list, so the
+        cost is one sort plus a single pass instead of a search per line.
+        """
+        result: List[Optional[Symbol]] = [None] * len(lines)
+        bounds, owners = self._bounds, self._owners
+        segment = -1
+        for i in sorted(range(len(lines)), key=lines.__getitem__):
+            line = lines[i]
+            while segment + 1 < len(bounds) and bounds[segment + 1] <= line:
+                segment += 1
+            if segment >= 0 and owners[segment] >= 0:
+                result[i] = self.symbols[owners[segment]]
+        return result
+
+    def attribute_hunks(self, hunks: Iterable[Tuple[int, int]]) -> List[List[Symbol]]:
+        """innermost_in_range() for each (start_line, end_line) of many hunks"""
+        return [self.innermost_in_range(start, end) for start, end in hunks]
+
+
+class SymbolIndexCache:
+    """
+    Size-bounded LRU of SymbolIndex objects, one per file version
+
+    A version is identified by the git blob hash of its content, so
+    indexes built from a working-tree file and from the same blob in
+    history are shared. Thread-safe.
+    """
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[Tuple[str, str], SymbolIndex]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, code: str, language: str = 'python',
+            version: Optional[str] = None) -> SymbolIndex:
+        """
+        Index for a file's content, built on first use
+
+        Args:
+            code: File content
+            language: Language name as returned by parsers.detect_language
+            version: Blob hash of the content, when the caller already has it
+
+        Raises:
+            SyntaxError: If Python code cannot be parsed
+            ValueError: If the language has no parser
+        """
+        key = (language, version or blob_sha(code.encode('utf-8', 'surrogatepass')))
+        with self._lock:
+            index = self._entries.get(key)
+            if index is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return index
+            self.misses += 1
+
+        index = SymbolIndex.from_source(code, language)
+        with self._lock:
+            self._entries[key] = index
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return index
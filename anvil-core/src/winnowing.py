@@ -0,0 +1,347 @@
+"""
+Winnowing k-gram fingerprints for partial clone detection
+
+Code is reduced to a stream of normalized tokens, every run of ``k``
+consecutive tokens is hashed, and winnowing keeps the minimum hash of each
+window of ``window`` consecutive k-grams (Schleimer, Wilkerson and Aiken,
+"Winnowing: Local Algorithms for Document Fingerprinting"). Any shared run
+of at least ``k + window - 1`` tokens is guaranteed to share a selected
+hash, so copied-and-extended code is still found.
+"""
+
+import hashlib
+import io
+import keyword
+import re
+import tokenize
+from bisect import bisect_right
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .models import FileLocation
+
+
+# Languages whose line comments start with '#'; the rest use // and /* */
+_HASH_COMMENT_LANGUAGES = {'python', 'ruby', 'shell', 'perl', 'r', 'unknown'}
+
+_STRING_PATTERNS = [
+    r'"""(?:\\.|.)*?"""',
+    r"'''(?:\\.|.)*?'''",
+    r'"(?:\\.|[^"\\\n])*"',
+    r"'(?:\\.|[^'\\\n])*'",
+    r'`(?:\\.|[^`\\])*`',
+]
+_TOKEN_PATTERN = '|'.join([
+    '(?P<string>' + '|'.join(_STRING_PATTERNS) + ')',
+    r'(?P<comment>/\*.*?\*/|//[^\n]*{hash_comment})',
+    r'(?P<number>\d[\w.]*)',
+    r'(?P<name>\w+)',
+    r'(?P<punct>[^\w\s])',
+])
+_TOKEN_RE = re.compile(_TOKEN_PATTERN.format(hash_comment=''), re.DOTALL)
+_HASH_TOKEN_RE = re.compile(_TOKEN_PATTERN.format(hash_comment=r'|#[^\n]*'), re.DOTALL)
+
+# Identifiers kept as-is when variable names are ignored
+_KEYWORDS = {
+    'python': frozenset(keyword.kwlist),
+    None: frozenset({
+        'abstract', 'async', 'await', 'break', 'case', 'catch', 'class', 'const',
+        'continue', 'default', 'defer', 'delete', 'do', 'else', 'enum', 'export',
+        'extends', 'false', 'final', 'finally', 'fn', 'for', 'func', 'function',
+        'go', 'if', 'impl', 'implements', 'import', 'in', 'instanceof', 'interface',
+        'let', 'loop', 'match', 'mut', 'new', 'null', 'package', 'private',
+        'protected', 'pub', 'public', 'return', 'static', 'struct', 'super',
+        'switch', 'this', 'throw', 'throws', 'trait', 'true', 'try', 'type',
+        'typeof', 'var', 'void', 'while', 'yield',
+    }),
+}
+
+# Python 3.12+ splits f-strings into several tokens
+_FSTRING_TOKENS = {getattr(tokenize, name) for name in
+                   ('FSTRING_START', 'FSTRING_MIDDLE', 'FSTRING_END')
+                   if hasattr(tokenize, name)}
+
+# Karp-Rabin base for rolling k-gram hashes (any odd 64-bit constant works)
+_BASE = 0x100000001B3
+_MASK = 0xFFFFFFFFFFFFFFFF
+
+# (normalized text, line)
+Token = Tuple[str, int]
+
+
+@dataclass
+class WinnowFingerprint:
+    """A selected k-gram hash and the lines its tokens span"""
+    hash: int
+    start_line: int
+    end_line: int
+
+
+@dataclass
+class WinnowMatch:
+    """A region of an indexed document sharing k-grams with a query"""
+    location: FileLocation
+    shared: int  # Distinct query hashes found in the region
+
+
+def tokenize_code(code: str, language: str = 'python',
+                  ignore_comments: bool = True,
+                  ignore_variable_names: bool = False,
+                  ignore_string_literals: bool = False) -> List[Token]:
+    """
+    Split code into normalized tokens tagged with their line numbers
+
+    Identifiers become ``V`` and string literals ``S`` when the matching
+    option is set, so renamed copies produce the same tokens. Whitespace is
+    never part of the stream. Python is read with the tokenize module; other
+    languages (and Python that does not tokenize) use a generic lexer that
+    knows about quotes and C-style or ``#`` comments.
+    """
+    if language == 'python':
+        tokens = []
+        try:
+            _python_tokens(code, tokens, ignore_comments,
+                           ignore_variable_names, ignore_string_literals)
+            return tokens
+        except (tokenize.TokenError, SyntaxError):
+            pass
+
+        # Snippets often end mid-statement or mid-string: keep what
+        # tokenized and lex the rest generically
+        lines = code.splitlines(keepends=True)
+        done = tokens[-1][1] - 1 if tokens else 0
+        tokens = [token for token in tokens if token[1] <= done]
+        rest = _generic_tokens(''.join(lines[done:]), language, ignore_comments,
+                               ignore_variable_names, ignore_string_literals)
+        return tokens + [(text, line + done) for text, line in rest]
+
+    return _generic_tokens(code, language, ignore_comments,
+                           ignore_variable_names, ignore_string_literals)
+
+
+def _python_tokens(code: str, tokens: List[Token], ignore_comments: bool,
+                   ignore_variable_names: bool, ignore_string_literals: bool):
+    for tok in tokenize.generate_tokens(io.StringIO(code).readline):
+        kind = tok.type
+        if kind == tokenize.NAME:
+            text = tok.string
+            if ignore_variable_names and not keyword.iskeyword(text):
+                text = 'V'
+        elif kind == tokenize.STRING:
+            text = 'S' if ignore_string_literals else tok.string
+        elif kind == tokenize.COMMENT:
+            if ignore_comments:
+                continue
+            text = tok.string
+        elif kind in _FSTRING_TOKENS:
+            text = 'S' if ignore_string_literals else tok.string
+        elif kind in (tokenize.OP, tokenize.NUMBER) or (
+                kind == tokenize.ERRORTOKEN and not tok.string.isspace()):
+            text = tok.string
+        else:
+            # NEWLINE, NL, INDENT, DEDENT and ENDMARKER
+            continue
+        tokens.append((text, tok.start[0]))
+
+
+def _generic_tokens(code: str, language: str, ignore_comments: bool,
+                    ignore_variable_names: bool, ignore_string_literals: bool) -> List[Token]:
+    token_re = _HASH_TOKEN_RE if language in _HASH_COMMENT_LANGUAGES else _TOKEN_RE
+    keywords = _KEYWORDS.get(language, _KEYWORDS[None])
+    newlines = [m.start() for m in re.finditer('\n', code)]
+    tokens = []
+
+    for match in token_re.finditer(code):
+        group = match.lastgroup
+        text = match.group()
+
+        if group == 'comment':
+            if ignore_comments:
+                continue
+        elif group == 'string':
+            if ignore_string_literals:
+                text = 'S'
+        elif group == 'name':
+            if ignore_variable_names and text not in keywords:
+                text = 'V'
+
+        tokens.append((text, bisect_right(newlines, match.start()) + 1))
+
+    return tokens
+
+
+def kgram_hashes(tokens: List[Token], k: int = 5) -> Iterator[WinnowFingerprint]:
+    """
+    Rolling hash of every run of k consecutive tokens
+
+    Each token is hashed once and k-grams are combined with a Karp-Rabin
+    rolling hash, so the cost is linear in the number of tokens.
+    """
+    if k < 1:
+        raise ValueError(f"k must be at least 1, got {k}")
+    if len(tokens) < k:
+        return
+
+    token_hashes: Dict[str, int] = {}
+
+    def token_hash(text: str) -> int:
+        value = token_hashes.get(text)
+        if value is None:
+            digest = hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest()
+            value = token_hashes[text] = int.from_bytes(digest, 'big')
+        return value
+
+    hashes = [token_hash(text) for text, _ in tokens]
+    top = pow(_BASE, k - 1, 1 << 64)
+
+    value = 0
+    for h in hashes[:k]:
+        value = (value * _BASE + h) & _MASK
+    yield WinnowFingerprint(value, tokens[0][1], tokens[k - 1][1])
+
+    for i in range(1, len(tokens) - k + 1):
+        value = ((value - hashes[i - 1] * top) * _BASE + hashes[i + k - 1]) & _MASK
+        yield WinnowFingerprint(value, tokens[i][1], tokens[i + k - 1][1])
+
+
+def winnow(kgrams: Iterable[WinnowFingerprint], window: int = 4) -> List[WinnowFingerprint]:
+    """
+    Select the minimum hash of every window of consecutive k-grams
+
+    Ties pick the rightmost minimum, and a k-gram selected by several
+    overlapping windows is recorded once. A window of 1 keeps every k-gram.
+    """
+    if window < 1:
+        raise ValueError(f"window must be at least 1, got {window}")
+
+    selected: List[WinnowFingerprint] = []
+    candidates = deque()  # (position, k-gram) with increasing hashes
+    last = -1
+
+    for position, kgram in enumerate(kgrams):
+        while candidates and candidates[-1][1].hash >= kgram.hash:
+            candidates.pop()
+        candidates.append((position, kgram))
+        if candidates[0][0] <= position - window:
+            candidates.popleft()
+
+        if position >= window - 1 and candidates[0][0] != last:
+            last = candidates[0][0]
+            selected.append(candidates[0][1])
+
+    if last == -1 and candidates:
+        # Fewer k-grams than one window: keep the overall minimum
+        selected.append(candidates[0][1])
+
+    return selected
+
+
+class WinnowIndex:
+    """
+    Inverted index from winnowed k-gram hashes to their occurrences
+
+    Documents can be added and removed one at a time, so the index grows
+    incrementally as files are fingerprinted. Queries report every region
+    of an indexed document that shares at least ``min_shared`` distinct
+    hashes with the query.
+
+    Example:
+        fingerprinter = CodeFingerprint()
+        index = WinnowIndex()
+        index.add('a.py', fingerprinter.generate_winnow(code))
+        index.query(fingerprinter.generate_winnow(snippet, window=1))
+    """
+
+    def __init__(self, max_gap: int = 5):
+        """
+        Args:
+            max_gap: Matching lines further apart than this start a new region
+        """
+        self.max_gap = max_gap
+        self._postings: Dict[int, List[Tuple[str, int, int]]] = {}
+        self._documents: Dict[str, List[WinnowFingerprint]] = {}
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._documents
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._documents)
+
+    def add(self, doc_id: str, fingerprints: Iterable[WinnowFingerprint]):
+        """Index a document's fingerprints, replacing any earlier version"""
+        if doc_id in self._documents:
+            self.remove(doc_id)
+
+        fingerprints = list(fingerprints)
+        self._documents[doc_id] = fingerprints
+        for fp in fingerprints:
+            self._postings.setdefault(fp.hash, []).append((doc_id, fp.start_line, fp.end_line))
+
+    def remove(self, doc_id: str):
+        """
+        Drop a document from the index
+
+        Raises:
+            KeyError: If the document is not in the index
+        """
+        for fp in self._documents.pop(doc_id):
+            postings = self._postings.get(fp.hash)
+            if postings is None:
+                continue
+            postings[:] = [p for p in postings if p[0] != doc_id]
+            if not postings:
+                del self._postings[fp.hash]
+
+    def query(self, fingerprints: Iterable[WinnowFingerprint], min_shared: int = 3,
+              max_occurrences: Optional[int] = None,
+              exclude: Optional[str] = None) -> List[WinnowMatch]:
+        """
+        Find indexed regions sharing k-grams with a query
+
+        Query with every k-gram of the snippet (``window=1``) for the best
+        recall: indexed documents only keep winnowed hashes, and those are
+        always among the query's k-grams.
+
+        Args:
+            fingerprints: Fingerprints of the query code
+            min_shared: Minimum distinct shared hashes for a region to count
+            max_occurrences: Ignore hashes found more often than this
+                (boilerplate that appears everywhere)
+            exclude: Document to leave out, e.g. the query's own file
+
+        Returns:
+            Matches ordered by shared hash count, then file and line
+        """
+        hits: Dict[str, List[Tuple[int, int, int]]] = {}
+        for value in {fp.hash for fp in fingerprints}:
+            postings = self._postings.get(value)
+            if not postings:
+                continue
+            if max_occurrences is not None and len(postings) > max_occurrences:
+                continue
+            for doc_id, start, end in postings:
+                if doc_id != exclude:
+                    hits.setdefault(doc_id, []).append((start, end, value))
+
+        matches = []
+        for doc_id, occurrences in hits.items():
+            occurrences.sort()
+            start, end, shared = None, None, set()
+            for line, last, value in occurrences:
+                if start is not None and line > end + self.max_gap:
+                    if len(shared) >= min_shared:
+                        matches.append(WinnowMatch(FileLocation(doc_id, start, end), len(shared)))
+                    start, shared = None, set()
+                if start is None:
+                    start, end = line, last
+                end = max(end, last)
+                shared.add(value)
+            if start is not None and len(shared) >= min_shared:
+                matches.append(WinnowMatch(FileLocation(doc_id, start, end), len(shared)))
+
+        matches.sort(key=lambda m: (-m.shared, m.location.file, m.location.start_line))
+        return matches